@@ -0,0 +1,915 @@
+import json
+import lzma
+import os
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import Sequence
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from enum import IntEnum
+from heapq import merge
+from itertools import islice
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class TxType(IntEnum):
+    """Тип операции; в файлах хранится русским названием"""
+    DEPOSIT = 1
+    WITHDRAW = 2
+    TRANSFER = 3
+    # Начисления закрытия дня (eod.py)
+    INTEREST = 4
+    FEE = 5
+
+    @property
+    def label(self):
+        return TX_LABELS[self]
+
+    @classmethod
+    def from_label(cls, label):
+        return TX_TYPES[label]
+
+
+TX_LABELS = {
+    TxType.DEPOSIT: "пополнение",
+    TxType.WITHDRAW: "снятие",
+    TxType.TRANSFER: "перевод",
+    TxType.INTEREST: "проценты",
+    TxType.FEE: "комиссия",
+}
+TX_TYPES = {label: tx_type for tx_type, label in TX_LABELS.items()}
+
+
+def to_kopecks(value):
+    """Рубли (число из JSON) -> целые копейки"""
+    return int(round(value * 100))
+
+
+def to_rubles(kopecks):
+    """Копейки -> рубли для JSON"""
+    return kopecks / 100
+
+
+def add_rubles(balance, amount):
+    """Складываем суммы из JSON без накопления ошибки округления"""
+    return to_rubles(to_kopecks(balance) + to_kopecks(amount))
+
+
+def parse_amount(text):
+    """Сумма, введенная пользователем -> копейки; ValueError, если это не сумма"""
+    try:
+        value = Decimal(text.replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"Некорректная сумма: {text}")
+    if not value.is_finite():
+        raise ValueError(f"Некорректная сумма: {text}")
+    return int((value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_amount(kopecks, sign=False):
+    """Копейки -> строка вида 1000.00 (или +1000.00 при sign=True)"""
+    prefix = "-" if kopecks < 0 else ("+" if sign and kopecks > 0 else "")
+    rubles, kop = divmod(abs(kopecks), 100)
+    return f"{prefix}{rubles}.{kop:02d}"
+
+
+def parse_date(text):
+    """Дата из файла -> секунды от 1970 года (время без часового пояса)"""
+    return int((datetime.fromisoformat(text) - _EPOCH).total_seconds())
+
+
+def format_date(epoch):
+    return (_EPOCH + timedelta(seconds=epoch)).strftime(DATE_FORMAT)
+
+
+def parse_date_bound(text, end=False):
+    """Граница периода, введенная пользователем -> секунды от 1970 года.
+
+    Дата без времени в конце периода (end=True) включает весь день.
+    """
+    epoch = parse_date(text.strip())
+    if end and len(text.strip()) <= len("2000-01-01"):
+        epoch += 24 * 60 * 60 - 1
+    return epoch
+
+
+# Описания переводов; по ним находим второго участника перевода
+TRANSFER_TO = "Перевод пользователю "
+TRANSFER_FROM = "Перевод от пользователя "
+
+
+def counterparty(description):
+    """Email второго участника перевода из описания (или None)"""
+    for prefix in (TRANSFER_TO, TRANSFER_FROM):
+        if description.startswith(prefix):
+            return description[len(prefix):]
+    return None
+
+
+_descriptions = {}
+
+
+def intern_description(text):
+    """Одинаковые описания (переводы одному адресату) хранятся одной строкой"""
+    return _descriptions.setdefault(text, text) if text else ""
+
+
+class History(Sequence):
+    """История операций аккаунта в колоночном виде.
+
+    Каждая колонка - массив ``array``: время, тип и сумма занимают 17 байт на
+    операцию вместо словаря с четырьмя строковыми ключами. Наружу операции
+    отдаются в формате users.json, как словари.
+    """
+
+    __slots__ = ("dates", "types", "amounts", "descriptions", "index")
+
+    def __init__(self):
+        self.dates = array("q")
+        self.types = array("b")
+        self.amounts = array("q")
+        self.descriptions = []
+        # Индексы для фильтров строятся при первом запросе
+        self.index = None
+
+    @classmethod
+    def from_json(cls, transactions):
+        history = cls()
+        for tx in transactions:
+            history.append(tx)
+        return history
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def tx(self, i):
+        """Операция с номером i в формате users.json"""
+        return {
+            "дата": format_date(self.dates[i]),
+            "тип": TX_LABELS[self.types[i]],
+            "сумма": to_rubles(self.amounts[i]),
+            "описание": self.descriptions[i]
+        }
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.tx(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.tx(index)
+
+    def __iter__(self):
+        return (self.tx(i) for i in range(len(self)))
+
+    def __reversed__(self):
+        return (self.tx(i) for i in range(len(self) - 1, -1, -1))
+
+    def append(self, tx):
+        """Добавляем операцию в формате users.json"""
+        self.append_raw(parse_date(tx["дата"]), TX_TYPES[tx["тип"]], to_kopecks(tx["сумма"]), tx.get("описание", ""))
+
+    def append_raw(self, date, tx_type, amount, description=""):
+        self.dates.append(date)
+        self.types.append(tx_type)
+        self.amounts.append(amount)
+        self.descriptions.append(intern_description(description))
+        if self.index is not None:
+            self.index.add(self, len(self.amounts) - 1)
+
+    def filter(self, query):
+        """Номера операций, подходящих под HistoryQuery, по возрастанию"""
+        if self.index is None:
+            self.index = HistoryIndex(self)
+        return self.index.search(self, query)
+
+    def select(self, query):
+        """Отобранные операции как последовательность (для таблицы истории)"""
+        return HistorySelection(self, self.filter(query))
+
+    def scan(self, query):
+        """Потоковый отбор для выгрузки: (всего операций, пары (пройдено, операция)).
+
+        Индексы здесь не строятся и не меняются, используются только уже
+        построенные, поэтому читать можно из фонового потока, пока поток
+        интерфейса дописывает историю. Операции, добавленные после начала
+        выгрузки, в нее не попадают.
+        """
+        total = len(self)
+        return total, self._scan(query, total)
+
+    def _scan(self, query, stop):
+        index = self.index
+        if index is not None and query.counterparty is not None:
+            candidates = index.by_counterparty.get(query.counterparty, ())
+        elif index is not None and query.types is not None:
+            candidates = merge(*[index.by_type.get(tx_type, ()) for tx_type in query.types])
+        else:
+            candidates = range(stop)
+        for i in candidates:
+            if i >= stop:
+                break
+            if query.matches(self, i):
+                yield i + 1, self.tx(i)
+
+    def rows(self, start=0):
+        """Операции с номера start кортежами (время, тип, сумма в копейках, описание)"""
+        return zip(
+            islice(self.dates, start, None),
+            islice(self.types, start, None),
+            islice(self.amounts, start, None),
+            islice(self.descriptions, start, None)
+        )
+
+    def drop(self, count):
+        """Новая история без первых count операций (они ушли в архив)"""
+        history = History()
+        history.dates = self.dates[count:]
+        history.types = self.types[count:]
+        history.amounts = self.amounts[count:]
+        history.descriptions = self.descriptions[count:]
+        return history
+
+    def nbytes(self):
+        """Примерный объем памяти истории"""
+        size = len(self) * (17 + 8)
+        if self.index is not None:
+            size += self.index.nbytes()
+        return size
+
+
+class HistoryQuery:
+    """Условия фильтра истории; None - условие не задано.
+
+    Даты - секунды от 1970 года, границы включаются. Суммы - в копейках и
+    сравниваются по модулю: "от 100 до 500" находит и пополнения, и списания.
+    """
+
+    __slots__ = ("date_from", "date_to", "types", "amount_min", "amount_max", "counterparty")
+
+    def __init__(self, date_from=None, date_to=None, types=None, amount_min=None, amount_max=None,
+                 counterparty=None):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.types = frozenset(types) if types else None
+        self.amount_min = amount_min
+        self.amount_max = amount_max
+        self.counterparty = counterparty.strip().lower() if counterparty else None
+
+    def is_empty(self):
+        return all(getattr(self, name) is None for name in self.__slots__)
+
+    def matches(self, history, i):
+        """Проверка одной операции по колонкам истории"""
+        date = history.dates[i]
+        if self.date_from is not None and date < self.date_from:
+            return False
+        if self.date_to is not None and date > self.date_to:
+            return False
+        if self.types is not None and history.types[i] not in self.types:
+            return False
+        amount = abs(history.amounts[i])
+        if self.amount_min is not None and amount < self.amount_min:
+            return False
+        if self.amount_max is not None and amount > self.amount_max:
+            return False
+        if self.counterparty is not None:
+            other = counterparty(history.descriptions[i])
+            if other is None or other.lower() != self.counterparty:
+                return False
+        return True
+
+    def to_json(self):
+        data = {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+        if "types" in data:
+            data["types"] = sorted(int(t) for t in data["types"])
+        return data
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(**{name: data.get(name) for name in cls.__slots__})
+
+
+class HistoryIndex:
+    """Индексы истории одного аккаунта: по дате, по типу и по второму участнику.
+
+    - по дате: операции обычно добавляются по времени, тогда сами номера уже
+      упорядочены и ищутся двоичным поиском по колонке дат; отдельный
+      порядок ``order`` (и параллельная ему колонка дат ``order_dates`` для
+      двоичного поиска) заводится, только если встретилась более ранняя дата;
+    - по типу: номера операций каждого типа;
+    - по второму участнику: email из описания перевода -> номера операций.
+
+    Запрос начинается с самого узкого из заданных индексов, остальные
+    условия проверяются только на его кандидатах, поэтому стоимость растет с
+    числом подходящих операций, а не с длиной истории.
+    """
+
+    __slots__ = ("order", "order_dates", "by_type", "by_counterparty")
+
+    def __init__(self, history):
+        self.order = None
+        self.order_dates = None
+        self.by_type = {}
+        self.by_counterparty = {}
+        for i in range(len(history)):
+            self.add(history, i)
+
+    def add(self, history, i):
+        """Учитываем операцию с номером i (вызывается при каждом добавлении)"""
+        dates = history.dates
+        if self.order is not None:
+            position = bisect_right(self.order_dates, dates[i])
+            self.order.insert(position, i)
+            self.order_dates.insert(position, dates[i])
+        elif i and dates[i] < dates[i - 1]:
+            self.order = array("i", sorted(range(i + 1), key=dates.__getitem__))
+            self.order_dates = array("q", (dates[j] for j in self.order))
+        self.by_type.setdefault(history.types[i], array("i")).append(i)
+        other = counterparty(history.descriptions[i])
+        if other is not None:
+            self.by_counterparty.setdefault(other.lower(), array("i")).append(i)
+
+    def _by_date(self, history, query):
+        """Кандидаты по диапазону дат: (число, итератор номеров)"""
+        low = query.date_from if query.date_from is not None else -2 ** 63
+        high = query.date_to if query.date_to is not None else 2 ** 63 - 1
+        if self.order is None:
+            start = bisect_left(history.dates, low)
+            stop = bisect_right(history.dates, high)
+            return stop - start, range(start, stop)
+        start = bisect_left(self.order_dates, low)
+        stop = bisect_right(self.order_dates, high)
+        return stop - start, sorted(self.order[start:stop])
+
+    def _by_type(self, query):
+        buckets = [self.by_type.get(tx_type, ()) for tx_type in query.types]
+        return sum(len(bucket) for bucket in buckets), merge(*buckets)
+
+    def search(self, history, query):
+        candidates = []
+        if query.date_from is not None or query.date_to is not None:
+            candidates.append(self._by_date(history, query))
+        if query.types is not None:
+            candidates.append(self._by_type(query))
+        if query.counterparty is not None:
+            positions = self.by_counterparty.get(query.counterparty, ())
+            candidates.append((len(positions), positions))
+        if not candidates:
+            candidates.append((len(history), range(len(history))))
+        _, positions = min(candidates, key=lambda candidate: candidate[0])
+        return [i for i in positions if query.matches(history, i)]
+
+    def nbytes(self):
+        size = sum(len(bucket) for bucket in self.by_type.values()) * 4
+        size += sum(len(bucket) for bucket in self.by_counterparty.values()) * 4
+        if self.order is not None:
+            size += len(self.order) * 4 + len(self.order_dates) * 8
+        return size
+
+
+class HistorySelection(Sequence):
+    """Отобранные фильтром операции истории как последовательность"""
+
+    def __init__(self, history, positions):
+        self.history = history
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.history[i] for i in self.positions[index]]
+        return self.history[self.positions[index]]
+
+
+# Колонки оборотов за период: суммы (в копейках, по модулю) и число операций,
+# затем наименьший и наибольший остаток после операций периода
+TURNOVER_FIELDS = (
+    "пополнения", "пополнений",
+    "снятия", "снятий",
+    "входящие", "входящих",
+    "исходящие", "исходящих",
+    "мин_остаток", "макс_остаток",
+)
+MIN_BALANCE = 8
+MAX_BALANCE = 9
+
+
+_periods = {}
+
+
+def period_of(epoch):
+    """Отчетный период операции - месяц вида 2024-05"""
+    # Дней в истории немного, поэтому месяц дня запоминаем
+    day = epoch // 86400
+    period = _periods.get(day)
+    if period is None:
+        period = _periods[day] = (_EPOCH + timedelta(days=day)).strftime("%Y-%m")
+    return period
+
+
+def turnover_slot(tx_type, amount):
+    """Колонка суммы в TURNOVER_FIELDS для операции; следующая колонка - число операций.
+
+    Проценты учитываются как пополнения, комиссии - как снятия.
+    """
+    if tx_type in (TxType.DEPOSIT, TxType.INTEREST):
+        return 0
+    if tx_type in (TxType.WITHDRAW, TxType.FEE):
+        return 2
+    return 4 if amount > 0 else 6
+
+
+class Turnover:
+    """Обороты счета по месяцам, которые ведутся по мере проведения операций.
+
+    Каждая операция обновляет одну строку периода за O(1), поэтому выписка
+    не пересматривает историю. Обороты хранятся вместе с аккаунтом (ключ
+    "обороты" в users.json) и помнят, сколько операций в них учтено:
+    недостающие операции при загрузке досчитываются из истории.
+    """
+
+    __slots__ = ("periods", "count", "balance")
+
+    def __init__(self, periods=None, count=0, balance=0):
+        self.periods = periods if periods is not None else {}
+        # Сколько операций учтено и остаток после последней из них (в копейках)
+        self.count = count
+        self.balance = balance
+
+    def add(self, date, tx_type, amount):
+        self.balance += amount
+        self.count += 1
+        period = period_of(date)
+        totals = self.periods.get(period)
+        if totals is None:
+            totals = self.periods[period] = [0] * 8 + [self.balance, self.balance]
+        slot = turnover_slot(tx_type, amount)
+        totals[slot] += abs(amount)
+        totals[slot + 1] += 1
+        if self.balance < totals[MIN_BALANCE]:
+            totals[MIN_BALANCE] = self.balance
+        if self.balance > totals[MAX_BALANCE]:
+            totals[MAX_BALANCE] = self.balance
+
+    def add_tx(self, tx):
+        """Учитываем операцию в формате users.json"""
+        self.add(parse_date(tx["дата"]), TX_TYPES[tx["тип"]], to_kopecks(tx["сумма"]))
+
+    def summary(self, period):
+        """Обороты периода: словарь с полями TURNOVER_FIELDS, приходом и расходом"""
+        totals = self.periods.get(period)
+        if totals is None:
+            return None
+        summary = dict(zip(TURNOVER_FIELDS, totals))
+        summary["приход"] = summary["пополнения"] + summary["входящие"]
+        summary["расход"] = summary["снятия"] + summary["исходящие"]
+        return summary
+
+    def copy(self):
+        return Turnover({period: list(totals) for period, totals in self.periods.items()}, self.count, self.balance)
+
+    def to_json(self):
+        return {"операций": self.count, "остаток": self.balance, "периоды": self.periods}
+
+    @classmethod
+    def from_json(cls, data):
+        # Строки периодов не копируем: обороты в словаре пользователя правятся на месте
+        return cls(data["периоды"], data["операций"], data["остаток"])
+
+    @classmethod
+    def for_user(cls, user):
+        """Обороты пользователя users.json с досчитанными недостающими операциями"""
+        transactions = user["транзакции"]
+        data = user.get("обороты")
+        if data is None:
+            # Остаток до первой операции
+            opening = to_kopecks(user["баланс"]) - sum(to_kopecks(tx["сумма"]) for tx in transactions)
+            turnover = cls(balance=opening)
+        else:
+            turnover = cls.from_json(data)
+        # Операции из архива в оборотах уже учтены (архив пишется после них)
+        for tx in transactions[turnover.count - archived_count(user):]:
+            turnover.add_tx(tx)
+        return turnover
+
+    @classmethod
+    def build(cls, history, balance):
+        """Обороты по истории в колоночном виде и текущему балансу"""
+        turnover = cls(balance=balance - sum(history.amounts))
+        for i in range(len(history)):
+            turnover.add(history.dates[i], history.types[i], history.amounts[i])
+        return turnover
+
+    def nbytes(self):
+        return len(self.periods) * 200
+
+
+# Номера недавних операций на счет: операция с известным номером не проводится
+# повторно. Храним не больше RECENT_OPERATIONS номеров не старше RECENT_SECONDS
+RECENT_OPERATIONS = 64
+RECENT_SECONDS = 7 * 86400
+
+
+def remember_operation(recent, op_id, date):
+    """Добавляем номер операции в словарь недавних (номер -> время) и вытесняем старые.
+
+    Вытесняем по времени самой операции, а не по часам, поэтому повтор
+    журнала дает тот же словарь, что был в памяти.
+    """
+    recent[op_id] = date
+    while len(recent) > RECENT_OPERATIONS or next(iter(recent.values())) < date - RECENT_SECONDS:
+        del recent[next(iter(recent))]
+
+
+def fresh_entries(entries, known):
+    """Проводки записи журнала без уже проведенных операций.
+
+    Проводки с одним номером (стороны перевода) - одна операция: если номер
+    известен хотя бы одному ее счету (``known(email, номер)``), пропускаются
+    все ее проводки. Иначе номер, вытесненный у отправителя, но еще
+    записанный у получателя, списал бы деньги без зачисления.
+    """
+    known_ids = {entry["id"] for entry in entries if "id" in entry and known(entry["email"], entry["id"])}
+    if not known_ids:
+        return entries
+    return [entry for entry in entries if entry.get("id") not in known_ids]
+
+
+def archived_count(user):
+    """Сколько операций пользователя users.json ушло в архив"""
+    return user["архив"]["операций"] if "архив" in user else 0
+
+
+def post_json(user, tx, op_id=None):
+    """Проводим операцию в пользователе формата users.json: баланс, история, обороты.
+
+    Если номер op_id уже есть среди недавних, операция пропускается.
+    """
+    if op_id is not None:
+        if op_id in user.get("проведено", ()):
+            return False
+        # Словарь заменяем, а не правим: его может разделять копия пользователя
+        recent = dict(user.get("проведено", ()))
+        remember_operation(recent, op_id, parse_date(tx["дата"]))
+        user["проведено"] = recent
+    data = user.get("обороты")
+    current = data is not None and data["операций"] == archived_count(user) + len(user["транзакции"])
+    user["баланс"] = add_rubles(user["баланс"], tx["сумма"])
+    user["транзакции"].append(tx)
+    if current:
+        # Обороты учитывают всю историю: добавляем одну операцию за O(1)
+        turnover = Turnover.from_json(data)
+        turnover.add_tx(tx)
+    else:
+        turnover = Turnover.for_user(user)
+    user["обороты"] = turnover.to_json()
+    return True
+
+
+# Архив истории: старые операции лежат в сжатых сегментах "по месяцам"
+ARCHIVE_CODECS = {
+    "zlib": (".z", zlib.compress, zlib.decompress),
+    "lzma": (".xz", lzma.compress, lzma.decompress),
+}
+
+
+def segment_path(checkpoint, index):
+    """Файл сегмента index из отметки архива"""
+    period = checkpoint["сегменты"][index][0]
+    ext = ARCHIVE_CODECS[checkpoint["сжатие"]][0]
+    return os.path.join(checkpoint["каталог"], f"{index:04d}-{period}{ext}")
+
+
+def write_segment(path, codec, transactions):
+    """Пишем сегмент (операции в формате users.json) атомарно"""
+    data = ARCHIVE_CODECS[codec][1](json.dumps(transactions, ensure_ascii=False).encode("utf-8"))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_segment(checkpoint, index):
+    with open(segment_path(checkpoint, index), 'rb') as f:
+        data = f.read()
+    return History.from_json(json.loads(ARCHIVE_CODECS[checkpoint["сжатие"]][2](data)))
+
+
+def archive_json(user, checkpoint):
+    """Применяем отметку архива к пользователю формата users.json.
+
+    Отметка описывает все сегменты аккаунта и остаток после последней
+    архивной операции; из горячего списка уходят операции, которые попали
+    в архив с прошлой отметки.
+    """
+    # Обороты фиксируем до того, как операции уйдут из списка
+    user["обороты"] = Turnover.for_user(user).to_json()
+    del user["транзакции"][:checkpoint["операций"] - archived_count(user)]
+    user["архив"] = checkpoint
+
+
+def checkpoint_json(user, checkpoint):
+    """Добавляем контрольную точку баланса пользователю формата users.json"""
+    user["контроль"] = [*user.get("контроль", ()), checkpoint]
+
+
+def period_bounds(period):
+    """Первая и последняя секунда месяца 2024-05"""
+    year, month = int(period[:4]), int(period[5:7])
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return int((start - _EPOCH).total_seconds()), int((end - _EPOCH).total_seconds()) - 1
+
+
+def history_from_json(user):
+    """История пользователя users.json: горячие операции плюс архив, если он есть"""
+    history = History.from_json(user["транзакции"])
+    if "архив" in user:
+        return ArchivedHistory(user["архив"], history)
+    return history
+
+
+class ArchivedHistory(Sequence):
+    """История, старые операции которой вынесены в сжатые сегменты.
+
+    Горячая часть - обычная History; номера операций сквозные, архивные идут
+    первыми. Сегмент читается с диска, только когда к нему обращаются:
+    прокрутка к старым операциям или фильтр, период которого его задевает.
+    Последние прочитанные сегменты держатся в памяти.
+    """
+
+    cached_segments = 8
+
+    def __init__(self, checkpoint, hot):
+        self.checkpoint = checkpoint
+        self.hot = hot
+        self._cache = OrderedDict()
+        self._index()
+
+    def _index(self):
+        self.starts = []
+        start = 0
+        for _, count in self.checkpoint["сегменты"]:
+            self.starts.append(start)
+            start += count
+        self.archived = start
+
+    def __len__(self):
+        return self.archived + len(self.hot)
+
+    def segment(self, index):
+        history = self._cache.get(index)
+        if history is None:
+            history = read_segment(self.checkpoint, index)
+            self._cache[index] = history
+            if len(self._cache) > self.cached_segments:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(index)
+        return history
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            rows = []
+            segment = bisect_right(self.starts, start) - 1
+            while start < min(stop, self.archived):
+                first = self.starts[segment]
+                rows.extend(self.segment(segment)[start - first:stop - first])
+                segment += 1
+                start = first + self.checkpoint["сегменты"][segment - 1][1]
+            if stop > self.archived:
+                rows.extend(self.hot[max(start - self.archived, 0):stop - self.archived])
+            return rows
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        if index >= self.archived:
+            return self.hot[index - self.archived]
+        segment = bisect_right(self.starts, index) - 1
+        return self.segment(segment)[index - self.starts[segment]]
+
+    def __iter__(self):
+        for segment in range(len(self.starts)):
+            yield from self.segment(segment)
+        yield from self.hot
+
+    def __reversed__(self):
+        yield from reversed(self.hot)
+        for segment in range(len(self.starts) - 1, -1, -1):
+            yield from reversed(self.segment(segment))
+
+    def append(self, tx):
+        self.hot.append(tx)
+
+    def rows(self, start=0):
+        """Операции с номера start кортежами, как History.rows; сегменты читаются мимо кеша"""
+        for segment, first in enumerate(self.starts):
+            count = self.checkpoint["сегменты"][segment][1]
+            if start < first + count:
+                yield from read_segment(self.checkpoint, segment).rows(max(start - first, 0))
+        yield from self.hot.rows(max(start - self.archived, 0))
+
+    def append_raw(self, date, tx_type, amount, description=""):
+        self.hot.append_raw(date, tx_type, amount, description)
+
+    def _segments_for(self, query):
+        """Сегменты, месяц которых пересекается с периодом запроса"""
+        for segment, (period, _) in enumerate(self.checkpoint["сегменты"]):
+            first, last = period_bounds(period)
+            if query.date_from is not None and last < query.date_from:
+                continue
+            if query.date_to is not None and first > query.date_to:
+                continue
+            yield segment
+
+    def filter(self, query):
+        positions = []
+        for segment in self._segments_for(query):
+            first = self.starts[segment]
+            positions.extend(first + i for i in self.segment(segment).filter(query))
+        positions.extend(self.archived + i for i in self.hot.filter(query))
+        return positions
+
+    def select(self, query):
+        return HistorySelection(self, self.filter(query))
+
+    def scan(self, query):
+        """Потоковый отбор для выгрузки, как History.scan.
+
+        Сегменты читаются мимо общего кеша, поэтому годится для фонового потока.
+        """
+        total = len(self)
+        return total, self._scan(query, total)
+
+    def _scan(self, query, total):
+        for segment in list(self._segments_for(query)):
+            first = self.starts[segment]
+            _, rows = read_segment(self.checkpoint, segment).scan(query)
+            for done, tx in rows:
+                yield first + done, tx
+        _, rows = self.hot.scan(query)
+        for done, tx in rows:
+            if self.archived + done > total:
+                break
+            yield self.archived + done, tx
+
+    def archive(self, checkpoint):
+        """Новая отметка архива: первые операции горячей части ушли в сегменты"""
+        moved = checkpoint["операций"] - self.archived
+        self.hot = self.hot.drop(moved)
+        self.checkpoint = checkpoint
+        self._cache.clear()
+        self._index()
+
+    def nbytes(self):
+        return self.hot.nbytes() + sum(history.nbytes() for history in self._cache.values())
+
+
+# Поля users.json, которые можно менять записью update
+ACCOUNT_FIELDS = {
+    "имя": "name",
+    "фамилия": "surname",
+    "телефон": "phone",
+    "пароль": "password",
+    "активен": "active",
+}
+
+
+class Account:
+    """Аккаунт клиента; баланс хранится в копейках.
+
+    ``version`` растет при каждом изменении аккаунта в памяти. Номер не
+    сохраняется: он нужен, чтобы заметить, что аккаунт изменился между
+    проверкой операции и ее записью.
+    """
+
+    __slots__ = (
+        "name", "surname", "phone", "password", "balance", "active", "history", "turnover", "checkpoints",
+        "operations", "version"
+    )
+
+    def __init__(self, name, surname, phone, password, balance, active=True, history=None, turnover=None,
+                 checkpoints=(), operations=None):
+        self.name = name
+        self.surname = surname
+        self.phone = phone
+        self.password = password
+        self.balance = balance
+        self.active = active
+        self.history = history if history is not None else History()
+        if turnover is None:
+            turnover = Turnover.build(self.history, balance)
+        self.turnover = turnover
+        # Контрольные точки баланса (reconcile.py); кортеж, чтобы пустой не занимал памяти
+        self.checkpoints = tuple(checkpoints)
+        # Недавние номера операций (номер -> время); None, пока их нет
+        self.operations = dict(operations) if operations else None
+        self.version = 0
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            name=data["имя"],
+            surname=data["фамилия"],
+            phone=data["телефон"],
+            password=data["пароль"],
+            balance=to_kopecks(data["баланс"]),
+            active=data["активен"],
+            history=history_from_json(data),
+            # Без сохраненных оборотов их посчитает __init__ по колонкам истории;
+            # сохраненные копируем: словарь data может остаться у хранилища
+            turnover=Turnover.for_user(data).copy() if "обороты" in data else None,
+            checkpoints=data.get("контроль", ()),
+            operations=data.get("проведено")
+        )
+
+    def to_json(self):
+        archived = isinstance(self.history, ArchivedHistory)
+        data = {
+            "имя": self.name,
+            "фамилия": self.surname,
+            "телефон": self.phone,
+            "пароль": self.password,
+            "баланс": to_rubles(self.balance),
+            # Архивные операции остаются в сегментах
+            "транзакции": list(self.history.hot if archived else self.history),
+            "активен": self.active,
+            "обороты": self.turnover.to_json()
+        }
+        if archived:
+            data["архив"] = self.history.checkpoint
+        if self.checkpoints:
+            data["контроль"] = list(self.checkpoints)
+        if self.operations:
+            data["проведено"] = dict(self.operations)
+        return data
+
+    def update_json(self, fields):
+        """Меняем поля, заданные в формате users.json"""
+        for key, value in fields.items():
+            setattr(self, ACCOUNT_FIELDS[key], value)
+        self.version += 1
+
+    def has_operation(self, op_id):
+        """Операция с номером op_id уже проведена по счету (среди недавних)"""
+        return self.operations is not None and op_id in self.operations
+
+    def post(self, tx, op_id=None):
+        """Проводим операцию в формате users.json: баланс меняется на ее сумму.
+
+        Повтор операции с уже известным номером op_id пропускается (False).
+        """
+        if op_id is not None:
+            if self.has_operation(op_id):
+                return False
+            if self.operations is None:
+                self.operations = {}
+            remember_operation(self.operations, op_id, parse_date(tx["дата"]))
+        amount = to_kopecks(tx["сумма"])
+        self.balance += amount
+        self.history.append(tx)
+        self.turnover.add(parse_date(tx["дата"]), TX_TYPES[tx["тип"]], amount)
+        self.version += 1
+        return True
+
+    def archive(self, checkpoint):
+        """Первые операции истории перенесены в архив (запись журнала archive)"""
+        if isinstance(self.history, ArchivedHistory):
+            self.history.archive(checkpoint)
+        else:
+            self.history = ArchivedHistory(checkpoint, self.history.drop(checkpoint["операций"]))
+        self.version += 1
+
+    def seal(self, checkpoint):
+        """Новая контрольная точка баланса (запись журнала checkpoint)"""
+        self.checkpoints += (checkpoint,)
+        self.version += 1
+
+    def nbytes(self):
+        return 200 + self.history.nbytes() + self.turnover.nbytes()
+
+
+def make_transaction(tx_type, amount, description="", date=None):
+    """Операция в формате users.json; сумма в копейках"""
+    return {
+        "дата": date or datetime.now().strftime(DATE_FORMAT),
+        "тип": tx_type.label,
+        "сумма": to_rubles(amount),
+        "описание": description
+    }
+
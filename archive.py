@@ -0,0 +1,131 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from accounts import (ARCHIVE_CODECS, ArchivedHistory, parse_date, period_of, segment_path, to_rubles,
+                      write_segment)
+from storage import STORAGE_MODES, make_storage, tool_lock
+
+
+def archive_cutoff(months, now=None):
+    """Начало месяца, который был months месяцев назад: все, что раньше, уходит в архив"""
+    now = now or datetime.now()
+    month = now.year * 12 + now.month - 1 - months
+    return parse_date(f"{month // 12:04d}-{month % 12 + 1:02d}-01")
+
+
+def account_directory(root, email):
+    """Каталог сегментов аккаунта; имя - хеш email, чтобы не зависеть от его символов"""
+    return os.path.join(root, hashlib.sha1(email.encode("utf-8")).hexdigest()[:20])
+
+
+def plan_account(email, account, cutoff, root, codec):
+    """Режем горячую историю аккаунта на месячные сегменты старше cutoff.
+
+    Пишем файлы сегментов и возвращаем запись журнала archive (или None,
+    если архивировать нечего). Архивируется только начало истории, поэтому
+    сквозные номера операций не меняются.
+    """
+    history = account.history
+    if isinstance(history, ArchivedHistory):
+        checkpoint, hot = history.checkpoint, history.hot
+    else:
+        checkpoint, hot = None, history
+    count = 0
+    while count < len(hot) and hot.dates[count] < cutoff:
+        count += 1
+    if not count:
+        return None, 0
+
+    if checkpoint is None:
+        checkpoint = {
+            "каталог": account_directory(root, email),
+            # Кодек выбирается один раз на аккаунт: по нему строятся имена файлов
+            "сжатие": codec,
+            "операций": 0,
+            "остаток": 0,
+            "сегменты": []
+        }
+    segments = list(checkpoint["сегменты"])
+    new = {**checkpoint, "сегменты": segments}
+    os.makedirs(new["каталог"], exist_ok=True)
+
+    written = 0
+    first = 0
+    while first < count:
+        period = period_of(hot.dates[first])
+        last = first
+        while last < count and period_of(hot.dates[last]) == period:
+            last += 1
+        segments.append([period, last - first])
+        path = segment_path(new, len(segments) - 1)
+        write_segment(path, new["сжатие"], hot[first:last])
+        written += os.path.getsize(path)
+        first = last
+
+    new["операций"] = checkpoint["операций"] + count
+    # Остаток после последней архивной операции - с него продолжается горячая история
+    new["остаток"] = to_rubles(account.balance - sum(hot.amounts[count:]))
+    return {"op": "archive", "email": email, "archive": new}, written
+
+
+def run_archive(storage, root, months, codec="zlib"):
+    """Переносим в архив операции старше months месяцев; одна запись журнала на аккаунт"""
+    report = {"аккаунтов": 0, "операций": 0, "сегментов_байт": 0}
+    started = time.perf_counter()
+    users = storage.load()
+    cutoff = archive_cutoff(months)
+    size_before = storage.disk_size()
+
+    records = []
+    for email in list(users.keys()):
+        record, written = plan_account(email, users[email], cutoff, root, codec)
+        if record is None:
+            continue
+        records.append(record)
+        report["аккаунтов"] += 1
+        report["операций"] += record["archive"]["операций"] - _archived(users[email])
+        report["сегментов_байт"] += written
+
+    if records:
+        storage.commit(records)
+        # Сворачиваем журнал сразу, чтобы основной файл уменьшился
+        if hasattr(storage, "compact"):
+            storage.compact()
+    report["до_байт"] = size_before
+    report["после_байт"] = storage.disk_size()
+    report["секунд"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def _archived(account):
+    history = account.history
+    return history.archived if isinstance(history, ArchivedHistory) else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Перенос старых операций в сжатый архив по месяцам")
+    parser.add_argument("--users", default="users.json", help="файл пользователей")
+    parser.add_argument("--storage", choices=[mode for mode in STORAGE_MODES if mode != "sqlite"],
+                        default="journal", help="режим хранения данных")
+    parser.add_argument("--months", type=int, default=6, help="сколько последних месяцев оставить в основном файле")
+    parser.add_argument("--codec", choices=sorted(ARCHIVE_CODECS), default="zlib", help="сжатие сегментов")
+    parser.add_argument("--archive-dir", help="каталог архива (по умолчанию - рядом с файлом пользователей)")
+    args = parser.parse_args(argv)
+
+    storage = make_storage(args.storage, args.users)
+    try:
+        with tool_lock(storage):
+            report = run_archive(storage, args.archive_dir or args.users + ".archive", args.months, args.codec)
+    finally:
+        storage.close()
+    print(json.dumps(report, ensure_ascii=False, indent=4))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,41 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import json
-import hashlib
-import os
+from tkinter import filedialog, messagebox, ttk
+import argparse
+import time
 from datetime import datetime
 
+from accounts import TURNOVER_FIELDS, format_amount, parse_amount
+from cache import AccountCache
+from client import LedgerClient, RemoteAccounts, RemoteLedger, RemoteRecipients
+from export import ExportJob, account_rows
+from history_view import HistoryFilterBar, HistoryPager, VirtualHistoryView
+from ledger import MAX_RETRIES, Ledger, LedgerError, RetriesExhausted, new_operation_id, retry_delay
+from metrics import METRICS, MetricsExporter
+from passwords import HashingService, needs_upgrade
+from persistence import FSYNC_POLICIES, UiDispatcher, WriteBehind
+from recipients import PrefixIndex
+from screens import ScreenManager
+from storage import (DEFAULT_SHARDS, STORAGE_MODES, SharedJournalStorage, ShardedStorage, apply_record,
+                     make_storage, record_emails)
+
 class BankApp:
-    def __init__(self):
+    def __init__(self, storage_mode="journal", flush_interval=0.05, fsync="periodic", cache_mb=64,
+                 kdf_target_ms=250, kdf_iterations=None, metrics_file=None, metrics_format="prom",
+                 metrics_interval=10.0, diagnostics=False, shards=DEFAULT_SHARDS, refresh_interval=2.0):
         self.users_file = "users.json"
+        self.storage_mode = storage_mode
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.cache_mb = cache_mb
+        self.kdf_target_ms = kdf_target_ms
+        self.kdf_iterations = kdf_iterations
+        self.shards = shards
+        self.refresh_ms = int(refresh_interval * 1000)
+        # Метрики включаются только по запросу, иначе замеры почти ничего не стоят
+        self.diagnostics = diagnostics
+        METRICS.enabled = bool(metrics_file) or diagnostics
         self.current_user = None
-        self.load_users()
+        self.open_backend()
         
         # Стиль для приложения
         self.bg_color = "#f0f0f0"
@@ -20,40 +46,227 @@ class BankApp:
         # Создаем главное окно
         self.root = tk.Tk()
         self.root.title("Банк Онлайн")
-        self.root.geometry("400x500")
+        self.root.geometry("460x680")
         self.root.configure(bg=self.bg_color)
         
+        # Результаты фоновых потоков возвращаются в поток Tk через root.after
+        self.dispatcher = UiDispatcher(self.root)
+        # Окна создаются один раз и потом только показываются заново
+        self.screens = ScreenManager(self.root)
+        self.register_screens()
+        self.bank_view = None
+        # Виджеты Tk можно обходить только из потока окна, а метрики выгружает
+        # другой поток, поэтому число виджетов снимаем здесь по таймеру
+        self.widgets_ms = int((1.0 if diagnostics else metrics_interval) * 1000)
+        if METRICS.enabled:
+            self.sample_widgets()
+        self.start_workers()
+        self.exporter = None
+        if metrics_file:
+            self.exporter = MetricsExporter(metrics_file, metrics_format, metrics_interval)
+        
         # Показываем окно регистрации
         self.show_registration_window()
-        
+    
+    def open_backend(self):
+        """Открываем хранилище и загружаем пользователей"""
+        self.storage = make_storage(
+            self.storage_mode,
+            self.users_file,
+            cache_bytes=self.cache_mb * 1024 * 1024,
+            shards=self.shards
+        )
+        # В режиме shared с теми же файлами работают другие экземпляры приложения
+        self.shared = isinstance(self.storage, SharedJournalStorage)
+        self.load_users()
+        exclusive = (lambda: self.storage.exclusive(self.users)) if self.shared else None
+        self.ledger = Ledger(self.users, self.commit_records, exclusive)
+    
+    def start_workers(self):
+        """Запускаем фоновую запись и хеширование паролей"""
+        # Сохранение идет в фоновом потоке
+        self.writer = WriteBehind(
+            self.storage,
+            flush_interval=self.flush_interval,
+            fsync=self.fsync,
+            notify=self.dispatcher.post
+        )
+        # Число шардов изменилось: перекладываем аккаунты в потоке записи,
+        # окно при этом работает, операции ждут в очереди
+        if isinstance(self.storage, ShardedStorage) and self.storage.count != self.shards:
+            shards = self.shards
+            self.writer.call(lambda: self.storage.reshard(shards), self.on_resharded)
+        # Хеширование паролей идет в пуле потоков, окно не замирает
+        self.hasher = HashingService(
+            self.dispatcher.post,
+            iterations=self.kdf_iterations,
+            target_seconds=self.kdf_target_ms / 1000
+        )
+        self.register_gauges()
+        if self.shared:
+            self.storage.listener = self.on_foreign_records
+            self.root.after(self.refresh_ms, self.poll_shared)
+    
+    def stop_workers(self):
+        """Дожидаемся хеширования и сохраняем очередь записи"""
+        self.hasher.close()
+        self.writer.close()
+    
     def load_users(self):
-        """Загружаем пользователей из файла"""
-        if os.path.exists(self.users_file):
-            with open(self.users_file, 'r') as f:
-                self.users = json.load(f)
+        """Загружаем пользователей из хранилища"""
+        with METRICS.timer("load_users"):
+            self.users = self.storage.load()
+            self.build_recipient_index()
+        METRICS.gauge("accounts_loaded", len(self.users))
+    
+    def sample_widgets(self):
+        METRICS.gauge("ui_widgets", self.screens.widget_count())
+        self.root.after(self.widgets_ms, self.sample_widgets)
+    
+    def register_gauges(self):
+        """Показатели, которые вычисляются при выгрузке метрик"""
+        METRICS.gauge_function("storage_disk_bytes", self.storage.disk_size)
+        if hasattr(self.storage, "journal_size"):
+            METRICS.gauge_function("storage_journal_bytes", self.storage.journal_size)
+        if isinstance(self.users, AccountCache):
+            cache = self.users
+            METRICS.gauge_function("cache_bytes", lambda: cache.size)
+            METRICS.gauge_function("cache_hits", lambda: cache.hits)
+            METRICS.gauge_function("cache_misses", lambda: cache.misses)
+            METRICS.gauge_function(
+                "cache_hit_ratio",
+                lambda: round(cache.hits / (cache.hits + cache.misses), 4) if cache.hits + cache.misses else None
+            )
+    
+    def build_recipient_index(self):
+        """Строим индекс получателей для подсказок в окне перевода"""
+        # Имена доступны без чтения с диска, только когда вся база в памяти
+        self.index_names = not isinstance(self.users, AccountCache)
+        names = None
+        if self.index_names:
+            names = {email: f"{account.name} {account.surname}" for email, account in self.users.items()}
+        self.recipients = PrefixIndex.build(self.users.keys(), names)
+    
+    def commit_records(self, records):
+        """Применяем записи к состоянию и ставим их в очередь на сохранение"""
+        if self.shared:
+            self.commit_shared(records)
+            return
+        # Пока записи не сохранены, аккаунты нельзя вытеснять из кеша:
+        # повторная загрузка прочитала бы старую версию
+        emails = [email for record in records for email in record_emails(record)]
+        self.pin_accounts(emails)
+        for record in records:
+            apply_record(self.users, record)
+        self.writer.submit(records, lambda error: self.on_records_saved(emails, error))
+    
+    def commit_shared(self, records):
+        """Режим shared: запись сразу, под блокировкой и с проверкой версий аккаунтов.
+
+        ConflictError уходит в Ledger, который проверяет операцию заново.
+        """
+        try:
+            self.storage.commit_checked(records, self.users)
+        except OSError as e:
+            raise LedgerError(f"Не удалось сохранить данные: {e}")
+    
+    def run_operation(self, build, on_done, attempt=0):
+        """Проводим операцию Ledger; результат - on_done(applied, error) в потоке Tk.
+
+        build() строит записи через ``self.ledger.*_record``. После конфликта
+        версий (режим shared) следующая попытка планируется через
+        ``root.after``, а не ожиданием в потоке окна.
+        """
+        try:
+            applied = self.ledger.try_execute(build, attempt)
+        except LedgerError as e:
+            on_done(None, e)
+            return
+        if applied is not None:
+            on_done(applied, None)
+        elif attempt + 1 < MAX_RETRIES:
+            delay_ms = int(retry_delay(attempt + 1) * 1000)
+            self.root.after(delay_ms, lambda: self.run_operation(build, on_done, attempt + 1))
         else:
-            self.users = {}
+            on_done(None, RetriesExhausted())
     
-    def save_users(self):
-        """Сохраняем пользователей в файл"""
-        with open(self.users_file, 'w') as f:
-            json.dump(self.users, f, indent=4)
+    def submit_operation(self, operation, args, op_id, on_done):
+        """deposit, withdraw или transfer с номером op_id; on_done(applied, error)"""
+        record = getattr(self.ledger, f"{operation}_record")
+        self.run_operation(lambda: [record(*args, op_id=op_id)], on_done)
     
-    def hash_password(self, password):
-        """Хешируем пароль"""
-        return hashlib.sha256(password.encode()).hexdigest()
+    def search_recipients(self, prefix, limit, callback):
+        """Подсказки получателей: callback(emails) в потоке Tk"""
+        callback(self.recipients.search(prefix, limit=limit, exclude=self.current_user))
+    
+    def poll_shared(self):
+        """Периодически подтягиваем операции других рабочих мест"""
+        try:
+            self.storage.refresh(self.users)
+        except OSError:
+            pass  # попробуем в следующий раз
+        self.root.after(self.refresh_ms, self.poll_shared)
+    
+    def on_foreign_records(self, records):
+        """Другие экземпляры изменили данные (records is None - база перечитана)"""
+        if records is None:
+            self.build_recipient_index()
+        else:
+            for record in records:
+                if record["op"] == "register":
+                    user = record["user"]
+                    name = f"{user['имя']} {user['фамилия']}" if self.index_names else None
+                    self.recipients.add(record["email"], name)
+        if self.current_user is not None:
+            self.update_balance()
+    
+    def pin_accounts(self, emails):
+        """Закрепляем аккаунты в кеше (в режимах с загрузкой по запросу)"""
+        if isinstance(self.users, AccountCache):
+            for email in emails:
+                self.users.pin(email)
+    
+    def unpin_accounts(self, emails):
+        if isinstance(self.users, AccountCache):
+            for email in emails:
+                self.users.unpin(email)
+    
+    def on_records_saved(self, emails, error):
+        """Результат фоновой записи (вызывается в потоке Tk)"""
+        self.unpin_accounts(emails)
+        if error is not None:
+            messagebox.showerror("Ошибка", f"Не удалось сохранить данные: {error}")
+    
+    def on_resharded(self, error):
+        if error is not None:
+            messagebox.showerror("Ошибка", f"Не удалось перешардировать данные: {error}")
+    
+    def register_screens(self):
+        """Описываем окна приложения; создаются они при первом показе"""
+        # Закрыть окно регистрации или входа - значит выйти из приложения
+        self.screens.register(
+            "registration", "Регистрация", "350x450", self.build_registration_window,
+            modal=True, session=False, on_close=self.root.destroy
+        )
+        self.screens.register(
+            "login", "Вход в систему", "350x300", self.build_login_window,
+            modal=True, session=False, on_close=self.root.destroy
+        )
+        self.screens.register("amount", "Операция", "300x200", self.build_amount_window)
+        self.screens.register("transfer", "Перевод денег", "350x360", self.build_transfer_window)
+        self.screens.register("history", "История операций", "600x480", self.build_history_window)
+        self.screens.register(
+            "diagnostics", "Диагностика", "520x420", self.build_diagnostics_window, session=False
+        )
     
     def show_registration_window(self):
         """Окно регистрации"""
-        self.reg_window = tk.Toplevel(self.root)
-        self.reg_window.title("Регистрация")
-        self.reg_window.geometry("350x450")
-        self.reg_window.configure(bg=self.bg_color)
-        self.reg_window.grab_set()  # Модальное окно
-        
+        self.screens.show("registration")
+    
+    def build_registration_window(self, window):
         # Заголовок
         title_label = tk.Label(
-            self.reg_window,
+            window,
             text="Регистрация в Банке",
             font=("Arial", 16, "bold"),
             bg=self.bg_color,
@@ -62,7 +275,7 @@ class BankApp:
         title_label.pack(pady=20)
         
         # Фрейм для полей ввода
-        input_frame = tk.Frame(self.reg_window, bg=self.bg_color)
+        input_frame = tk.Frame(window, bg=self.bg_color)
         input_frame.pack(pady=20)
         
         # Поля для ввода
@@ -80,8 +293,8 @@ class BankApp:
             self.reg_entries[label_text.split(":")[0]] = entry
         
         # Кнопка регистрации
-        reg_button = tk.Button(
-            self.reg_window,
+        self.reg_button = tk.Button(
+            window,
             text="Зарегистрироваться",
             command=self.register_user,
             bg=self.secondary_color,
@@ -90,11 +303,11 @@ class BankApp:
             padx=20,
             pady=10
         )
-        reg_button.pack(pady=20)
+        self.reg_button.pack(pady=20)
         
         # Ссылка на вход
         login_label = tk.Label(
-            self.reg_window,
+            window,
             text="Уже есть аккаунт? Войти",
             bg=self.bg_color,
             fg=self.secondary_color,
@@ -102,10 +315,17 @@ class BankApp:
         )
         login_label.pack()
         login_label.bind("<Button-1>", lambda e: self.switch_to_login())
+        
+        def reset():
+            for entry in self.reg_entries.values():
+                entry.delete(0, "end")
+            self.reg_button.config(state="normal")
+            self.reg_entries["Имя"].focus_set()
+        return reset
     
     def switch_to_login(self):
         """Переход к окну входа"""
-        self.reg_window.destroy()
+        self.screens.hide("registration")
         self.show_login_window()
     
     def register_user(self):
@@ -126,37 +346,59 @@ class BankApp:
             messagebox.showerror("Ошибка", "Пароли не совпадают!")
             return
         
-        # Проверяем уникальность email
+        self.submit_registration(data)
+    
+    def submit_registration(self, data):
+        """Проверяем email и хешируем пароль в фоне; аккаунт создает finish_registration"""
         if data["Email"] in self.users:
             messagebox.showerror("Ошибка", "Пользователь с таким email уже существует!")
             return
         
+        self.reg_button.config(state="disabled")
+        self.hasher.hash(data["Пароль"], lambda hashed, error: self.finish_registration(data, hashed, error))
+    
+    def finish_registration(self, data, hashed, error=None):
+        """Создаем аккаунт, когда пароль захеширован"""
+        if not self.screens.is_shown("registration"):
+            return
+        self.reg_button.config(state="normal")
+        if error is not None:
+            messagebox.showerror("Ошибка", f"Не удалось захешировать пароль: {error}")
+            return
+        
         # Создаем аккаунт пользователя
-        self.users[data["Email"]] = {
+        user = {
             "имя": data["Имя"],
             "фамилия": data["Фамилия"],
             "телефон": data["Номер телефона"],
-            "пароль": self.hash_password(data["Пароль"]),
+            "пароль": hashed,
             "баланс": 1000.00,  # Начальный баланс
             "транзакции": [],
             "активен": True
         }
         
-        self.save_users()
+        # Пока хешировался пароль, email мог занять кто-то другой
+        def registered(applied, error):
+            if error is not None:
+                messagebox.showerror("Ошибка", str(error))
+                return
+            self.recipients.add(data["Email"], f"{data['Имя']} {data['Фамилия']}" if self.index_names else None)
+            self.registration_done()
+        
+        self.run_operation(lambda: [self.ledger.register_record(data["Email"], user)], registered)
+    
+    def registration_done(self):
         messagebox.showinfo("Успех", "Регистрация успешна! Теперь войдите в систему.")
         self.switch_to_login()
     
     def show_login_window(self):
         """Окно входа"""
-        self.login_window = tk.Toplevel(self.root)
-        self.login_window.title("Вход в систему")
-        self.login_window.geometry("350x300")
-        self.login_window.configure(bg=self.bg_color)
-        self.login_window.grab_set()
-        
+        self.screens.show("login")
+    
+    def build_login_window(self, window):
         # Заголовок
         title_label = tk.Label(
-            self.login_window,
+            window,
             text="Вход в Банк",
             font=("Arial", 16, "bold"),
             bg=self.bg_color,
@@ -165,7 +407,7 @@ class BankApp:
         title_label.pack(pady=30)
         
         # Поля для ввода
-        input_frame = tk.Frame(self.login_window, bg=self.bg_color)
+        input_frame = tk.Frame(window, bg=self.bg_color)
         input_frame.pack(pady=20)
         
         # Email
@@ -181,8 +423,8 @@ class BankApp:
         self.password_entry.grid(row=1, column=1, padx=10, pady=10)
         
         # Кнопка входа
-        login_button = tk.Button(
-            self.login_window,
+        self.login_button = tk.Button(
+            window,
             text="Войти",
             command=self.login_user,
             bg=self.accent_color,
@@ -191,11 +433,11 @@ class BankApp:
             padx=20,
             pady=10
         )
-        login_button.pack(pady=20)
+        self.login_button.pack(pady=20)
         
         # Ссылка на регистрацию
         reg_label = tk.Label(
-            self.login_window,
+            window,
             text="Нет аккаунта? Зарегистрироваться",
             bg=self.bg_color,
             fg=self.secondary_color,
@@ -203,10 +445,17 @@ class BankApp:
         )
         reg_label.pack()
         reg_label.bind("<Button-1>", lambda e: self.switch_to_registration())
+        
+        def reset():
+            self.email_entry.delete(0, "end")
+            self.password_entry.delete(0, "end")
+            self.login_button.config(state="normal")
+            self.email_entry.focus_set()
+        return reset
     
     def switch_to_registration(self):
         """Переход к окну регистрации"""
-        self.login_window.destroy()
+        self.screens.hide("login")
         self.show_registration_window()
     
     def login_user(self):
@@ -218,42 +467,82 @@ class BankApp:
             messagebox.showerror("Ошибка", "Заполните все поля!")
             return
         
+        self.submit_login(email, password)
+    
+    def submit_login(self, email, password):
+        """Проверяем аккаунт и пароль (в фоне); вход завершает finish_login"""
         if email not in self.users:
             messagebox.showerror("Ошибка", "Пользователь не найден!")
             return
         
-        user = self.users[email]
+        account = self.users[email]
         
-        if not user["активен"]:
+        if not account.active:
             messagebox.showerror("Ошибка", "Аккаунт заблокирован!")
             return
         
-        if user["пароль"] != self.hash_password(password):
+        # Проверка пароля идет в фоне, вход завершает finish_login
+        self.login_button.config(state="disabled")
+        stored = account.password
+        self.hasher.verify(
+            password, stored, lambda ok, error: self.finish_login(email, password, stored, ok, error)
+        )
+    
+    def finish_login(self, email, password, stored, ok, error=None):
+        """Завершаем вход после проверки пароля"""
+        if not self.screens.is_shown("login"):
+            return
+        self.login_button.config(state="normal")
+        
+        if error is not None:
+            messagebox.showerror("Ошибка", f"Не удалось проверить пароль: {error}")
+            return
+        
+        if not ok:
             messagebox.showerror("Ошибка", "Неверный пароль!")
             return
         
+        # Старый SHA-256 или слабый хеш заменяем при успешном входе
+        if needs_upgrade(stored, self.hasher.iterations):
+            self.hasher.hash(password, lambda hashed, error: error is None and self.run_operation(
+                lambda: [{"op": "update", "email": email, "fields": {"пароль": hashed}}],
+                lambda applied, error: None
+            ))
+        
+        self.complete_login(email)
+    
+    def complete_login(self, email):
+        """Пользователь вошел: показываем основное окно"""
         self.current_user = email
-        self.login_window.destroy()
+        self.pin_accounts([email])
+        self.screens.hide("login")
         self.show_bank_window()
     
     def show_bank_window(self):
-        """Основное окно банка"""
+        """Основное окно банка: виджеты создаются при первом входе, дальше только обновляются"""
+        if self.bank_view is None:
+            self.build_bank_window()
+        account = self.users[self.current_user]
+        self.root.title(f"Банк Онлайн - {account.name} {account.surname}")
+        self.user_info.config(text=f"Добро пожаловать, {account.name}!")
+        # Новый вход - выписка за текущий месяц
+        self.statement_period.set("")
+        self.update_balance()
         self.root.deiconify()  # Показываем главное окно
-        self.root.title(f"Банк Онлайн - {self.users[self.current_user]['имя']} {self.users[self.current_user]['фамилия']}")
-        
+    
+    def build_bank_window(self):
         # Верхняя панель
         header_frame = tk.Frame(self.root, bg=self.primary_color, height=80)
         header_frame.pack(fill="x")
         header_frame.pack_propagate(False)
         
-        user_info = tk.Label(
+        self.user_info = tk.Label(
             header_frame,
-            text=f"Добро пожаловать, {self.users[self.current_user]['имя']}!",
             font=("Arial", 14, "bold"),
             bg=self.primary_color,
             fg="white"
         )
-        user_info.pack(pady=20)
+        self.user_info.pack(pady=20)
         
         # Основное содержание
         main_frame = tk.Frame(self.root, bg=self.bg_color)
@@ -273,13 +562,14 @@ class BankApp:
         
         self.balance_value = tk.Label(
             balance_frame,
-            text=f"{self.users[self.current_user]['баланс']:.2f} ₽",
             font=("Arial", 24, "bold"),
             bg="white",
             fg=self.accent_color
         )
         self.balance_value.pack(pady=10)
         
+        self.build_statement_panel(main_frame)
+        
         # Кнопки операций
         buttons_frame = tk.Frame(main_frame, bg=self.bg_color)
         buttons_frame.pack(pady=20)
@@ -290,6 +580,8 @@ class BankApp:
             ("Перевести", self.transfer_money),
             ("История", self.show_history)
         ]
+        if self.diagnostics:
+            operations.append(("Диагностика", self.show_diagnostics))
         
         for i, (text, command) in enumerate(operations):
             btn = tk.Button(
@@ -315,23 +607,59 @@ class BankApp:
             padx=20
         )
         logout_btn.pack(pady=20)
+        
+        self.bank_view = main_frame
     
     def update_balance(self):
         """Обновляем отображение баланса"""
         self.balance_value.config(
-            text=f"{self.users[self.current_user]['баланс']:.2f} ₽"
+            text=f"{format_amount(self.users[self.current_user].balance)} ₽"
         )
+        self.update_statement()
     
-    def add_transaction(self, transaction_type, amount, description=""):
-        """Добавляем транзакцию в историю"""
-        transaction = {
-            "дата": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "тип": transaction_type,
-            "сумма": amount,
-            "описание": description
-        }
-        self.users[self.current_user]["транзакции"].append(transaction)
-        self.save_users()
+    def build_statement_panel(self, parent):
+        """Сводка выписки за месяц; берется из оборотов, история не пересматривается"""
+        frame = tk.Frame(parent, bg="white", relief="groove", bd=2)
+        frame.pack(fill="x", pady=5)
+        
+        top = tk.Frame(frame, bg="white")
+        top.pack(fill="x", padx=10, pady=(5, 0))
+        tk.Label(top, text="Выписка за", font=("Arial", 10, "bold"), bg="white").pack(side="left")
+        self.statement_period = ttk.Combobox(top, state="readonly", width=10)
+        self.statement_period.pack(side="left", padx=5)
+        self.statement_period.bind("<<ComboboxSelected>>", lambda e: self.update_statement())
+        
+        self.statement_text = tk.Label(frame, justify="left", font=("Courier", 9), bg="white")
+        self.statement_text.pack(anchor="w", padx=10, pady=5)
+    
+    def update_statement(self):
+        turnover = self.users[self.current_user].turnover
+        # Текущий месяц показываем и без операций
+        periods = sorted(set(turnover.periods) | {datetime.now().strftime("%Y-%m")}, reverse=True)
+        chosen = self.statement_period.get()
+        self.statement_period["values"] = periods
+        if chosen not in periods:
+            chosen = periods[0]
+            self.statement_period.set(chosen)
+        
+        summary = turnover.summary(chosen)
+        if summary is None:
+            self.statement_text.config(text="Операций за период нет")
+            return
+        lines = []
+        for label, amount_key, count_key in (
+            ("Пополнения", *TURNOVER_FIELDS[0:2]),
+            ("Снятия", *TURNOVER_FIELDS[2:4]),
+            ("Входящие переводы", *TURNOVER_FIELDS[4:6]),
+            ("Исходящие переводы", *TURNOVER_FIELDS[6:8])
+        ):
+            lines.append(f"{label:<20}{summary[count_key]:>6} шт. {format_amount(summary[amount_key]):>14} ₽")
+        lines.append(f"{'Приход':<30}{format_amount(summary['приход']):>14} ₽")
+        lines.append(f"{'Расход':<30}{format_amount(summary['расход']):>14} ₽")
+        lines.append(
+            f"{'Остаток мин/макс':<20}{format_amount(summary['мин_остаток'])} / {format_amount(summary['макс_остаток'])} ₽"
+        )
+        self.statement_text.config(text="\n".join(lines))
     
     def deposit_money(self):
         """Пополнение счета"""
@@ -343,28 +671,68 @@ class BankApp:
     
     def transfer_money(self):
         """Перевод денег"""
-        transfer_window = tk.Toplevel(self.root)
-        transfer_window.title("Перевод денег")
-        transfer_window.geometry("350x250")
-        transfer_window.configure(bg=self.bg_color)
-        
+        self.screens.show("transfer")
+    
+    def build_transfer_window(self, window):
         tk.Label(
-            transfer_window,
+            window,
             text="Перевод средств",
             font=("Arial", 14, "bold"),
             bg=self.bg_color
         ).pack(pady=20)
         
         # Получатель
-        tk.Label(transfer_window, text="Email получателя:", bg=self.bg_color).pack()
-        recipient_entry = tk.Entry(transfer_window, width=30)
+        tk.Label(window, text="Email получателя:", bg=self.bg_color).pack()
+        recipient_entry = tk.Entry(window, width=30)
         recipient_entry.pack(pady=5)
         
+        # Подсказки по началу email или имени
+        suggestion_rows = 4
+        suggestions = tk.Listbox(window, width=30, height=suggestion_rows)
+        suggestions.pack()
+        pending_search = [None]
+        
+        def update_suggestions():
+            pending_search[0] = None
+            prefix = recipient_entry.get()
+            self.search_recipients(prefix, suggestion_rows, lambda matches: show_suggestions(prefix, matches))
+        
+        def show_suggestions(prefix, matches):
+            # Ответ на устаревший запрос не показываем
+            if recipient_entry.get() != prefix:
+                return
+            suggestions.delete(0, "end")
+            for email in matches:
+                suggestions.insert("end", email)
+        
+        def on_recipient_key(event):
+            # Ищем, когда пользователь перестал печатать, а не на каждую клавишу
+            if pending_search[0] is not None:
+                window.after_cancel(pending_search[0])
+            pending_search[0] = window.after(150, update_suggestions)
+        
+        def choose_suggestion(event):
+            selection = suggestions.curselection()
+            if selection:
+                recipient_entry.delete(0, "end")
+                recipient_entry.insert(0, suggestions.get(selection[0]))
+                suggestions.delete(0, "end")
+                amount_entry.focus_set()
+        
+        recipient_entry.bind("<KeyRelease>", on_recipient_key)
+        recipient_entry.bind("<Down>", lambda e: suggestions.focus_set())
+        suggestions.bind("<<ListboxSelect>>", choose_suggestion)
+        suggestions.bind("<Return>", choose_suggestion)
+        
         # Сумма
-        tk.Label(transfer_window, text="Сумма перевода:", bg=self.bg_color).pack()
-        amount_entry = tk.Entry(transfer_window, width=30)
+        tk.Label(window, text="Сумма перевода:", bg=self.bg_color).pack()
+        amount_entry = tk.Entry(window, width=30)
         amount_entry.pack(pady=5)
         
+        # Номер операции выдается при открытии окна: повторное нажатие
+        # кнопки не проведет перевод второй раз
+        state = {"op_id": None}
+        
         def process_transfer():
             recipient = recipient_entry.get().strip()
             amount_str = amount_entry.get().strip()
@@ -374,74 +742,82 @@ class BankApp:
                 return
             
             try:
-                amount = float(amount_str)
-                if amount <= 0:
-                    messagebox.showerror("Ошибка", "Сумма должна быть положительной!")
-                    return
+                amount = parse_amount(amount_str)
             except ValueError:
                 messagebox.showerror("Ошибка", "Введите корректную сумму!")
                 return
             
-            if recipient == self.current_user:
-                messagebox.showerror("Ошибка", "Нельзя перевести деньги самому себе!")
+            # Ответ может прийти позже (повтор после конфликта, сервис): до него
+            # кнопка недоступна, окно при этом не замирает
+            transfer_button.config(state="disabled")
+            started = time.perf_counter()
+            self.submit_operation(
+                "transfer", (self.current_user, recipient, amount), state["op_id"],
+                lambda applied, error: finish_transfer(applied, error, time.perf_counter() - started)
+            )
+        
+        def finish_transfer(applied, error, seconds):
+            METRICS.observe("transfer", seconds)
+            transfer_button.config(state="normal")
+            if error is None and self.current_user is not None:
+                self.update_balance()
+            if not self.screens.is_shown("transfer"):
                 return
-            
-            if recipient not in self.users:
-                messagebox.showerror("Ошибка", "Получатель не найден!")
+            if error is not None:
+                METRICS.count("transfer_rejected")
+                messagebox.showerror("Ошибка", str(error))
                 return
-            
-            if self.users[self.current_user]["баланс"] < amount:
-                messagebox.showerror("Ошибка", "Недостаточно средств на счете!")
+            if not applied:
+                # Перевод уже выполнен прошлым нажатием
+                METRICS.count("transfer_duplicate")
+                self.screens.hide("transfer")
                 return
             
-            # Выполняем перевод
-            self.users[self.current_user]["баланс"] -= amount
-            self.users[recipient]["баланс"] += amount
-            
-            # Добавляем транзакции
-            self.add_transaction("перевод", -amount, f"Перевод пользователю {recipient}")
-            
-            recipient_transaction = {
-                "дата": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "тип": "перевод",
-                "сумма": amount,
-                "описание": f"Перевод от пользователя {self.current_user}"
-            }
-            self.users[recipient]["транзакции"].append(recipient_transaction)
-            
-            self.save_users()
-            self.update_balance()
             messagebox.showinfo("Успех", "Перевод выполнен успешно!")
-            transfer_window.destroy()
+            self.screens.hide("transfer")
         
-        tk.Button(
-            transfer_window,
+        transfer_button = tk.Button(
+            window,
             text="Выполнить перевод",
             command=process_transfer,
             bg=self.accent_color,
             fg="white",
             padx=20,
             pady=10
-        ).pack(pady=20)
+        )
+        transfer_button.pack(pady=20)
+        
+        def reset():
+            if pending_search[0] is not None:
+                window.after_cancel(pending_search[0])
+                pending_search[0] = None
+            state["op_id"] = new_operation_id()
+            recipient_entry.delete(0, "end")
+            amount_entry.delete(0, "end")
+            suggestions.delete(0, "end")
+            recipient_entry.focus_set()
+        return reset
     
     def show_amount_window(self, title, message, operation):
         """Окно для ввода суммы"""
-        window = tk.Toplevel(self.root)
-        window.title(title)
-        window.geometry("300x200")
-        window.configure(bg=self.bg_color)
+        self.screens.show("amount", title, message, operation)
+    
+    def build_amount_window(self, window):
+        # Одно окно на пополнение и снятие: операцию задает reset
+        state = {"operation": None, "op_id": None}
         
-        tk.Label(
+        message_label = tk.Label(
             window,
-            text=message,
             font=("Arial", 12),
             bg=self.bg_color
-        ).pack(pady=30)
+        )
+        message_label.pack(pady=30)
         
         amount_entry = tk.Entry(window, width=20, font=("Arial", 14))
         amount_entry.pack(pady=10)
         
         def process_operation():
+            operation = state["operation"]
             amount_str = amount_entry.get().strip()
             
             if not amount_str:
@@ -449,31 +825,42 @@ class BankApp:
                 return
             
             try:
-                amount = float(amount_str)
-                if amount <= 0:
-                    messagebox.showerror("Ошибка", "Сумма должна быть положительной!")
-                    return
+                amount = parse_amount(amount_str)
             except ValueError:
                 messagebox.showerror("Ошибка", "Введите корректную сумму!")
                 return
             
+            confirm_button.config(state="disabled")
+            started = time.perf_counter()
+            self.submit_operation(
+                operation, (self.current_user, amount), state["op_id"],
+                lambda applied, error: finish_operation(operation, applied, error, time.perf_counter() - started)
+            )
+        
+        def finish_operation(operation, applied, error, seconds):
+            METRICS.observe(operation, seconds)
+            confirm_button.config(state="normal")
+            if error is None and self.current_user is not None:
+                self.update_balance()
+            if not self.screens.is_shown("amount"):
+                return
+            if error is not None:
+                METRICS.count(f"{operation}_rejected")
+                messagebox.showerror("Ошибка", str(error))
+                return
+            if not applied:
+                # Операция уже проведена прошлым нажатием
+                METRICS.count(f"{operation}_duplicate")
+                self.screens.hide("amount")
+                return
+            
             if operation == "deposit":
-                self.users[self.current_user]["баланс"] += amount
-                self.add_transaction("пополнение", amount)
                 messagebox.showinfo("Успех", "Счет пополнен успешно!")
-            elif operation == "withdraw":
-                if self.users[self.current_user]["баланс"] < amount:
-                    messagebox.showerror("Ошибка", "Недостаточно средств на счете!")
-                    return
-                self.users[self.current_user]["баланс"] -= amount
-                self.add_transaction("снятие", -amount)
+            else:
                 messagebox.showinfo("Успех", "Деньги сняты успешно!")
-            
-            self.save_users()
-            self.update_balance()
-            window.destroy()
+            self.screens.hide("amount")
         
-        tk.Button(
+        confirm_button = tk.Button(
             window,
             text="Подтвердить",
             command=process_operation,
@@ -481,66 +868,182 @@ class BankApp:
             fg="white",
             padx=20,
             pady=10
-        ).pack(pady=20)
+        )
+        confirm_button.pack(pady=20)
+        
+        def reset(title="Операция", message="", operation=None):
+            state["operation"] = operation
+            state["op_id"] = new_operation_id()
+            window.title(title)
+            message_label.config(text=message)
+            amount_entry.delete(0, "end")
+            amount_entry.focus_set()
+        return reset
     
     def show_history(self):
         """Показываем историю транзакций"""
-        history_window = tk.Toplevel(self.root)
-        history_window.title("История операций")
-        history_window.geometry("500x400")
-        history_window.configure(bg=self.bg_color)
-        
+        with METRICS.timer("show_history"):
+            self.screens.show("history", self.users[self.current_user].history)
+    
+    def build_history_window(self, window):
         tk.Label(
-            history_window,
+            window,
             text="История транзакций",
             font=("Arial", 14, "bold"),
             bg=self.bg_color
         ).pack(pady=10)
         
-        # Создаем Treeview для отображения транзакций
-        tree_frame = tk.Frame(history_window)
-        tree_frame.pack(fill="both", expand=True, padx=10, pady=10)
+        # История текущего пользователя и ее источник строк; меняются при каждом показе
+        state = {"history": [], "pager": HistoryPager([])}
+        
+        def apply_filter(query):
+            history = state["history"]
+            if query is None:
+                status.config(text="Некорректная дата или сумма (даты - ГГГГ-ММ-ДД)", fg="red")
+                return
+            if query.is_empty():
+                view.set_pager(state["pager"])
+                status.config(text=f"Всего операций: {len(history)}", fg="black")
+                return
+            with METRICS.timer("history_filter"):
+                try:
+                    selection = history.select(query)
+                except LedgerError as e:
+                    status.config(text=str(e), fg="red")
+                    return
+            view.set_pager(HistoryPager(selection))
+            status.config(text=f"Найдено: {len(selection)} из {len(history)}", fg="black")
+        
+        # Фильтр ищет по индексам истории, поэтому работает и на длинной истории
+        filter_bar = HistoryFilterBar(window, apply_filter, bg=self.bg_color)
+        filter_bar.pack(padx=10)
+        
+        def export_filtered():
+            try:
+                query = filter_bar.query()
+            except ValueError:
+                messagebox.showerror("Ошибка", "Некорректная дата или сумма в фильтре", parent=window)
+                return
+            self.export_history(window, state["history"], query)
+        
+        tk.Button(
+            window,
+            text="Экспорт...",
+            command=export_filtered,
+            bg=self.secondary_color,
+            fg="white",
+            font=("Arial", 10)
+        ).pack(pady=(5, 0))
+        
+        status = tk.Label(window, bg=self.bg_color)
+        status.pack()
         
-        # Создаем вертикальный скроллбар
-        scrollbar = ttk.Scrollbar(tree_frame)
-        scrollbar.pack(side="right", fill="y")
+        # Таблица создает только видимые строки и подгружает страницы при прокрутке
+        view = VirtualHistoryView(window, state["pager"])
+        view.pack(fill="both", expand=True, padx=10, pady=10)
         
-        tree = ttk.Treeview(
-            tree_frame,
-            columns=("Дата", "Тип", "Сумма", "Описание"),
-            show="headings",
-            yscrollcommand=scrollbar.set
+        def reset(history=()):
+            # Без истории (выход пользователя) таблица пустеет и не держит чужие данные
+            state["history"] = history
+            state["pager"] = HistoryPager(history)
+            filter_bar.clear()
+            view.set_pager(state["pager"])
+            status.config(text=f"Всего операций: {len(history)}", fg="black")
+        return reset
+    
+    def export_history(self, parent, history, query):
+        """Выгружаем отобранные операции в файл в фоновом потоке с прогрессом и отменой"""
+        path = filedialog.asksaveasfilename(
+            parent=parent,
+            title="Экспорт истории",
+            defaultextension=".csv",
+            filetypes=[
+                ("CSV", "*.csv"),
+                ("JSON Lines", "*.jsonl"),
+                ("CSV, сжатый gzip", "*.csv.gz"),
+                ("JSON Lines, сжатый gzip", "*.jsonl.gz")
+            ]
         )
+        if not path:
+            return
         
-        scrollbar.config(command=tree.yview)
+        window = tk.Toplevel(parent)
+        window.title("Экспорт")
+        window.geometry("360x140")
+        window.configure(bg=self.bg_color)
+        window.transient(parent)
         
-        # Настраиваем колонки
-        tree.heading("Дата", text="Дата")
-        tree.heading("Тип", text="Тип операции")
-        tree.heading("Сумма", text="Сумма (₽)")
-        tree.heading("Описание", text="Описание")
+        label = tk.Label(window, text="Подготовка...", bg=self.bg_color)
+        label.pack(pady=(15, 5))
+        bar = ttk.Progressbar(window, length=300, mode="determinate")
+        bar.pack(pady=5)
         
-        tree.column("Дата", width=120)
-        tree.column("Тип", width=100)
-        tree.column("Сумма", width=100)
-        tree.column("Описание", width=150)
+        def on_progress(done, total, rows):
+            if window.winfo_exists():
+                bar["value"] = 100 * done / total if total else 100
+                label.config(text=f"Записано операций: {rows}")
         
-        # Добавляем транзакции
-        for transaction in reversed(self.users[self.current_user]["транзакции"]):
-            amount = transaction["сумма"]
-            amount_str = f"+{amount:.2f}" if amount > 0 else f"{amount:.2f}"
-            
-            tree.insert("", "end", values=(
-                transaction["дата"],
-                transaction["тип"],
-                amount_str,
-                transaction.get("описание", "")
-            ))
+        def on_done(rows, error):
+            if window.winfo_exists():
+                window.destroy()
+            if error is not None:
+                messagebox.showerror("Ошибка", f"Не удалось выгрузить историю: {error}", parent=parent)
+            elif rows is not None:
+                messagebox.showinfo("Экспорт", f"Выгружено операций: {rows}", parent=parent)
+        
+        email = self.current_user
+        job = ExportJob(
+            lambda: account_rows(email, history, query),
+            path,
+            self.dispatcher.post,
+            on_progress,
+            on_done
+        )
+        tk.Button(window, text="Отмена", command=job.cancel, font=("Arial", 10)).pack(pady=5)
+        window.protocol("WM_DELETE_WINDOW", job.cancel)
+        job.start()
+    
+    def show_diagnostics(self):
+        """Окно с текущими метриками, обновляется раз в секунду"""
+        self.screens.show("diagnostics")
+    
+    def build_diagnostics_window(self, window):
+        text = tk.Text(window, font=("Courier", 9), wrap="none")
+        text.pack(fill="both", expand=True, padx=10, pady=10)
+        pending = [None]
+        
+        def refresh():
+            pending[0] = None
+            # Спрятанное окно не обновляем
+            if not self.screens.is_shown("diagnostics"):
+                return
+            snapshot = METRICS.snapshot()
+            lines = [f"{'операция':<24}{'число':>8}{'сред, мс':>12}{'макс, мс':>12}"]
+            for name, stats in sorted(snapshot["timers"].items()):
+                lines.append(f"{name:<24}{stats['count']:>8}{stats['avg_ms']:>12.2f}{stats['max_ms']:>12.2f}")
+            lines.append("")
+            for name, value in sorted(snapshot["counters"].items()):
+                lines.append(f"{name:<36}{value:>16}")
+            for name, value in sorted(snapshot["gauges"].items()):
+                lines.append(f"{name:<36}{'-' if value is None else value:>16}")
+            text.config(state="normal")
+            text.delete("1.0", "end")
+            text.insert("1.0", "\n".join(lines))
+            text.config(state="disabled")
+            pending[0] = window.after(1000, refresh)
         
-        tree.pack(fill="both", expand=True)
+        def reset():
+            # Первое обновление - когда окно уже показано
+            if pending[0] is not None:
+                window.after_cancel(pending[0])
+            pending[0] = window.after(0, refresh)
+        return reset
     
     def logout(self):
         """Выход из системы"""
+        # Окна сеанса прячем и очищаем: следующий пользователь откроет их заново
+        self.screens.end_session()
+        self.unpin_accounts([self.current_user])
         self.current_user = None
         self.root.withdraw()  # Скрываем главное окно
         self.show_login_window()
@@ -549,7 +1052,152 @@ class BankApp:
         """Запуск приложения"""
         self.root.withdraw()  # Скрываем главное окно до входа
         self.root.mainloop()
+        self.stop_workers()
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+class ThinClientApp(BankApp):
+    """Тонкий клиент: то же окно, а данные и правила - в сервисе (service.py)"""
+    
+    def __init__(self, address, **kwargs):
+        self.address = address
+        super().__init__(**kwargs)
+    
+    def open_backend(self):
+        self.client = LedgerClient(self.address)
+        self.storage = None
+        self.shared = False
+        self.index_names = False
+        self.users = RemoteAccounts(self.client)
+        self.ledger = RemoteLedger(self.client)
+        self.recipients = RemoteRecipients(self.client)
+    
+    def start_workers(self):
+        pass
+    
+    def stop_workers(self):
+        self.client.close()
+    
+    def submit_operation(self, operation, args, op_id, on_done):
+        """Операцию проводит сервис; ответ передается в поток Tk"""
+        getattr(self.ledger, operation)(
+            *args, op_id, lambda applied, error: self.dispatcher.post(on_done, applied, error)
+        )
+    
+    def search_recipients(self, prefix, limit, callback):
+        self.recipients.search(prefix, limit, lambda matches: self.dispatcher.post(callback, matches))
+    
+    def update_balance(self):
+        """Снимок аккаунта запрашиваем в фоне; окно обновится, когда он придет"""
+        self.users.refresh(lambda account, error: self.dispatcher.post(self.show_account, account, error))
+    
+    def show_account(self, account, error):
+        if self.current_user is None or error is not None:
+            return
+        self.users.account = account
+        super().update_balance()
+    
+    def submit_registration(self, data):
+        """Пароль хеширует и проверяет сервис"""
+        self.reg_button.config(state="disabled")
+        self.client.submit(
+            "register",
+            lambda result, error: self.dispatcher.post(self.finish_remote_registration, error),
+            email=data["Email"],
+            name=data["Имя"],
+            surname=data["Фамилия"],
+            phone=data["Номер телефона"],
+            password=data["Пароль"]
+        )
+    
+    def finish_remote_registration(self, error):
+        if not self.screens.is_shown("registration"):
+            return
+        self.reg_button.config(state="normal")
+        if error is not None:
+            messagebox.showerror("Ошибка", error)
+            return
+        self.registration_done()
+    
+    def submit_login(self, email, password):
+        self.login_button.config(state="disabled")
+        self.client.submit(
+            "login",
+            lambda result, error: self.dispatcher.post(self.finish_remote_login, email, error),
+            email=email,
+            password=password
+        )
+    
+    def finish_remote_login(self, email, error):
+        if error is None:
+            # Окно банка строится по снимку аккаунта: сначала получаем его
+            self.users.refresh(
+                lambda account, error: self.dispatcher.post(self.finish_remote_account, email, account, error)
+            )
+            return
+        if not self.screens.is_shown("login"):
+            return
+        self.login_button.config(state="normal")
+        messagebox.showerror("Ошибка", error)
+    
+    def finish_remote_account(self, email, account, error):
+        if not self.screens.is_shown("login"):
+            return
+        self.login_button.config(state="normal")
+        if error is not None:
+            messagebox.showerror("Ошибка", error)
+            return
+        self.users.account = account
+        self.complete_login(email)
+    
+    def logout(self):
+        self.client.submit("logout", lambda result, error: None)
+        super().logout()
+        self.users.account = None
 
 if __name__ == "__main__":
-    app = BankApp()
+    parser = argparse.ArgumentParser(description="Банк Онлайн")
+    parser.add_argument("--server",
+                        help="работать тонким клиентом сервиса: host:port или unix:/путь (см. service.py)")
+    parser.add_argument("--storage", choices=sorted(STORAGE_MODES), default="journal",
+                        help="режим хранения данных")
+    parser.add_argument("--flush-interval", type=float, default=0.05,
+                        help="сколько секунд копить операции перед записью")
+    parser.add_argument("--fsync", choices=FSYNC_POLICIES, default="periodic",
+                        help="когда сбрасывать данные на диск")
+    parser.add_argument("--shards", type=int, default=DEFAULT_SHARDS,
+                        help="число шардов в режиме sharded (при изменении база перекладывается)")
+    parser.add_argument("--cache-mb", type=int, default=64,
+                        help="память под аккаунты в режимах sqlite и lazy, МБ")
+    parser.add_argument("--kdf-target-ms", type=int, default=250,
+                        help="желаемое время хеширования пароля (подбирается при запуске)")
+    parser.add_argument("--kdf-iterations", type=int,
+                        help="число итераций PBKDF2 вместо автоматического подбора")
+    parser.add_argument("--metrics-file",
+                        help="файл, куда периодически выгружаются метрики (включает замеры)")
+    parser.add_argument("--metrics-format", choices=("prom", "json"), default="prom",
+                        help="формат выгрузки: текст Prometheus или JSON")
+    parser.add_argument("--metrics-interval", type=float, default=10.0,
+                        help="как часто выгружать метрики, секунд")
+    parser.add_argument("--diagnostics", action="store_true",
+                        help="кнопка с окном диагностики в главном окне (включает замеры)")
+    args = parser.parse_args()
+    options = dict(
+        storage_mode=args.storage,
+        flush_interval=args.flush_interval,
+        fsync=args.fsync,
+        cache_mb=args.cache_mb,
+        shards=args.shards,
+        kdf_target_ms=args.kdf_target_ms,
+        kdf_iterations=args.kdf_iterations,
+        metrics_file=args.metrics_file,
+        metrics_format=args.metrics_format,
+        metrics_interval=args.metrics_interval,
+        diagnostics=args.diagnostics
+    )
+    if args.server:
+        app = ThinClientApp(args.server, **options)
+    else:
+        app = BankApp(**options)
     app.run()
\ No newline at end of file
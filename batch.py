@@ -0,0 +1,262 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from accounts import DATE_FORMAT, format_amount, parse_amount
+from ledger import DuplicateOperation, Ledger, LedgerError
+from storage import STORAGE_MODES, make_storage, tool_lock
+
+BATCH_MODES = ("atomic", "per-row")
+
+
+class BatchReport:
+    """Итог пакетной обработки переводов"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.rows = 0
+        self.applied = 0
+        self.duplicates = 0
+        self.already_processed = False
+        self.total_amount = 0
+        self.errors = []
+        self.committed = False
+        self.validate_seconds = 0.0
+        self.commit_seconds = 0.0
+
+    def add_error(self, row_no, message):
+        self.errors.append({"строка": row_no, "ошибка": message})
+
+    def to_json(self):
+        seconds = self.validate_seconds + self.commit_seconds
+        return {
+            "режим": self.mode,
+            "строк": self.rows,
+            "проведено": self.applied,
+            "повторов": self.duplicates,
+            "пакет_уже_проведен": self.already_processed,
+            "сумма": format_amount(self.total_amount),
+            "ошибок": len(self.errors),
+            "ошибки": self.errors,
+            "сохранено": self.committed,
+            "проверка_сек": round(self.validate_seconds, 4),
+            "запись_сек": round(self.commit_seconds, 4),
+            "строк_в_секунду": round(self.rows / seconds) if seconds else None
+        }
+
+
+class BatchLog:
+    """Проведенные пакеты: файл JSON Lines рядом с данными (``<users>.batches``).
+
+    Строка - хеш файла пакета, время, номера проведенных операций и признак
+    того, что пакет прошел без ошибок. Такой пакет не проводится повторно,
+    сколько бы строк в нем ни было и сколько бы времени ни прошло: номера
+    операций на счетах помнят только последние 64 операции за неделю. Из
+    пакета с ошибками (per-row) при повторном запуске проводятся только
+    строки, которых нет в журнале.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _runs(self, digest):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    continue  # недописанная строка после сбоя
+                run = json.loads(line)
+                if run["файл"] == digest:
+                    yield run
+
+    def __contains__(self, digest):
+        """Пакет уже проведен целиком, без ошибочных строк"""
+        return any(run.get("полностью", True) for run in self._runs(digest))
+
+    def operations(self, digest):
+        """Номера операций, уже проведенных из этого пакета"""
+        return {op_id for run in self._runs(digest) for op_id in run.get("операции", ())}
+
+    def add(self, digest, operations, complete):
+        line = json.dumps({
+            "файл": digest,
+            "дата": datetime.now().strftime(DATE_FORMAT),
+            "проведено": len(operations),
+            "операции": list(operations),
+            "полностью": complete
+        }, ensure_ascii=False)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def file_digest(path):
+    """Начало SHA-256 содержимого файла: из него строятся номера операций строк"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def read_transfers(path, digest=None):
+    """Читаем файл переводов: CSV с колонками sender,recipient,amount или JSONL.
+
+    Отдаем (номер строки, отправитель, получатель, сумма строкой, номер
+    операции); для строки, которую не удалось разобрать, сумма равна None.
+    Номер операции берется из необязательной колонки id, иначе строится из
+    хеша файла и номера строки. Повтор строки по номеру отсекается, пока
+    номер есть среди недавних операций счетов (последние 64 за неделю);
+    повторный запуск всего файла отсекает BatchLog.
+    """
+    digest = digest or file_digest(path)
+    if path.endswith(".jsonl"):
+        with open(path, 'r', encoding='utf-8') as f:
+            for row_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    yield row_no, None, None, None, None
+                    continue
+                op_id = str(row.get("id") or f"{digest}:{row_no}")
+                yield row_no, row.get("sender"), row.get("recipient"), str(row.get("amount", "")), op_id
+    else:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            # Номер строки считаем с заголовком, как в редакторе таблиц
+            for row_no, row in enumerate(csv.DictReader(f), 2):
+                op_id = row.get("id") or f"{digest}:{row_no}"
+                yield row_no, row.get("sender"), row.get("recipient"), row.get("amount") or "", op_id
+
+
+def plan_batch(ledger, rows, report, seen=None):
+    """Проверяем переводы по правилам process_transfer и готовим записи журнала.
+
+    Балансы меняются только в рабочей копии, поэтому каждая строка видит
+    результат предыдущих, а сохраненные аккаунты остаются нетронутыми.
+    Строки с уже проведенным номером операции (в том числе повторенным в
+    этом же файле или из ``seen``) пропускаются и считаются повторами, а не
+    ошибками; номера запланированных операций добавляются в ``seen``.
+    """
+    balances = {}
+    records = []
+    if seen is None:
+        seen = set()
+    for row_no, sender, recipient, amount_str, op_id in rows:
+        report.rows += 1
+        if amount_str is None:
+            report.add_error(row_no, "Не удалось разобрать строку!")
+            continue
+        sender = (sender or "").strip()
+        recipient = (recipient or "").strip()
+        if not sender or not recipient or not amount_str.strip():
+            report.add_error(row_no, "Заполните все поля!")
+            continue
+        try:
+            amount = parse_amount(amount_str.strip())
+        except ValueError:
+            report.add_error(row_no, "Введите корректную сумму!")
+            continue
+        if op_id in seen:
+            report.duplicates += 1
+            continue
+        try:
+            records.append(ledger.transfer_record(sender, recipient, amount, balances, op_id))
+        except DuplicateOperation:
+            report.duplicates += 1
+            continue
+        except LedgerError as e:
+            report.add_error(row_no, str(e))
+            continue
+        if op_id is not None:
+            seen.add(op_id)
+        report.total_amount += amount
+    return records
+
+
+def run_batch(storage, rows, mode="atomic", digest=None, log=None):
+    """Проводим пакет переводов и сохраняем его одним вызовом storage.commit.
+
+    atomic - при любой ошибке не проводится ничего, весь пакет пишется одной
+    записью журнала; per-row - ошибочные строки пропускаются, каждый перевод
+    остается отдельной записью. Если пакет с хешем ``digest`` уже проведен
+    целиком по ``log``, все строки считаются повторами, а строки, проведенные
+    прошлым запуском с ошибками, пропускаются; после сохранения номера
+    проведенных операций дописываются в ``log``.
+    """
+    if mode not in BATCH_MODES:
+        raise ValueError(f"Неизвестный режим пакета: {mode}")
+    report = BatchReport(mode)
+    if log is not None and digest in log:
+        report.already_processed = True
+        for _ in rows:
+            report.rows += 1
+            report.duplicates += 1
+        return report
+    known = log.operations(digest) if log is not None else set()
+    seen = set(known)
+    accounts = storage.load()
+    ledger = Ledger(accounts, storage.commit)
+
+    started = time.perf_counter()
+    records = plan_batch(ledger, rows, report, seen)
+    report.validate_seconds = time.perf_counter() - started
+    planned = len(records)
+
+    if mode == "atomic":
+        if report.errors:
+            return report
+        records = [{
+            "op": "post",
+            "entries": [entry for record in records for entry in record["entries"]]
+        }] if records else []
+
+    started = time.perf_counter()
+    if records:
+        storage.commit(records)
+        report.committed = True
+        if log is not None:
+            log.add(digest, sorted(seen - known), not report.errors)
+    report.commit_seconds = time.perf_counter() - started
+    report.applied = planned if report.committed else 0
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетные переводы из CSV/JSONL")
+    parser.add_argument("path", help="файл переводов (.csv с колонками sender,recipient,amount или .jsonl)")
+    parser.add_argument("--users", default="users.json", help="файл пользователей")
+    parser.add_argument("--storage", choices=STORAGE_MODES, default="journal", help="режим хранения данных")
+    parser.add_argument("--mode", choices=BATCH_MODES, default="atomic", help="все или ничего / построчно")
+    parser.add_argument("--report", help="куда записать отчет в JSON (по умолчанию - в консоль)")
+    args = parser.parse_args(argv)
+
+    digest = file_digest(args.path)
+    storage = make_storage(args.storage, args.users)
+    try:
+        with tool_lock(storage):
+            report = run_batch(
+                storage, read_transfers(args.path, digest), args.mode, digest, BatchLog(args.users + ".batches")
+            )
+    finally:
+        storage.close()
+
+    text = json.dumps(report.to_json(), ensure_ascii=False, indent=4)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0 if report.committed or report.rows == report.duplicates else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from accounts import TxType, make_transaction
+from history_view import HistoryPager
+from ledger import Ledger
+from passwords import hash_password
+from recipients import PrefixIndex
+from storage import STORAGE_MODES, apply_record, make_storage
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+OPERATIONS = ("register", "deposit", "withdraw", "transfer", "history")
+
+
+def synthetic_user(rng, depth, password):
+    """Аккаунт в формате users.json с историей из depth операций"""
+    transactions = []
+    balance = 100000  # копейки
+    for i in range(depth):
+        amount = rng.randint(1, 50000)
+        if rng.random() < 0.5:
+            tx_type = TxType.DEPOSIT
+        else:
+            tx_type, amount = TxType.WITHDRAW, -min(amount, balance)
+        balance += amount
+        date = f"2025-{1 + i % 12:02d}-{1 + i % 28:02d} 12:00:{i % 60:02d}"
+        transactions.append(make_transaction(tx_type, amount, date=date))
+    return {
+        "имя": "Иван",
+        "фамилия": "Тестов",
+        "телефон": "+70000000000",
+        "пароль": password,
+        "баланс": balance / 100,
+        "транзакции": transactions,
+        "активен": True
+    }
+
+
+def generate_population(path, accounts, depth, seed=1):
+    """Пишем users.json с synthetic-аккаунтами, не держа всю базу в памяти"""
+    rng = random.Random(seed)
+    password = hash_password("bench", 1000)
+    with open(path, 'w') as f:
+        f.write("{")
+        for i in range(accounts):
+            if i:
+                f.write(",")
+            f.write(f'{json.dumps(email_for(i))}: {json.dumps(synthetic_user(rng, depth, password))}')
+        f.write("}")
+
+
+def email_for(i):
+    return f"user{i:07d}@bench.local"
+
+
+def percentiles(samples):
+    """Перцентили задержки в миллисекундах"""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+
+    def pick(q):
+        return round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 4)
+
+    total = sum(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": round(samples[-1] * 1000, 4),
+        "ops_per_sec": round(len(samples) / total, 1) if total else None
+    }
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS отдает байты, Linux - килобайты
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+
+def run_scenario(mode, accounts, depth, ops, seed, workdir):
+    """Один прогон: запуск, операции приложения, размеры. Выполняется в отдельном процессе"""
+    rng = random.Random(seed)
+    users_file = os.path.join(workdir, "users.json")
+
+    started = time.perf_counter()
+    storage = make_storage(mode, users_file)
+    users = storage.load()
+    PrefixIndex.build(users.keys())
+    startup = time.perf_counter() - started
+
+    def commit(records):
+        for record in records:
+            apply_record(users, record)
+        storage.commit(records)
+
+    ledger = Ledger(users, commit)
+    password = hash_password("bench", 1000)
+    timings = {name: [] for name in OPERATIONS}
+
+    def timed(name, action):
+        t = time.perf_counter()
+        action()
+        timings[name].append(time.perf_counter() - t)
+
+    for i in range(ops):
+        email = email_for(rng.randrange(accounts))
+        other = email_for(rng.randrange(accounts))
+        new_email = f"new{i:07d}@bench.local"
+        user = synthetic_user(rng, 0, password)
+        timed("register", lambda: ledger.register(new_email, user))
+        timed("deposit", lambda: ledger.deposit(email, rng.randint(100, 10000)))
+        timed("withdraw", lambda: ledger.withdraw(email, 1))
+        if other != email:
+            timed("transfer", lambda: ledger.transfer(email, other, 1))
+        timed("history", lambda: HistoryPager(users[email].history).rows(0, 50))
+    storage.close()
+
+    return {
+        "mode": mode,
+        "accounts": accounts,
+        "history_depth": depth,
+        "startup_sec": round(startup, 4),
+        "peak_rss_kb": peak_rss_kb(),
+        "disk_bytes": directory_size(workdir),
+        "ops": {name: percentiles(samples) for name, samples in timings.items()}
+    }
+
+
+def run_isolated(mode, accounts, depth, ops, seed, template):
+    """Копируем заготовку базы и запускаем прогон в новом процессе,
+    чтобы пиковая память одного режима не влияла на другой"""
+    workdir = tempfile.mkdtemp(prefix=f"bench-{mode}-")
+    try:
+        shutil.copy(template, os.path.join(workdir, "users.json"))
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(1) as pool:
+            return pool.apply(run_scenario, (mode, accounts, depth, ops, seed, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(current, baseline, tolerance):
+    """Сравниваем с прошлым прогоном: p50 и startup не должны вырасти больше чем на tolerance"""
+    regressions = []
+    previous = {(run["mode"], run["accounts"], run["history_depth"]): run for run in baseline["runs"]}
+    for run in current["runs"]:
+        old = previous.get((run["mode"], run["accounts"], run["history_depth"]))
+        if old is None:
+            continue
+        checks = [("startup_sec", run["startup_sec"], old["startup_sec"])]
+        for name, stats in run["ops"].items():
+            if stats and old["ops"].get(name):
+                checks.append((f"{name}.p50_ms", stats["p50_ms"], old["ops"][name]["p50_ms"]))
+        for metric, new_value, old_value in checks:
+            if old_value and new_value > old_value * (1 + tolerance):
+                regressions.append({
+                    "mode": run["mode"],
+                    "accounts": run["accounts"],
+                    "metric": metric,
+                    "baseline": old_value,
+                    "current": new_value
+                })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест хранилищ банка")
+    parser.add_argument("--accounts", type=int, nargs="+", default=[1000, 10000],
+                        help="размеры популяции (например 1000 100000 1000000)")
+    parser.add_argument("--depth", type=int, default=20, help="операций в истории каждого аккаунта")
+    parser.add_argument("--modes", nargs="+", choices=STORAGE_MODES, default=list(STORAGE_MODES))
+    parser.add_argument("--ops", type=int, default=500, help="повторов каждой операции")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="файл для результатов в JSON (по умолчанию - в консоль)")
+    parser.add_argument("--baseline", help="результаты прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args(argv)
+
+    result = {
+        "meta": {
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "depth": args.depth,
+            "ops": args.ops,
+            "seed": args.seed
+        },
+        "runs": []
+    }
+    for accounts in args.accounts:
+        template_dir = tempfile.mkdtemp(prefix="bench-population-")
+        try:
+            template = os.path.join(template_dir, "users.json")
+            generate_population(template, accounts, args.depth, args.seed)
+            for mode in args.modes:
+                run = run_isolated(mode, accounts, args.depth, args.ops, args.seed, template)
+                result["runs"].append(run)
+                print(f"{mode:8} {accounts:>9} аккаунтов: запуск {run['startup_sec']:.3f} с, "
+                      f"перевод p50 {run['ops']['transfer'].get('p50_ms')} мс", file=sys.stderr)
+        finally:
+            shutil.rmtree(template_dir, ignore_errors=True)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            result["regressions"] = compare(result, json.load(f), args.tolerance)
+        status = 1 if result["regressions"] else 0
+
+    text = json.dumps(result, ensure_ascii=False, indent=4)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
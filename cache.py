@@ -0,0 +1,97 @@
+from collections import OrderedDict
+
+# Оценка памяти нового аккаунта без истории, в байтах
+NEW_ACCOUNT_SIZE = 1024
+
+
+class AccountCache:
+    """Словарь пользователей, который подгружает аккаунты из хранилища по запросу.
+
+    Ведет себя как обычный ``self.users``: ``email in users``, ``users[email]``,
+    ``users[email] = user``. Источник должен уметь ``has_account(email)``,
+    ``load_account(email)`` (возвращает ``(user, size)`` или None),
+    ``count_accounts()`` и ``iter_emails()``.
+
+    Давно не использованные аккаунты вытесняются, когда оценка занятой памяти
+    превышает ``max_bytes``. Закрепленные аккаунты (текущий пользователь,
+    аккаунты с несохраненными изменениями) не вытесняются.
+    """
+
+    def __init__(self, source, max_bytes=64 * 1024 * 1024):
+        self.source = source
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._accounts = OrderedDict()
+        self._pins = {}
+
+    def __contains__(self, email):
+        return email in self._accounts or self.source.has_account(email)
+
+    def __getitem__(self, email):
+        entry = self._accounts.get(email)
+        if entry is not None:
+            self.hits += 1
+            self._accounts.move_to_end(email)
+            return entry[0]
+        self.misses += 1
+        loaded = self.source.load_account(email)
+        if loaded is None:
+            raise KeyError(email)
+        user, size = loaded
+        self._store(email, user, size)
+        return user
+
+    def get(self, email, default=None):
+        try:
+            return self[email]
+        except KeyError:
+            return default
+
+    def __setitem__(self, email, user):
+        self._store(email, user, NEW_ACCOUNT_SIZE)
+
+    def __len__(self):
+        return self.source.count_accounts()
+
+    def __iter__(self):
+        return self.source.iter_emails()
+
+    def keys(self):
+        return iter(self)
+
+    def pin(self, email):
+        """Запрещаем вытеснять аккаунт до парного unpin"""
+        self._pins[email] = self._pins.get(email, 0) + 1
+
+    def unpin(self, email):
+        count = self._pins.get(email, 0) - 1
+        if count > 0:
+            self._pins[email] = count
+        else:
+            self._pins.pop(email, None)
+            self._evict()
+
+    def _store(self, email, user, size):
+        old = self._accounts.pop(email, None)
+        if old is not None:
+            self.size -= old[1]
+        self._accounts[email] = (user, size)
+        self.size += size
+        self._evict()
+
+    def _evict(self):
+        """Вытесняем самые старые незакрепленные аккаунты"""
+        if self.size <= self.max_bytes:
+            return
+        victims = []
+        excess = self.size - self.max_bytes
+        for email, (_, size) in self._accounts.items():
+            if excess <= 0:
+                break
+            if email not in self._pins:
+                victims.append(email)
+                excess -= size
+        for email in victims:
+            self.size -= self._accounts.pop(email)[1]
@@ -0,0 +1,306 @@
+import itertools
+import json
+import queue
+import socket
+import threading
+import time
+from collections.abc import Sequence
+
+from accounts import Turnover
+from ledger import LedgerError
+from service import encode, parse_address
+
+# Как часто поток чтения просыпается без данных, чтобы завершить просроченные запросы
+POLL_SECONDS = 0.5
+# Страниц потокового ответа, которые ждут разбора; дальше читатель ждет потребителя,
+# а сервис - читателя (см. LedgerService.send_page)
+STREAM_PAGES = 4
+
+
+class LedgerClient:
+    """Клиент сервиса (service.py): запросы можно слать из любого потока.
+
+    Запросы отправляются сразу, не дожидаясь ответов на предыдущие, а поток
+    чтения раздает ответы по id. ``request`` ждет ответ, ``submit`` вызывает
+    ``callback(result, error)`` из потока чтения, ``stream`` отдает страницы
+    по мере прихода. Если ответа (или следующей страницы) нет дольше
+    ``timeout`` секунд, запрос завершается ошибкой.
+    """
+
+    def __init__(self, address, timeout=10.0):
+        kind, *where = parse_address(address)
+        if kind == "unix":
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._sock.settimeout(timeout)
+            self._sock.connect(where[0])
+        else:
+            self._sock = socket.create_connection((where[0], where[1]), timeout=timeout)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Чтение просыпается раз в POLL_SECONDS, отправка маленького запроса
+        # дольше этого значит, что сервис не читает соединение
+        self._sock.settimeout(POLL_SECONDS)
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        # id -> [обработчик кадров, срок ответа]
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read, name="ledger-client", daemon=True)
+        self._reader.start()
+
+    def _send(self, op, args, handler):
+        """Отправляем запрос; ответы получит handler(frame). Возвращает id запроса"""
+        with self._lock:
+            request_id = next(self._ids)
+            self._handlers[request_id] = [handler, time.monotonic() + self.timeout]
+        try:
+            with self._send_lock:
+                self._sock.sendall(encode({"id": request_id, "op": op, **args}))
+        except OSError as e:
+            # Запрос мог уйти частично, соединением больше пользоваться нельзя
+            self._forget(request_id)
+            self._shutdown()
+            raise LedgerError(f"Нет связи с сервером: {e}")
+        return request_id
+
+    def _forget(self, request_id):
+        """Снимаем обработчик: ответы на запрос дальше отбрасываются"""
+        with self._lock:
+            self._handlers.pop(request_id, None)
+
+    def _read(self):
+        buffer = bytearray()
+        try:
+            while True:
+                try:
+                    data = self._sock.recv(1 << 16)
+                except socket.timeout:
+                    # Сервис молчит: пора проверить сроки ожидающих запросов
+                    self._expire()
+                    continue
+                if not data:
+                    break
+                buffer += data
+                end = buffer.rfind(b"\n")
+                if end >= 0:
+                    for line in bytes(buffer[:end]).split(b"\n"):
+                        self._dispatch(json.loads(line))
+                    del buffer[:end + 1]
+        except OSError:
+            pass
+        # Соединение закрыто: ожидающие запросы завершаем ошибкой
+        with self._lock:
+            handlers, self._handlers = self._handlers, {}
+        for request_id, (handler, _) in handlers.items():
+            handler({"id": request_id, "ok": False, "error": "Нет связи с сервером"})
+
+    def _dispatch(self, frame):
+        with self._lock:
+            if "page" in frame:
+                pending = self._handlers.get(frame["id"])
+            else:
+                pending = self._handlers.pop(frame["id"], None)
+        if pending is None:
+            return
+        pending[0](frame)
+        if "page" in frame:
+            # Срок считаем от момента, когда потребитель забрал страницу
+            pending[1] = time.monotonic() + self.timeout
+
+    def _expire(self):
+        """Завершаем ошибкой запросы, на которые сервис не ответил вовремя"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                (request_id, self._handlers.pop(request_id)[0])
+                for request_id, (_, deadline) in list(self._handlers.items())
+                if deadline <= now
+            ]
+        for request_id, handler in expired:
+            handler({"id": request_id, "ok": False, "error": "Сервер не отвечает"})
+
+    def submit(self, op, callback, **args):
+        """Асинхронный запрос: callback(result, error) вызывается из потока чтения"""
+        def handle(frame):
+            if frame.get("ok"):
+                callback(frame.get("result"), None)
+            else:
+                callback(None, frame.get("error"))
+        try:
+            self._send(op, args, handle)
+        except LedgerError as e:
+            callback(None, str(e))
+
+    def request(self, op, **args):
+        """Запрос с ожиданием ответа (не дольше timeout); ошибка сервиса - LedgerError"""
+        replies = queue.Queue()
+        self._send(op, args, replies.put)
+        frame = replies.get()
+        if not frame.get("ok"):
+            raise LedgerError(frame.get("error"))
+        return frame.get("result")
+
+    def stream(self, op, **args):
+        """Страницы потокового ответа по мере прихода.
+
+        Непрочитанных страниц не больше STREAM_PAGES. Если потребитель бросил
+        поток, обработчик снимается, а остаток ответа отбрасывается.
+        """
+        replies = queue.Queue(STREAM_PAGES)
+        cancelled = threading.Event()
+
+        def handle(frame):
+            while not cancelled.is_set():
+                try:
+                    replies.put(frame, timeout=POLL_SECONDS)
+                    return
+                except queue.Full:
+                    continue
+
+        request_id = self._send(op, args, handle)
+        try:
+            while True:
+                frame = replies.get()
+                if "page" in frame:
+                    yield frame["page"]
+                    continue
+                if not frame.get("ok"):
+                    raise LedgerError(frame.get("error"))
+                return
+        finally:
+            cancelled.set()
+            self._forget(request_id)
+
+    def _shutdown(self):
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self._shutdown()
+        self._sock.close()
+        self._reader.join()
+
+
+class RemoteHistory(Sequence):
+    """История текущего пользователя на сервере; срезы читаются потоком страниц.
+
+    С условием ``query`` (HistoryQuery) номера относятся к отобранным операциям:
+    фильтр выполняет сервис по индексам истории.
+    """
+
+    def __init__(self, client, count, query=None):
+        self.client = client
+        self.count = count
+        self.query = query
+
+    def _args(self):
+        return {} if self.query is None else {"query": self.query.to_json()}
+
+    def select(self, query):
+        result = self.client.request("history", start=0, stop=0, query=query.to_json())
+        return RemoteHistory(self.client, result["total"], query)
+
+    def scan(self, query):
+        """Потоковый отбор для выгрузки, как History.scan: фильтр выполняет сервис"""
+        selection = self.select(query)
+        return selection.count, self._scan(selection)
+
+    @staticmethod
+    def _scan(selection):
+        done = 0
+        for page in selection.client.stream("history", start=0, stop=selection.count, **selection._args()):
+            for tx in page:
+                done += 1
+                yield done, tx
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            pages = self.client.stream("history", start=start, stop=stop, **self._args())
+            rows = [tx for page in pages for tx in page]
+            return rows[::step] if step != 1 else rows
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self[index:index + 1][0]
+
+
+class RemoteAccount:
+    """Снимок аккаунта с сервера с теми же полями, что у Account"""
+
+    def __init__(self, client, data):
+        self.name = data["name"]
+        self.surname = data["surname"]
+        self.balance = data["balance"]
+        self.active = data["active"]
+        self.history = RemoteHistory(client, data["history"])
+        self.turnover = Turnover.from_json(data["turnover"])
+
+
+class RemoteAccounts:
+    """``self.users`` тонкого клиента: снимок аккаунта вошедшего пользователя.
+
+    Снимок запрашивает ``refresh`` в фоне, а окно читает его без обращения к
+    сервису.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.account = None
+
+    def refresh(self, callback):
+        """Запрашиваем свежий снимок; callback(account, error) вызывается из потока чтения"""
+        def done(result, error):
+            callback(RemoteAccount(self.client, result) if error is None else None, error)
+        self.client.submit("account", done)
+
+    def __getitem__(self, email):
+        return self.account
+
+
+class RemoteLedger:
+    """Операции Ledger, которые выполняет сервис.
+
+    Ответ приходит в ``callback(applied, error)`` из потока чтения: applied
+    False - операция с этим номером уже проведена, error - LedgerError.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def _submit(self, op, callback, **args):
+        def done(result, error):
+            if error is not None:
+                callback(None, LedgerError(error))
+            else:
+                callback(not result["duplicate"], None)
+        self.client.submit(op, done, **args)
+
+    def deposit(self, email, amount, op_id, callback):
+        self._submit("deposit", callback, amount=amount, op_id=op_id)
+
+    def withdraw(self, email, amount, op_id, callback):
+        self._submit("withdraw", callback, amount=amount, op_id=op_id)
+
+    def transfer(self, sender, recipient, amount, op_id, callback):
+        self._submit("transfer", callback, recipient=recipient, amount=amount, op_id=op_id)
+
+
+class RemoteRecipients:
+    """Подсказки получателей из индекса сервиса"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def search(self, prefix, limit, callback):
+        """callback(emails) вызывается из потока чтения; при ошибке список пуст"""
+        if not prefix.strip():
+            callback([])
+            return
+        self.client.submit("search", lambda result, error: callback(result or []), prefix=prefix, limit=limit)
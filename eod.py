@@ -0,0 +1,358 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from array import array
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from accounts import DATE_FORMAT, TxType, format_amount, make_transaction, parse_amount
+from ledger import entry
+from storage import STORAGE_MODES, make_storage, tool_lock
+
+try:
+    import numpy
+except ImportError:  # без NumPy считаем по колонкам array
+    numpy = None
+
+DAYS_IN_YEAR = 365
+# Ставка хранится в сотых долях процента: 5.25% -> 525
+RATE_SCALE = 100 * 100
+
+INTEREST_DESCRIPTION = "Начисление процентов на остаток"
+FEE_DESCRIPTION = "Комиссия за обслуживание счета"
+
+
+class EodRules:
+    """Правила закрытия дня; все суммы в копейках.
+
+    - проценты: остаток * годовая ставка / 365, с округлением вниз, только
+      на остаток не меньше ``interest_min``, не больше ``interest_cap`` в день;
+    - комиссия: ``fee`` со счетов, где остаток после процентов меньше
+      ``fee_below``, но не больше самого остатка - счет не уходит в минус.
+
+    Заблокированные счета не трогаются.
+    """
+
+    def __init__(self, annual_rate_bp=0, interest_min=0, interest_cap=None, fee=0, fee_below=0):
+        self.annual_rate_bp = annual_rate_bp
+        self.interest_min = interest_min
+        self.interest_cap = interest_cap
+        self.fee = fee
+        self.fee_below = fee_below
+
+    def to_json(self):
+        return {
+            "ставка_годовых": f"{Decimal(self.annual_rate_bp) / 100}%",
+            "проценты_от_остатка": format_amount(self.interest_min),
+            "проценты_не_больше": None if self.interest_cap is None else format_amount(self.interest_cap),
+            "комиссия": format_amount(self.fee),
+            "комиссия_при_остатке_меньше": format_amount(self.fee_below)
+        }
+
+
+def parse_rate(text):
+    """Годовая ставка в процентах ("5,25") -> сотые доли процента"""
+    try:
+        value = Decimal(text.replace(",", "."))
+    except InvalidOperation:
+        raise ValueError(f"Некорректная ставка: {text}")
+    if not value.is_finite() or value < 0:
+        raise ValueError(f"Некорректная ставка: {text}")
+    return int(value * 100)
+
+
+class Columns:
+    """Балансы клиентов колонками: email, баланс в копейках, активен"""
+
+    def __init__(self):
+        self.emails = []
+        self.balances = array("q")
+        self.active = array("b")
+
+    def __len__(self):
+        return len(self.emails)
+
+    def append(self, email, balance, active):
+        self.emails.append(email)
+        self.balances.append(balance)
+        self.active.append(active)
+
+
+def load_columns(storage, users):
+    """Читаем только балансы: SQLite отдает их запросом, без загрузки аккаунтов"""
+    columns = Columns()
+    if hasattr(storage, "iter_balances"):
+        for email, balance, active in storage.iter_balances():
+            columns.append(email, balance, active)
+        return columns
+    for email in users.keys():
+        account = users[email]
+        columns.append(email, account.balance, account.active)
+    return columns
+
+
+def compute_numpy(columns, rules):
+    balances = numpy.frombuffer(columns.balances, dtype=numpy.int64)
+    active = numpy.frombuffer(columns.active, dtype=numpy.int8).astype(bool)
+    interest = balances * rules.annual_rate_bp // (DAYS_IN_YEAR * RATE_SCALE)
+    interest[~active | (balances < rules.interest_min) | (interest < 0)] = 0
+    if rules.interest_cap is not None:
+        numpy.minimum(interest, rules.interest_cap, out=interest)
+    after = balances + interest
+    fees = numpy.minimum(rules.fee, numpy.maximum(after, 0))
+    fees[~active | (after >= rules.fee_below)] = 0
+    return array("q", interest.tobytes()), array("q", fees.tobytes())
+
+
+def compute_columns(columns, rules):
+    """То же без NumPy: проход по колонкам встроенными функциями, без объектов аккаунтов"""
+    rate, divisor = rules.annual_rate_bp, DAYS_IN_YEAR * RATE_SCALE
+    low = rules.interest_min
+    cap = rules.interest_cap
+    interest = array("q", [
+        max(balance * rate // divisor, 0) if active and balance >= low else 0
+        for balance, active in zip(columns.balances, columns.active)
+    ])
+    if cap is not None:
+        interest = array("q", [min(value, cap) for value in interest])
+    fee, below = rules.fee, rules.fee_below
+    fees = array("q", [
+        min(fee, max(balance + value, 0)) if active and balance + value < below else 0
+        for balance, value, active in zip(columns.balances, interest, columns.active)
+    ])
+    return interest, fees
+
+
+def compute(columns, rules, engine=None):
+    """Проценты и комиссии по колонкам: (engine, проценты, комиссии)"""
+    engine = engine or ("numpy" if numpy is not None else "array")
+    if engine == "numpy":
+        return engine, *compute_numpy(columns, rules)
+    return engine, *compute_columns(columns, rules)
+
+
+class EodLog:
+    """Закрытые дни: файл JSON Lines рядом с данными (``<users>.eod``).
+
+    Строка - день, время запуска и число начислений. День из этого списка
+    второй раз не закрывается, сколько бы счетов ни было: аккаунты при этом
+    не читаются, а номера операций на счетах (последние 64 за неделю)
+    нужны только на случай сбоя между записью начислений и строкой журнала.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __contains__(self, day):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return any(json.loads(line)["день"] == day for line in f if line.endswith("\n"))
+
+    def add(self, day, date, interest_accounts, fee_accounts):
+        line = json.dumps({
+            "день": day,
+            "дата": date,
+            "проценты_счетов": interest_accounts,
+            "комиссия_счетов": fee_accounts
+        }, ensure_ascii=False)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def eod_day(date):
+    return date[:10]
+
+
+def eod_operation_id(date, kind, email):
+    """Номер начисления kind ("interest"/"fee") счета за день.
+
+    У каждого счета свой номер: проводки с общим номером хранилище
+    пропускает только вместе, и известный номер одного счета отбросил бы
+    начисления всех остальных.
+    """
+    return f"eod:{eod_day(date)}:{kind}:{email}"
+
+
+def build_record(columns, interest, fees, date=None):
+    """Одна запись журнала со всеми начислениями дня - пакет сохраняется целиком.
+
+    Начисления несут номера операций дня (eod_operation_id), поэтому
+    хранилище не проведет их второй раз, даже если запись повторится.
+    """
+    date = date or datetime.now().strftime(DATE_FORMAT)
+    entries = []
+    for i in changed_rows(interest, fees):
+        email = columns.emails[i]
+        if interest[i]:
+            entries.append(entry(
+                email,
+                make_transaction(TxType.INTEREST, interest[i], INTEREST_DESCRIPTION, date),
+                eod_operation_id(date, "interest", email)
+            ))
+        if fees[i]:
+            entries.append(entry(
+                email,
+                make_transaction(TxType.FEE, -fees[i], FEE_DESCRIPTION, date),
+                eod_operation_id(date, "fee", email)
+            ))
+    return {"op": "post", "entries": entries} if entries else None
+
+
+def changed_rows(interest, fees):
+    return (i for i, (value, fee) in enumerate(zip(interest, fees)) if value or fee)
+
+
+def write_diff(path, columns, interest, fees):
+    """Разница до/после по измененным счетам (CSV), пишется построчно"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(("email", "баланс_до", "проценты", "комиссия", "баланс_после"))
+        for i in changed_rows(interest, fees):
+            balance = columns.balances[i]
+            writer.writerow((
+                columns.emails[i],
+                format_amount(balance),
+                format_amount(interest[i]),
+                format_amount(fees[i]),
+                format_amount(balance + interest[i] - fees[i])
+            ))
+
+
+class EodReport:
+    """Итог закрытия дня с временем каждого этапа"""
+
+    def __init__(self, rules, dry_run):
+        self.rules = rules
+        self.dry_run = dry_run
+        self.engine = None
+        self.accounts = 0
+        self.interest_accounts = 0
+        self.interest_total = 0
+        self.fee_accounts = 0
+        self.fee_total = 0
+        self.already_closed = False
+        self.committed = False
+        self.seconds = {}
+
+    def to_json(self):
+        total = sum(self.seconds.values())
+        return {
+            "правила": self.rules.to_json(),
+            "пробный_прогон": self.dry_run,
+            "вычисления": self.engine,
+            "счетов": self.accounts,
+            "проценты_счетов": self.interest_accounts,
+            "проценты_сумма": format_amount(self.interest_total),
+            "комиссия_счетов": self.fee_accounts,
+            "комиссия_сумма": format_amount(self.fee_total),
+            "день_уже_закрыт": self.already_closed,
+            "сохранено": self.committed,
+            "секунды": {name: round(value, 4) for name, value in self.seconds.items()},
+            "счетов_в_секунду": round(self.accounts / total) if total else None
+        }
+
+
+def run_eod(storage, rules, dry_run=False, diff_path=None, engine=None, log=None):
+    """Закрываем день: балансы -> колонки -> начисления -> одна запись storage.commit.
+
+    Если день уже есть в ``log`` (EodLog), ничего не считается и не
+    сохраняется; после сохранения день дописывается в ``log``.
+    """
+    report = EodReport(rules, dry_run)
+    # Одна дата на весь запуск: по ней строятся номера операций дня
+    date = datetime.now().strftime(DATE_FORMAT)
+    if log is not None and eod_day(date) in log:
+        report.already_closed = True
+        return report
+
+    started = time.perf_counter()
+    users = storage.load()
+    report.seconds["загрузка"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    columns = load_columns(storage, users)
+    report.seconds["колонки"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    report.engine, interest, fees = compute(columns, rules, engine)
+    report.seconds["расчет"] = time.perf_counter() - started
+
+    report.accounts = len(columns)
+    report.interest_accounts = sum(1 for value in interest if value)
+    report.interest_total = sum(interest)
+    report.fee_accounts = sum(1 for value in fees if value)
+    report.fee_total = sum(fees)
+
+    if diff_path:
+        started = time.perf_counter()
+        write_diff(diff_path, columns, interest, fees)
+        report.seconds["разница"] = time.perf_counter() - started
+    if dry_run:
+        return report
+
+    started = time.perf_counter()
+    record = build_record(columns, interest, fees, date)
+    report.seconds["записи"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    if record is not None:
+        storage.commit([record])
+        report.committed = True
+    if log is not None:
+        log.add(eod_day(date), date, report.interest_accounts, report.fee_accounts)
+    report.seconds["сохранение"] = time.perf_counter() - started
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Закрытие дня: проценты на остаток и комиссии")
+    parser.add_argument("--users", default="users.json", help="файл пользователей")
+    parser.add_argument("--storage", choices=STORAGE_MODES, default="journal", help="режим хранения данных")
+    parser.add_argument("--rate", default="0", help="годовая ставка, %%")
+    parser.add_argument("--interest-min", default="0", help="проценты начисляются на остаток от этой суммы")
+    parser.add_argument("--interest-cap", help="проценты за день не больше этой суммы")
+    parser.add_argument("--fee", default="0", help="комиссия за обслуживание")
+    parser.add_argument("--fee-below", default="0", help="комиссия берется, если остаток меньше этой суммы")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать, ничего не сохранять")
+    parser.add_argument("--diff", help="куда записать разницу до/после по счетам (CSV)")
+    parser.add_argument("--engine", choices=("numpy", "array"), help="способ расчета (по умолчанию - NumPy, если есть)")
+    parser.add_argument("--report", help="куда записать отчет в JSON (по умолчанию - в консоль)")
+    args = parser.parse_args(argv)
+
+    if args.engine == "numpy" and numpy is None:
+        parser.error("NumPy не установлен")
+    try:
+        rules = EodRules(
+            annual_rate_bp=parse_rate(args.rate),
+            interest_min=parse_amount(args.interest_min),
+            interest_cap=parse_amount(args.interest_cap) if args.interest_cap else None,
+            fee=parse_amount(args.fee),
+            fee_below=parse_amount(args.fee_below)
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    storage = make_storage(args.storage, args.users)
+    try:
+        with tool_lock(storage):
+            report = run_eod(storage, rules, args.dry_run, args.diff, args.engine, EodLog(args.users + ".eod"))
+    finally:
+        storage.close()
+
+    text = json.dumps(report.to_json(), ensure_ascii=False, indent=4)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
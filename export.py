@@ -0,0 +1,217 @@
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+
+from accounts import TX_TYPES, HistoryQuery, parse_amount, parse_date_bound
+from metrics import METRICS
+from storage import STORAGE_MODES, make_storage
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_COLUMNS = ("email", "дата", "тип", "сумма", "описание")
+# Как часто сообщаем о ходе выгрузки и проверяем отмену
+PROGRESS_SECONDS = 0.2
+CHECK_EVERY = 256
+
+
+class ExportCancelled(Exception):
+    """Выгрузку отменил пользователь"""
+
+
+def export_format(path):
+    """Формат и сжатие по имени файла: users.csv, audit.jsonl.gz"""
+    name = path.lower()
+    compress = name.endswith(".gz")
+    if compress:
+        name = name[:-len(".gz")]
+    fmt = "jsonl" if name.endswith(".jsonl") else "csv"
+    return fmt, compress
+
+
+def account_rows(email, history, query):
+    """Источник одного счета: (всего, пары (пройдено, строка выгрузки)).
+
+    Фильтр выполняет сама история (индексы, SQL или сервис), поэтому до
+    записи доходят только отобранные операции.
+    """
+    total, scanned = history.scan(query)
+    return total, ((done, {"email": email, **tx}) for done, tx in scanned)
+
+
+def audit_rows(users, query):
+    """Источник для аудита: все счета по очереди, прогресс - число счетов"""
+    total = len(users)
+
+    def rows():
+        for done, email in enumerate(users.keys(), 1):
+            _, scanned = users[email].history.scan(query)
+            for _, tx in scanned:
+                yield done - 1, {"email": email, **tx}
+            yield done, None
+    return total, rows()
+
+
+def write_csv(rows, out):
+    writer = csv.writer(out)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow((row["email"], row["дата"], row["тип"], f"{row['сумма']:.2f}", row["описание"]))
+
+
+def write_jsonl(rows, out):
+    for row in rows:
+        out.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl}
+
+
+def open_output(path, compress):
+    if compress:
+        return gzip.open(path, 'wt', compresslevel=6, encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def export(source, path, fmt="csv", compress=False, progress=None, cancelled=None):
+    """Выгружаем операции из source в файл; возвращаем число строк.
+
+    ``source()`` возвращает (всего, пары (пройдено, строка)), строка None
+    только продвигает прогресс. Строки идут по цепочке генераторов прямо в
+    файл, поэтому память не зависит от длины истории. ``progress(пройдено,
+    всего, строк)`` вызывается не чаще раза в PROGRESS_SECONDS; если
+    ``cancelled()`` вернула True, выгрузка прерывается с ExportCancelled.
+    Файл пишется рядом и заменяет старый только после успешной записи.
+    """
+    counter = {"rows": 0}
+
+    def watched(total, items):
+        reported = time.monotonic()
+        done = 0
+        for n, (done, row) in enumerate(items):
+            if n % CHECK_EVERY == 0:
+                if cancelled is not None and cancelled():
+                    raise ExportCancelled()
+                now = time.monotonic()
+                if progress is not None and now - reported >= PROGRESS_SECONDS:
+                    progress(done, total, counter["rows"])
+                    reported = now
+            if row is not None:
+                counter["rows"] += 1
+                yield row
+        if progress is not None:
+            progress(total, total, counter["rows"])
+
+    tmp_path = path + ".tmp"
+    try:
+        with METRICS.timer("export"), open_output(tmp_path, compress) as out:
+            WRITERS[fmt](watched(*source()), out)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    METRICS.count("export_rows", counter["rows"])
+    return counter["rows"]
+
+
+class ExportJob:
+    """Выгрузка в фоновом потоке, чтобы окно не замирало на длинной истории.
+
+    Результаты передаются через ``notify`` (UiDispatcher.post):
+    ``on_progress(пройдено, всего, строк)`` и ``on_done(строк, ошибка)``;
+    после отмены on_done получает строк=None без ошибки. on_done вызывается
+    всегда, при любой ошибке, иначе окно осталось бы ждать выгрузку.
+    """
+
+    def __init__(self, source, path, notify, on_progress, on_done):
+        self.source = source
+        self.path = path
+        self.notify = notify
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="export", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _run(self):
+        try:
+            fmt, compress = export_format(self.path)
+            rows = export(
+                self.source,
+                self.path,
+                fmt,
+                compress,
+                progress=lambda *args: self.notify(self.on_progress, *args),
+                cancelled=self._cancel.is_set
+            )
+            self.notify(self.on_done, rows, None)
+        except ExportCancelled:
+            self.notify(self.on_done, None, None)
+        except Exception as e:
+            self.notify(self.on_done, None, str(e))
+
+
+def query_from_args(args):
+    return HistoryQuery(
+        date_from=parse_date_bound(args.date_from) if args.date_from else None,
+        date_to=parse_date_bound(args.date_to, end=True) if args.date_to else None,
+        types=[TX_TYPES[args.type]] if args.type else None,
+        amount_min=abs(parse_amount(args.amount_min)) if args.amount_min else None,
+        amount_max=abs(parse_amount(args.amount_max)) if args.amount_max else None,
+        counterparty=args.counterparty
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Выгрузка операций в CSV/JSONL для аудита")
+    parser.add_argument("out", help="файл выгрузки: .csv, .jsonl, с .gz - со сжатием")
+    parser.add_argument("--users", default="users.json", help="файл пользователей")
+    parser.add_argument("--storage", choices=STORAGE_MODES, default="journal", help="режим хранения данных")
+    parser.add_argument("--email", help="выгрузить только этот счет (по умолчанию - все)")
+    parser.add_argument("--from", dest="date_from", help="с даты ГГГГ-ММ-ДД")
+    parser.add_argument("--to", dest="date_to", help="по дату ГГГГ-ММ-ДД включительно")
+    parser.add_argument("--type", choices=sorted(TX_TYPES), help="тип операции")
+    parser.add_argument("--amount-min", help="сумма от (по модулю)")
+    parser.add_argument("--amount-max", help="сумма до (по модулю)")
+    parser.add_argument("--counterparty", help="email второго участника перевода")
+    args = parser.parse_args(argv)
+
+    query = query_from_args(args)
+    storage = make_storage(args.storage, args.users)
+    try:
+        users = storage.load()
+        if args.email:
+            if args.email not in users:
+                print(f"Пользователь не найден: {args.email}", file=sys.stderr)
+                return 1
+            source = lambda: account_rows(args.email, users[args.email].history, query)
+        else:
+            source = lambda: audit_rows(users, query)
+
+        def progress(done, total, rows):
+            print(f"\r{done}/{total}, строк: {rows}", end="", file=sys.stderr, flush=True)
+
+        fmt, compress = export_format(args.out)
+        started = time.perf_counter()
+        try:
+            rows = export(source, args.out, fmt, compress, progress=progress)
+        except KeyboardInterrupt:
+            print("\nВыгрузка прервана", file=sys.stderr)
+            return 1
+        print(f"\nВыгружено строк: {rows} за {time.perf_counter() - started:.2f} с", file=sys.stderr)
+    finally:
+        storage.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+import tkinter as tk
+from collections import OrderedDict
+from tkinter import ttk
+
+from accounts import TX_LABELS, TX_TYPES, HistoryQuery, parse_amount, parse_date_bound
+from metrics import METRICS
+
+ALL_TYPES = "Все"
+
+
+class HistoryPager:
+    """Оконный источник данных над историей: строки от новых к старым, страницами.
+
+    История может быть списком или ленивой последовательностью из хранилища;
+    нужны только ``len`` и срезы. Последние прочитанные страницы кешируются.
+    """
+
+    def __init__(self, history, page_size=200, cached_pages=8):
+        self.history = history
+        self.page_size = page_size
+        self.cached_pages = cached_pages
+        self._pages = OrderedDict()
+
+    def __len__(self):
+        return len(self.history)
+
+    def rows(self, first, count):
+        """Строки с номерами [first, first + count), нулевая - самая новая"""
+        total = len(self.history)
+        last = min(first + count, total)
+        result = []
+        index = first
+        while index < last:
+            page_no = index // self.page_size
+            page = self._page(page_no, total)
+            offset = index - page_no * self.page_size
+            taken = page[offset:offset + last - index]
+            result.extend(taken)
+            index += len(taken)
+        return result
+
+    def _page(self, page_no, total):
+        key = (page_no, total)
+        page = self._pages.get(key)
+        if page is not None:
+            self._pages.move_to_end(key)
+            return page
+        # Страница page_no в обратном порядке - это срез с конца истории
+        stop = total - page_no * self.page_size
+        start = max(stop - self.page_size, 0)
+        page = list(reversed(self.history[start:stop]))
+        self._pages[key] = page
+        if len(self._pages) > self.cached_pages:
+            self._pages.popitem(last=False)
+        return page
+
+
+def format_row(transaction):
+    """Транзакция -> значения колонок таблицы"""
+    amount = transaction["сумма"]
+    amount_str = f"+{amount:.2f}" if amount > 0 else f"{amount:.2f}"
+    return (
+        transaction["дата"],
+        transaction["тип"],
+        amount_str,
+        transaction.get("описание", "")
+    )
+
+
+class VirtualHistoryView(tk.Frame):
+    """Таблица истории, в которой существуют только видимые строки.
+
+    Treeview держит фиксированный набор элементов, при прокрутке у них меняются
+    значения. Поэтому окно открывается одинаково быстро при любой длине истории.
+    """
+
+    columns = ("Дата", "Тип", "Сумма", "Описание")
+
+    def __init__(self, parent, pager, visible_rows=14, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.pager = pager
+        self.first = 0
+        self.visible_rows = visible_rows
+        self._items = []
+
+        self.scrollbar = ttk.Scrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.tree = ttk.Treeview(self, columns=self.columns, show="headings", height=visible_rows)
+        self.tree.heading("Дата", text="Дата")
+        self.tree.heading("Тип", text="Тип операции")
+        self.tree.heading("Сумма", text="Сумма (₽)")
+        self.tree.heading("Описание", text="Описание")
+        self.tree.column("Дата", width=120)
+        self.tree.column("Тип", width=100)
+        self.tree.column("Сумма", width=100)
+        self.tree.column("Описание", width=150)
+        self.tree.pack(fill="both", expand=True)
+
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<MouseWheel>", self.on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self.scroll_to(self.first - 3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_to(self.first + 3))
+        self.tree.bind("<Prior>", lambda e: self.scroll_to(self.first - self.visible_rows))
+        self.tree.bind("<Next>", lambda e: self.scroll_to(self.first + self.visible_rows))
+        self.tree.bind("<Home>", lambda e: self.scroll_to(0))
+        self.tree.bind("<End>", lambda e: self.scroll_to(len(self.pager)))
+
+        self.render()
+
+    def on_resize(self, event):
+        """Подстраиваем число видимых строк под высоту окна"""
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        rows = max(1, (event.height - row_height) // row_height)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.render()
+
+    def on_mousewheel(self, event):
+        step = -1 if event.delta > 0 else 1
+        self.scroll_to(self.first + 3 * step)
+
+    def on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * len(self.pager)))
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll_to(self.first + int(value) * step)
+
+    def set_pager(self, pager):
+        """Показываем другой источник строк (например, после смены фильтра)"""
+        self.pager = pager
+        self.first = 0
+        self.render()
+
+    def scroll_to(self, first):
+        total = len(self.pager)
+        first = max(0, min(first, total - self.visible_rows))
+        if first != self.first:
+            self.first = first
+            self.render()
+
+    def render(self):
+        """Показываем строки, начиная с self.first"""
+        with METRICS.timer("history_render"):
+            self._render()
+
+    def _render(self):
+        rows = self.pager.rows(self.first, self.visible_rows)
+        METRICS.count("history_rows_rendered", len(rows))
+        while len(self._items) < len(rows):
+            self._items.append(self.tree.insert("", "end"))
+        while len(self._items) > len(rows):
+            self.tree.delete(self._items.pop())
+        for item, transaction in zip(self._items, rows):
+            self.tree.item(item, values=format_row(transaction))
+
+        total = len(self.pager)
+        if total:
+            self.scrollbar.set(self.first / total, (self.first + len(rows)) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+
+class HistoryFilterBar(tk.Frame):
+    """Поля фильтра истории: даты, тип, суммы и второй участник перевода.
+
+    ``on_change(query)`` вызывается через небольшую паузу после ввода, чтобы
+    не искать на каждое нажатие клавиши; query - HistoryQuery или None, если
+    в полях ошибка.
+    """
+
+    DELAY_MS = 200
+
+    def __init__(self, parent, on_change, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.on_change = on_change
+        self._pending = None
+        bg = kwargs.get("bg")
+
+        self.date_from = self._entry("Дата с", 0, 0, bg)
+        self.date_to = self._entry("по", 0, 2, bg)
+        self.amount_min = self._entry("Сумма от", 1, 0, bg)
+        self.amount_max = self._entry("до", 1, 2, bg)
+
+        tk.Label(self, text="Тип", bg=bg).grid(row=0, column=4, sticky="e", padx=(10, 2))
+        self.tx_type = ttk.Combobox(
+            self, values=[ALL_TYPES] + list(TX_LABELS.values()), state="readonly", width=12
+        )
+        self.tx_type.set(ALL_TYPES)
+        self.tx_type.grid(row=0, column=5, sticky="w")
+        self.tx_type.bind("<<ComboboxSelected>>", lambda e: self.changed())
+
+        tk.Label(self, text="Email", bg=bg).grid(row=1, column=4, sticky="e", padx=(10, 2))
+        self.counterparty = tk.Entry(self, width=15)
+        self.counterparty.grid(row=1, column=5, sticky="w")
+        self.counterparty.bind("<KeyRelease>", lambda e: self.changed())
+
+    def _entry(self, label, row, column, bg):
+        tk.Label(self, text=label, bg=bg).grid(row=row, column=column, sticky="e", padx=(0, 2))
+        entry = tk.Entry(self, width=11)
+        entry.grid(row=row, column=column + 1, sticky="w", pady=2)
+        entry.bind("<KeyRelease>", lambda e: self.changed())
+        return entry
+
+    def clear(self):
+        """Пустой фильтр без вызова on_change (окно открывается заново)"""
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+            self._pending = None
+        for entry in (self.date_from, self.date_to, self.amount_min, self.amount_max, self.counterparty):
+            entry.delete(0, "end")
+        self.tx_type.set(ALL_TYPES)
+
+    def changed(self):
+        if self._pending is not None:
+            self.after_cancel(self._pending)
+        self._pending = self.after(self.DELAY_MS, self._apply)
+
+    def _apply(self):
+        self._pending = None
+        try:
+            query = self.query()
+        except ValueError:
+            query = None
+        self.on_change(query)
+
+    def query(self):
+        """HistoryQuery по полям; ValueError, если дата или сумма введены неверно"""
+        tx_type = self.tx_type.get()
+        return HistoryQuery(
+            date_from=self._date(self.date_from),
+            date_to=self._date(self.date_to, end=True),
+            types=None if tx_type == ALL_TYPES else [TX_TYPES[tx_type]],
+            amount_min=self._amount(self.amount_min),
+            amount_max=self._amount(self.amount_max),
+            counterparty=self.counterparty.get().strip() or None
+        )
+
+    @staticmethod
+    def _date(entry, end=False):
+        text = entry.get().strip()
+        return parse_date_bound(text, end) if text else None
+
+    @staticmethod
+    def _amount(entry):
+        text = entry.get().strip()
+        return abs(parse_amount(text)) if text else None
@@ -0,0 +1,299 @@
+import json
+import os
+import threading
+
+from accounts import Account, Turnover, archive_json, checkpoint_json, post_json
+from cache import AccountCache
+from metrics import METRICS, disk_size
+
+
+def dump_line(data):
+    return (json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def copy_user(user):
+    """Копия аккаунта со своим списком транзакций и оборотами"""
+    copy = {**user, "транзакции": list(user["транзакции"])}
+    if "обороты" in user:
+        copy["обороты"] = Turnover.from_json(user["обороты"]).copy().to_json()
+    return copy
+
+
+def group_record(pending, record):
+    """Раскладываем запись журнала по аккаунтам: email -> {user, changes}.
+
+    Проводки применяются к каждому аккаунту отдельно, поэтому повтор
+    операции здесь отсекается по каждому счету сам по себе; целиком, по
+    всем счетам операции, его отсекает Ledger до записи в журнал.
+    """
+    op = record["op"]
+    if op == "register":
+        pending[record["email"]] = {"user": record["user"], "changes": []}
+    elif op == "post":
+        for entry in record["entries"]:
+            pending.setdefault(entry["email"], {"user": None, "changes": []})["changes"].append(("tx", entry))
+    elif op == "update":
+        pending.setdefault(record["email"], {"user": None, "changes": []})["changes"].append(("fields", record["fields"]))
+    elif op == "archive":
+        pending.setdefault(record["email"], {"user": None, "changes": []})["changes"].append(("archive", record["archive"]))
+    elif op == "checkpoint":
+        pending.setdefault(record["email"], {"user": None, "changes": []})["changes"].append(
+            ("checkpoint", record["checkpoint"])
+        )
+    else:
+        raise ValueError(f"Неизвестная операция журнала: {op}")
+
+
+def apply_changes(user, changes):
+    """Применяем изменения из журнала к аккаунту в формате users.json"""
+    for kind, value in changes:
+        if kind == "tx":
+            post_json(user, value["tx"], value.get("id"))
+        elif kind == "archive":
+            archive_json(user, value)
+        elif kind == "checkpoint":
+            checkpoint_json(user, value)
+        else:
+            user.update(value)
+
+
+class LazyJournalStorage:
+    """Журнал со снимком, из которого аккаунты читаются по одному.
+
+    Снимок - файл JSON Lines (одна строка на аккаунт) и компактный индекс
+    email -> (смещение, длина). При старте читаются только индекс и хвост
+    журнала, сам аккаунт с историей загружается при первом обращении.
+
+    Файлы одного поколения: ``<base>.<gen>.jsonl``, ``<base>.<gen>.idx``,
+    ``<base>.<gen>.journal``; текущее поколение записано в ``<base>.lazy``.
+    Свертка пишет новое поколение рядом и переключает манифест одной
+    атомарной заменой, поэтому сбой в любой момент оставляет целое поколение.
+    """
+
+    def __init__(self, base, snapshot_every=1000, cache_bytes=64 * 1024 * 1024):
+        self.base = base
+        self.cache_bytes = cache_bytes
+        self.manifest_path = base + ".lazy"
+        self.snapshot_every = snapshot_every
+        self.fsync = False
+        self.gen = 0
+        self._lock = threading.Lock()
+        self._index = {}
+        self._pending = {}
+        self._pending_count = 0
+        self._data = None
+        self._journal = None
+
+    def _path(self, gen, ext):
+        return f"{self.base}.{gen}.{ext}"
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def load(self):
+        """Читаем индекс и хвост журнала; аккаунты подгружаются по запросу"""
+        if self.exists():
+            with open(self.manifest_path, 'r') as f:
+                self.gen = int(f.read().strip())
+        else:
+            self._write_generation(0, {}, [])
+            self._switch_manifest(0)
+        self._remove_stale_generations()
+        self._index = self._read_index(self.gen)
+        self._pending = {}
+        self._pending_count = 0
+        for record in self._read_journal(self.gen):
+            self._remember(record)
+        self._data = open(self._path(self.gen, "jsonl"), 'rb')
+        self._journal = open(self._path(self.gen, "journal"), 'ab')
+        return AccountCache(self, self.cache_bytes)
+
+    def _read_index(self, gen):
+        index = {}
+        with open(self._path(gen, "idx"), 'r', encoding='utf-8') as f:
+            for line in f:
+                email, offset, length = line.rstrip("\n").rsplit("\t", 2)
+                index[email] = (int(offset), int(length))
+        return index
+
+    def _read_journal(self, gen):
+        """Читаем записи журнала, отрезая недописанную последнюю строку"""
+        path = self._path(gen, "journal")
+        if not os.path.exists(path):
+            return
+        good_size = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                good_size += len(line)
+                yield json.loads(line)
+        if good_size < os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(good_size)
+
+    def _remember(self, record):
+        """Запоминаем запись журнала до следующей свертки"""
+        group_record(self._pending, record)
+        self._pending_count += 1
+
+    def has_account(self, email):
+        with self._lock:
+            if email in self._index:
+                return True
+            pending = self._pending.get(email)
+            return pending is not None and pending["user"] is not None
+
+    def load_account(self, email):
+        with self._lock:
+            location = self._index.get(email)
+            if location is not None:
+                offset, length = location
+                self._data.seek(offset)
+                line = self._data.read(length)
+                user = json.loads(line)
+            pending = self._pending.get(email)
+            if pending is not None and pending["user"] is not None:
+                # Аккаунт зарегистрирован после последней свертки
+                user = copy_user(pending["user"])
+            elif location is None:
+                return None
+            changes = list(pending["changes"]) if pending is not None else []
+        apply_changes(user, changes)
+        account = Account.from_json(user)
+        return account, account.nbytes()
+
+    def count_accounts(self):
+        with self._lock:
+            new = sum(1 for email, p in self._pending.items() if p["user"] is not None and email not in self._index)
+            return len(self._index) + new
+
+    def iter_emails(self):
+        with self._lock:
+            emails = list(self._index)
+            emails.extend(email for email, p in self._pending.items()
+                          if p["user"] is not None and email not in self._index)
+        return iter(emails)
+
+    def commit(self, records):
+        """Дописываем записи в журнал текущего поколения"""
+        written = 0
+        for record in records:
+            line = dump_line(record)
+            self._journal.write(line)
+            written += len(line)
+        self._journal.flush()
+        METRICS.count("storage_bytes_written", written)
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        with self._lock:
+            for record in records:
+                self._remember(record)
+        if self._pending_count >= self.snapshot_every:
+            self.compact()
+
+    def compact(self):
+        """Сворачиваем журнал в снимок нового поколения"""
+        # Свертка читает журнал с диска, а не общий с интерфейсом словарь
+        pending = {}
+        for record in self._read_journal(self.gen):
+            group_record(pending, record)
+        old_gen = self.gen
+        new_gen = old_gen + 1
+        index = self._write_generation(new_gen, pending, self._iter_snapshot(old_gen))
+        with self._lock:
+            self._journal.close()
+            self._data.close()
+            self._switch_manifest(new_gen)
+            self._index = index
+            self._pending = {}
+            self._pending_count = 0
+            self._data = open(self._path(new_gen, "jsonl"), 'rb')
+            self._journal = open(self._path(new_gen, "journal"), 'ab')
+        for ext in ("jsonl", "idx", "journal"):
+            os.remove(self._path(old_gen, ext))
+
+    def _iter_snapshot(self, gen):
+        """Потоково читаем аккаунты снимка: (email, user)"""
+        # Индекс записан в порядке строк снимка, поэтому читаем оба файла подряд
+        with open(self._path(gen, "idx"), 'r', encoding='utf-8') as idx, \
+                open(self._path(gen, "jsonl"), 'rb') as data:
+            for idx_line, data_line in zip(idx, data):
+                email = idx_line.rstrip("\n").rsplit("\t", 2)[0]
+                yield email, json.loads(data_line)
+
+    def _write_generation(self, gen, pending, accounts):
+        """Пишем снимок и индекс поколения gen; возвращаем индекс"""
+        index = {}
+        offset = 0
+        data_path = self._path(gen, "jsonl")
+        idx_path = self._path(gen, "idx")
+        with open(data_path, 'wb') as data, open(idx_path, 'w', encoding='utf-8') as idx:
+            def write(email, user):
+                nonlocal offset
+                line = dump_line(user)
+                data.write(line)
+                idx.write(f"{email}\t{offset}\t{len(line)}\n")
+                index[email] = (offset, len(line))
+                offset += len(line)
+
+            for email, user in accounts:
+                extra = pending.pop(email, None)
+                if extra is not None:
+                    apply_changes(user, extra["changes"])
+                write(email, user)
+            for email, extra in pending.items():
+                if extra["user"] is None:
+                    continue
+                user = copy_user(extra["user"])
+                apply_changes(user, extra["changes"])
+                write(email, user)
+            for f in (data, idx):
+                f.flush()
+                os.fsync(f.fileno())
+        open(self._path(gen, "journal"), 'wb').close()
+        return index
+
+    def _switch_manifest(self, gen):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(f"{gen}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        self.gen = gen
+
+    def _remove_stale_generations(self):
+        """Удаляем файлы недописанных или устаревших поколений"""
+        directory = os.path.dirname(os.path.abspath(self.base))
+        prefix = os.path.basename(self.base) + "."
+        current = f"{prefix}{self.gen}."
+        for name in os.listdir(directory):
+            if not name.startswith(prefix) or name.startswith(current):
+                continue
+            gen, _, ext = name[len(prefix):].partition(".")
+            if gen.isdigit() and ext in ("jsonl", "idx", "journal"):
+                os.remove(os.path.join(directory, name))
+
+    def import_users(self, users):
+        """Создаем первое поколение из словаря в формате users.json"""
+        self._write_generation(1, {}, users.items())
+        self._switch_manifest(1)
+
+    def disk_size(self):
+        """Размер файлов текущего поколения в байтах"""
+        return disk_size(*(self._path(self.gen, ext) for ext in ("jsonl", "idx", "journal")))
+
+    def journal_size(self):
+        return disk_size(self._path(self.gen, "journal"))
+
+    def sync(self):
+        if self._journal is not None:
+            os.fsync(self._journal.fileno())
+
+    def close(self):
+        for f in (self._journal, self._data):
+            if f is not None:
+                f.close()
+        self._journal = None
+        self._data = None
@@ -0,0 +1,196 @@
+import random
+import time
+import uuid
+from datetime import datetime
+
+from accounts import DATE_FORMAT, TRANSFER_FROM, TRANSFER_TO, TxType, make_transaction
+
+
+MAX_RETRIES = 5
+# Пауза перед повтором после конфликта: случайная, до RETRY_BACKOFF * 2**попытка
+# секунд, чтобы рабочие места, столкнувшиеся на одном счете, не повторяли разом
+RETRY_BACKOFF = 0.01
+
+
+class LedgerError(Exception):
+    """Операция отклонена правилами банка; текст показывается пользователю"""
+
+
+class ConflictError(Exception):
+    """Аккаунты операции изменил другой экземпляр приложения; операцию нужно проверить заново"""
+
+
+class RetriesExhausted(LedgerError):
+    """Операция MAX_RETRIES раз подряд столкнулась с изменениями других рабочих мест"""
+
+    def __init__(self, message="Счет одновременно меняют с другого рабочего места, повторите операцию"):
+        super().__init__(message)
+
+
+class DuplicateOperation(Exception):
+    """Операция с этим номером уже проведена; повтор ничего не меняет"""
+
+
+def new_operation_id():
+    """Номер новой операции: присваивается один раз и не меняется при повторной отправке"""
+    return uuid.uuid4().hex
+
+
+def retry_delay(attempt):
+    """Пауза в секундах перед попыткой номер ``attempt`` после конфликта"""
+    return random.uniform(0, RETRY_BACKOFF * 2 ** attempt)
+
+
+def entry(email, tx, op_id):
+    """Проводка записи журнала; номер операции - только если он задан"""
+    if op_id is None:
+        return {"email": email, "tx": tx}
+    return {"email": email, "tx": tx, "id": op_id}
+
+
+class Ledger:
+    """Правила банковских операций без привязки к интерфейсу.
+
+    Методы ``*_record`` проверяют операцию и возвращают запись журнала, не
+    меняя аккаунты. Если передан словарь ``balances``, проверка идет по нему
+    (а не по сохраненным балансам) и он обновляется - так пакет операций
+    проверяется последовательно, ничего не применяя. Методы без суффикса
+    сразу передают запись в ``commit``; если ``commit`` бросает
+    ConflictError, запись строится заново по обновленным аккаунтам.
+
+    ``exclusive`` - необязательная фабрика контекста, внутри которого
+    другие рабочие места не могут менять данные (блокировка режима shared).
+    Последняя попытка идет под ним, поэтому конфликт на ней невозможен.
+
+    Операции с номером ``op_id`` идемпотентны: если номер уже есть среди
+    недавних операций счета, ``*_record`` бросает DuplicateOperation, а
+    методы без суффикса возвращают False. Хранилище тоже пропускает
+    проводку с известным номером, поэтому повтор записи журнала безопасен.
+    """
+
+    def __init__(self, accounts, commit, exclusive=None):
+        self.accounts = accounts
+        self.commit = commit
+        self.exclusive = exclusive
+
+    def _balance(self, email, balances):
+        if balances is not None and email in balances:
+            return balances[email]
+        return self.accounts[email].balance
+
+    def _check_amount(self, amount):
+        if amount <= 0:
+            raise LedgerError("Сумма должна быть положительной!")
+
+    def _check_operation(self, emails, op_id):
+        """Номер известен любому счету операции - значит, она уже проведена (как fresh_entries)"""
+        if op_id is None:
+            return
+        for email in emails:
+            if email in self.accounts and self.accounts[email].has_operation(op_id):
+                raise DuplicateOperation(op_id)
+
+    def register_record(self, email, user):
+        """Регистрация; user - аккаунт в формате users.json"""
+        if email in self.accounts:
+            raise LedgerError("Пользователь с таким email уже существует!")
+        return {"op": "register", "email": email, "user": user}
+
+    def deposit_record(self, email, amount, balances=None, op_id=None):
+        """Пополнение счета; сумма в копейках"""
+        self._check_operation((email,), op_id)
+        self._check_amount(amount)
+        if balances is not None:
+            balances[email] = self._balance(email, balances) + amount
+        return {
+            "op": "post",
+            "entries": [entry(email, make_transaction(TxType.DEPOSIT, amount), op_id)]
+        }
+
+    def withdraw_record(self, email, amount, balances=None, op_id=None):
+        """Снятие наличных; сумма в копейках"""
+        self._check_operation((email,), op_id)
+        self._check_amount(amount)
+        balance = self._balance(email, balances)
+        if balance < amount:
+            raise LedgerError("Недостаточно средств на счете!")
+        if balances is not None:
+            balances[email] = balance - amount
+        return {
+            "op": "post",
+            "entries": [entry(email, make_transaction(TxType.WITHDRAW, -amount), op_id)]
+        }
+
+    def transfer_record(self, sender, recipient, amount, balances=None, op_id=None):
+        """Перевод между пользователями; обе стороны в одной записи с одним номером операции"""
+        self._check_operation((sender, recipient), op_id)
+        self._check_amount(amount)
+        if recipient == sender:
+            raise LedgerError("Нельзя перевести деньги самому себе!")
+        if sender not in self.accounts:
+            raise LedgerError("Отправитель не найден!")
+        if recipient not in self.accounts:
+            raise LedgerError("Получатель не найден!")
+        balance = self._balance(sender, balances)
+        if balance < amount:
+            raise LedgerError("Недостаточно средств на счете!")
+        if balances is not None:
+            balances[sender] = balance - amount
+            balances[recipient] = self._balance(recipient, balances) + amount
+        # Обе стороны с одним временем: по нему сверка находит пару (reconcile.py)
+        date = datetime.now().strftime(DATE_FORMAT)
+        return {
+            "op": "post",
+            "entries": [
+                entry(sender, make_transaction(TxType.TRANSFER, -amount, TRANSFER_TO + recipient, date), op_id),
+                entry(recipient, make_transaction(TxType.TRANSFER, amount, TRANSFER_FROM + sender, date), op_id)
+            ]
+        }
+
+    def try_execute(self, build, attempt=0):
+        """Одна попытка execute под номером ``attempt`` (с нуля).
+
+        Возвращает True, False (операция уже проведена) или None, если был
+        конфликт версий и попытку нужно повторить. Последняя попытка
+        (MAX_RETRIES - 1) идет под ``exclusive``, если он задан.
+        """
+        try:
+            if attempt == MAX_RETRIES - 1 and self.exclusive is not None:
+                with self.exclusive():
+                    self.commit(build())
+            else:
+                self.commit(build())
+            return True
+        except ConflictError:
+            return None
+        except DuplicateOperation:
+            return False
+
+    def execute(self, build):
+        """Строим записи вызовом build() и сохраняем, повторяя при конфликте версий.
+
+        Между повторами - короткая случайная пауза (retry_delay), растущая с
+        каждой попыткой. Поток при этом спит, поэтому окно вместо execute
+        повторяет try_execute через ``after``. Возвращает False, если операция
+        с этим номером уже проведена; если конфликты не кончились за
+        MAX_RETRIES попыток, бросает RetriesExhausted.
+        """
+        for attempt in range(MAX_RETRIES):
+            if attempt:
+                time.sleep(retry_delay(attempt))
+            applied = self.try_execute(build, attempt)
+            if applied is not None:
+                return applied
+        raise RetriesExhausted()
+
+    def register(self, email, user):
+        self.execute(lambda: [self.register_record(email, user)])
+
+    def deposit(self, email, amount, op_id=None):
+        return self.execute(lambda: [self.deposit_record(email, amount, op_id=op_id)])
+
+    def withdraw(self, email, amount, op_id=None):
+        return self.execute(lambda: [self.withdraw_record(email, amount, op_id=op_id)])
+
+    def transfer(self, sender, recipient, amount, op_id=None):
+        return self.execute(lambda: [self.transfer_record(sender, recipient, amount, op_id=op_id)])
@@ -0,0 +1,45 @@
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def file_lock(path):
+    """Рекомендательная блокировка файла path на время блока with.
+
+    Блокировку берут все экземпляры приложения, работающие с общими файлами,
+    поэтому держать ее нужно только на время записи. На POSIX - flock, на
+    Windows - блокировка первого байта через msvcrt.
+    """
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    # LK_LOCK сам повторяет попытку около 10 секунд, потом бросает OSError
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.01)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def lock_path(path):
+    """Файл блокировки рядом с данными"""
+    return os.path.abspath(path) + ".lock"
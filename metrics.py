@@ -0,0 +1,187 @@
+import functools
+import json
+import os
+import threading
+import time
+
+
+class _NullTimer:
+    """Ничего не делающий таймер для выключенных метрик"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    """Счетчики, таймеры и показатели горячих путей приложения.
+
+    Пока ``enabled`` ложно, ``timer`` возвращает общий пустой объект, а
+    ``count``/``observe`` сразу выходят, так что выключенные метрики почти
+    ничего не стоят. Таймеры вызываются и из фоновых потоков, поэтому
+    обновления идут под блокировкой.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+        self._gauges = {}
+        self._gauge_functions = {}
+
+    def timer(self, name):
+        """with METRICS.timer("storage_commit"): ..."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self._timers.get(name)
+            if stats is None:
+                stats = self._timers[name] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[name] = value
+
+    def gauge_function(self, name, function):
+        """Показатель, который вычисляется в момент выгрузки (размер файлов, доля попаданий)"""
+        self._gauge_functions[name] = function
+
+    def snapshot(self):
+        """Текущие значения всех метрик"""
+        with self._lock:
+            timers = {
+                name: {
+                    "count": count,
+                    "sum_sec": round(total, 6),
+                    "avg_ms": round(total / count * 1000, 4) if count else 0,
+                    "max_ms": round(longest * 1000, 4)
+                }
+                for name, (count, total, longest) in self._timers.items()
+            }
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        for name, function in list(self._gauge_functions.items()):
+            try:
+                gauges[name] = function()
+            except Exception:
+                gauges[name] = None
+        return {"timestamp": time.time(), "timers": timers, "counters": counters, "gauges": gauges}
+
+    def to_prometheus(self, snapshot=None):
+        """Текстовый формат Prometheus"""
+        snapshot = snapshot or self.snapshot()
+        lines = []
+        for name, stats in sorted(snapshot["timers"].items()):
+            metric = f"bank_{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            lines.append(f"{metric}_count {stats['count']}")
+            lines.append(f"{metric}_sum {stats['sum_sec']}")
+            lines.append(f"# TYPE {metric}_max gauge")
+            lines.append(f"{metric}_max {stats['max_ms'] / 1000}")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE bank_{name}_total counter")
+            lines.append(f"bank_{name}_total {value}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            if value is None:
+                continue
+            lines.append(f"# TYPE bank_{name} gauge")
+            lines.append(f"bank_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path, fmt="prom"):
+        """Записываем метрики в файл атомарно, чтобы сборщик не прочитал половину"""
+        snapshot = self.snapshot()
+        if fmt == "json":
+            text = json.dumps(snapshot, ensure_ascii=False, indent=4)
+        else:
+            text = self.to_prometheus(snapshot)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+
+METRICS = Metrics()
+
+
+def timed(name):
+    """Декоратор: время выполнения функции в таймер name"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not METRICS.enabled:
+                return function(*args, **kwargs)
+            with _Timer(METRICS, name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MetricsExporter:
+    """Периодически выгружает METRICS в файл из фонового потока"""
+
+    def __init__(self, path, fmt="prom", interval=10.0, metrics=METRICS):
+        self.path = path
+        self.fmt = fmt
+        self.interval = interval
+        self.metrics = metrics
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.metrics.dump(self.path, self.fmt)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.metrics.dump(self.path, self.fmt)
+
+
+def disk_size(*paths):
+    """Суммарный размер существующих файлов"""
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
@@ -0,0 +1,102 @@
+import argparse
+import hashlib
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import timed
+
+PBKDF2_PREFIX = "pbkdf2_sha256"
+DEFAULT_ITERATIONS = 200000
+MIN_ITERATIONS = 50000
+
+
+@timed("hash_password")
+def hash_password(password, iterations=DEFAULT_ITERATIONS):
+    """Соленый PBKDF2-SHA256: pbkdf2_sha256$итерации$соль$хеш"""
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+    return f"{PBKDF2_PREFIX}${iterations}${salt.hex()}${digest.hex()}"
+
+
+@timed("verify_password")
+def verify_password(password, stored):
+    """Проверяем пароль по хешу нового или старого (SHA-256 без соли) формата"""
+    if stored.startswith(PBKDF2_PREFIX + "$"):
+        _, iterations, salt, digest = stored.split("$")
+        candidate = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), int(iterations))
+        return hmac.compare_digest(candidate.hex(), digest)
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+
+
+def needs_upgrade(stored, iterations):
+    """Хеш старого формата или слабее текущей настройки"""
+    if not stored.startswith(PBKDF2_PREFIX + "$"):
+        return True
+    return int(stored.split("$")[1]) < iterations
+
+
+def calibrate(target_seconds=0.25, probe_iterations=20000):
+    """Подбираем число итераций, при котором хеширование занимает target_seconds"""
+    salt = os.urandom(16)
+    started = time.perf_counter()
+    hashlib.pbkdf2_hmac("sha256", b"calibration", salt, probe_iterations)
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    iterations = int(probe_iterations * target_seconds / elapsed)
+    # Округляем до тысяч, чтобы хеши одной машины не отличались на единицы
+    return max(MIN_ITERATIONS, iterations // 1000 * 1000)
+
+
+class HashingService:
+    """Хеширование паролей в пуле потоков, чтобы не замораживать окно.
+
+    PBKDF2 в hashlib отпускает GIL, поэтому потоки работают параллельно с Tk.
+    Результаты передаются через ``notify(callback, result, error)`` - в
+    приложении это диспетчер, который вызывает callback в потоке Tk. Если
+    хеширование упало (например, на испорченном сохраненном хеше), result
+    равен None, а error - текст ошибки; иначе error равен None.
+    """
+
+    def __init__(self, notify, iterations=None, target_seconds=0.25, workers=2):
+        self.notify = notify
+        self.iterations = iterations or DEFAULT_ITERATIONS
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kdf")
+        if iterations is None:
+            # Калибровка тоже занимает время, поэтому идет в пуле
+            self._pool.submit(self._calibrate, target_seconds)
+
+    def _calibrate(self, target_seconds):
+        self.iterations = calibrate(target_seconds)
+
+    def _submit(self, callback, function, *args):
+        def done(future):
+            try:
+                result = future.result()
+            except Exception as e:
+                self.notify(callback, None, str(e) or type(e).__name__)
+            else:
+                self.notify(callback, result, None)
+
+        self._pool.submit(function, *args).add_done_callback(done)
+
+    def hash(self, password, callback):
+        """callback(хеш, ошибка)"""
+        self._submit(callback, lambda: hash_password(password, self.iterations))
+
+    def verify(self, password, stored, callback):
+        """callback(совпал ли пароль, ошибка)"""
+        self._submit(callback, verify_password, password, stored)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Подбор стоимости хеширования паролей")
+    parser.add_argument("--target-ms", type=int, default=250, help="желаемое время одного хеширования")
+    args = parser.parse_args()
+    iterations = calibrate(args.target_ms / 1000)
+    started = time.perf_counter()
+    hash_password("check", iterations)
+    print(f"итераций: {iterations}, хеширование: {(time.perf_counter() - started) * 1000:.0f} мс")
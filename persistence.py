@@ -0,0 +1,180 @@
+import queue
+import threading
+import time
+
+from metrics import METRICS
+
+FSYNC_POLICIES = ("always", "periodic", "never")
+
+_STOP = object()
+
+
+class _Task:
+    def __init__(self, function):
+        self.function = function
+
+
+class UiDispatcher:
+    """Передаем вызовы из фоновых потоков в поток Tk.
+
+    Tk нельзя трогать из других потоков, поэтому фоновые потоки только кладут
+    вызовы в очередь, а окно забирает их через ``root.after``.
+    """
+
+    def __init__(self, root, poll_ms=20):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._queue = queue.Queue()
+        self.root.after(self.poll_ms, self._drain)
+
+    def post(self, callback, *args):
+        """Ставим вызов в очередь (можно из любого потока)"""
+        self._queue.put((callback, args))
+
+    def _drain(self):
+        while True:
+            try:
+                callback, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+        self.root.after(self.poll_ms, self._drain)
+
+
+class WriteBehind:
+    """Фоновая запись: операции копятся в очереди и сохраняются группами.
+
+    Первая запись в группе ждет ``flush_interval`` секунд, все, что пришло за
+    это время (и пока шла предыдущая запись), сохраняется одним вызовом
+    ``storage.commit``. Политика fsync:
+    - always: fsync после каждой группы;
+    - periodic: fsync не чаще раза в ``fsync_interval`` секунд; если после
+      записи наступило затишье, поток сам сбрасывает ее по истечении интервала;
+    - never: полагаемся на операционную систему.
+    """
+
+    def __init__(self, storage, flush_interval=0.05, fsync="periodic", fsync_interval=1.0, notify=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Неизвестная политика fsync: {fsync}")
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        # notify(callback, error) доставляет результат в нужный поток
+        self.notify = notify or (lambda callback, error: callback(error))
+        self.storage.fsync = fsync == "always"
+        self._queue = queue.Queue()
+        self._last_sync = time.monotonic()
+        # Есть записанные, но еще не сброшенные на диск данные (политика periodic)
+        self._unsynced = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def submit(self, records, callback=None):
+        """Ставим записи в очередь; callback(error) вызовется после сохранения"""
+        self._queue.put((records, callback))
+
+    def call(self, function, callback=None):
+        """Выполняем function() в потоке записи после уже поставленных записей.
+
+        Так обслуживание хранилища (например, перешардирование) идет в том же
+        потоке, что и commit, и не пересекается с записью.
+        """
+        self._queue.put((_Task(function), callback))
+
+    def flush(self):
+        """Ждем, пока все поставленные записи будут сохранены"""
+        self._queue.join()
+
+    def close(self):
+        """Сохраняем остаток очереди и останавливаем поток"""
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self.fsync != "never":
+            self.storage.sync()
+        self.storage.close()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._next_item()
+            if item is None:
+                continue
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            if isinstance(item[0], _Task):
+                self._call(item)
+                continue
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                try:
+                    timeout = deadline - time.monotonic()
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                if isinstance(item[0], _Task):
+                    self._write(batch)
+                    batch = []
+                    self._call(item)
+                    break
+                batch.append(item)
+            if batch:
+                self._write(batch)
+
+    def _next_item(self):
+        """Ждем следующую запись; в затишье сбрасываем несинхронизированные данные.
+
+        Возвращает None, если вместо записи был сделан отложенный fsync.
+        """
+        if not self._unsynced:
+            return self._queue.get()
+        timeout = self._last_sync + self.fsync_interval - time.monotonic()
+        try:
+            return self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+        except queue.Empty:
+            try:
+                self._sync()
+            except Exception:
+                self._last_sync = time.monotonic()  # повторим через интервал
+            return None
+
+    def _sync(self):
+        self.storage.sync()
+        self._unsynced = False
+        self._last_sync = time.monotonic()
+
+    def _call(self, item):
+        task, callback = item
+        error = None
+        try:
+            task.function()
+        except Exception as e:
+            error = e
+        if callback is not None:
+            self.notify(callback, error)
+        self._queue.task_done()
+
+    def _write(self, batch):
+        records = [record for records, _ in batch for record in records]
+        error = None
+        METRICS.count("storage_commits")
+        METRICS.count("storage_records", len(records))
+        try:
+            with METRICS.timer("storage_commit"):
+                self.storage.commit(records)
+            if self.fsync == "periodic":
+                self._unsynced = True
+                if time.monotonic() - self._last_sync >= self.fsync_interval:
+                    self._sync()
+        except Exception as e:
+            error = e
+        for _, callback in batch:
+            if callback is not None:
+                self.notify(callback, error)
+            self._queue.task_done()
@@ -0,0 +1,64 @@
+from bisect import bisect_left
+
+
+class PrefixIndex:
+    """Отсортированный индекс для поиска получателя по началу email или имени.
+
+    Ключи хранятся в нижнем регистре в одном отсортированном списке, поиск -
+    двоичный поиск начала диапазона и проход по совпадениям, то есть
+    O(log n + k) независимо от числа клиентов.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._emails = []
+
+    @classmethod
+    def build(cls, emails, names=None):
+        """Строим индекс разом; names - словарь email -> "Имя Фамилия" (необязательно)"""
+        emails = list(emails)
+        keys = [email.lower() for email in emails]
+        if names:
+            for email, name in names.items():
+                keys.append(name.lower())
+                emails.append(email)
+        # Сортируем номера, а не пары: сравнение строк дешевле сравнения кортежей
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        index = cls()
+        index._keys = [keys[i] for i in order]
+        index._emails = [emails[i] for i in order]
+        return index
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, email, name=None):
+        """Добавляем аккаунт после регистрации"""
+        self._insert(email.lower(), email)
+        if name:
+            self._insert(name.lower(), email)
+
+    def _insert(self, key, email):
+        position = bisect_left(self._keys, key)
+        while position < len(self._keys) and self._keys[position] == key:
+            if self._emails[position] == email:
+                return
+            position += 1
+        self._keys.insert(position, key)
+        self._emails.insert(position, email)
+
+    def search(self, prefix, limit=8, exclude=None):
+        """До limit разных email, у которых email или имя начинается с prefix"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        result = []
+        position = bisect_left(self._keys, prefix)
+        while position < len(self._keys) and len(result) < limit:
+            if not self._keys[position].startswith(prefix):
+                break
+            email = self._emails[position]
+            if email != exclude and email not in result:
+                result.append(email)
+            position += 1
+        return result
@@ -0,0 +1,273 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter, deque
+from datetime import datetime
+
+from accounts import (DATE_FORMAT, TRANSFER_FROM, TRANSFER_TO, TxType, format_amount, format_date, parse_date,
+                      to_kopecks, to_rubles)
+from storage import STORAGE_MODES, make_storage, tool_lock
+
+# Аккаунтов в одном задании процесса сверки
+CHUNK_ACCOUNTS = 2000
+# Сколько расхождений показывать в отчете поименно
+MAX_LISTED = 100
+
+
+def link_digest(previous, rows, count, balance):
+    """Хеш звена цепочки: хеш прошлой точки, операции после нее, число операций и остаток"""
+    digest = hashlib.sha256(previous.encode("ascii"))
+    for date, tx_type, amount, description in rows:
+        digest.update(f"\n{date}|{tx_type}|{amount}|{description}".encode("utf-8"))
+    digest.update(f"\n{count}|{balance}".encode("ascii"))
+    return digest.hexdigest()
+
+
+def account_item(email, account, full):
+    """Задание сверки одного аккаунта - только данные, без объектов хранилища.
+
+    Без ``full`` операции берутся с последней контрольной точки: все, что
+    до нее, уже сверено и закрыто ее хешем.
+    """
+    checkpoints = account.checkpoints if full else account.checkpoints[-1:]
+    start = 0 if full or not checkpoints else checkpoints[-1]["операций"]
+    return (
+        email,
+        account.balance,
+        len(account.history),
+        (account.turnover.count, account.turnover.balance),
+        checkpoints,
+        start,
+        list(account.history.rows(start))
+    )
+
+
+def transfer_leg(email, date, amount, description):
+    """Сторона перевода: (отправитель, получатель, сумма, время, +1 у отправителя / -1 у получателя)"""
+    if amount < 0 and description.startswith(TRANSFER_TO):
+        return email, description[len(TRANSFER_TO):], -amount, date, 1
+    if amount > 0 and description.startswith(TRANSFER_FROM):
+        return description[len(TRANSFER_FROM):], email, amount, date, -1
+    return None
+
+
+def verify_account(item, full, now):
+    """Сверяем аккаунт: (email, расхождения, стороны переводов, новая точка, число операций).
+
+    С ``full`` хеш и остаток каждой точки считаются заново по операциям
+    звена, иначе последней точке доверяем. Баланс должен равняться остатку
+    последней точки плюс операции после нее. Новая точка продолжает цепочку,
+    если расхождений нет и после прошлой точки были операции.
+    """
+    email, balance, count, turnover, checkpoints, start, rows = item
+    problems = []
+    if turnover != (count, balance):
+        problems.append(f"обороты: {turnover[0]} операций, остаток {format_amount(turnover[1])}")
+
+    previous, current, position = "", None, start
+    for checkpoint in checkpoints:
+        operations = checkpoint["операций"]
+        closing = to_kopecks(checkpoint["остаток"])
+        if not position <= operations <= count:
+            problems.append(f"контрольная точка на операции {operations} вне истории")
+            break
+        if full:
+            link = rows[position - start:operations - start]
+            if link_digest(previous, link, operations, closing) != checkpoint["хеш"]:
+                problems.append(f"хеш контрольной точки на операции {operations} не совпадает")
+            if current is not None and current + sum(row[2] for row in link) != closing:
+                problems.append(f"остаток контрольной точки на операции {operations} не сходится с операциями")
+        previous, current, position = checkpoint["хеш"], closing, operations
+
+    tail = rows[position - start:]
+    if current is not None:
+        expected = current + sum(row[2] for row in tail)
+        if expected != balance:
+            problems.append(f"баланс {format_amount(balance)}, по операциям {format_amount(expected)}")
+
+    legs = []
+    for date, tx_type, amount, description in rows:
+        if tx_type != TxType.TRANSFER:
+            continue
+        leg = transfer_leg(email, date, amount, description)
+        if leg is None:
+            problems.append(f"перевод {format_date(date)} без второго участника")
+        else:
+            legs.append(leg)
+
+    seal = None
+    if not problems and (count > position or not checkpoints):
+        seal = {
+            "операций": count,
+            "остаток": to_rubles(balance),
+            "дата": now,
+            "хеш": link_digest(previous, tail, count, balance)
+        }
+    return email, problems, legs, seal, len(rows)
+
+
+def verify_chunk(items, full, now):
+    """Задание одного процесса: список результатов verify_account"""
+    return [verify_account(item, full, now) for item in items]
+
+
+class ReconcileReport:
+    """Итог сверки: расхождения по счетам, переводы без пары и время этапов"""
+
+    def __init__(self, full, workers):
+        self.full = full
+        self.workers = workers
+        self.accounts = 0
+        self.operations = 0
+        self.problems = {}
+        self.unmatched = []
+        self.sealed = 0
+        self.seconds = {}
+
+    @property
+    def ok(self):
+        return not self.problems and not self.unmatched
+
+    def to_json(self):
+        return {
+            "проверка": "полная" if self.full else "от контрольных точек",
+            "процессов": self.workers,
+            "счетов": self.accounts,
+            "операций_проверено": self.operations,
+            "счетов_с_расхождениями": len(self.problems),
+            "расхождения": dict(list(self.problems.items())[:MAX_LISTED]),
+            "переводов_без_пары": len(self.unmatched),
+            "переводы_без_пары": [
+                {
+                    "отправитель": sender,
+                    "получатель": recipient,
+                    "сумма": format_amount(amount),
+                    "дата": format_date(date),
+                    "сторона": "только у отправителя" if side > 0 else "только у получателя"
+                }
+                for (sender, recipient, amount, date), side in self.unmatched[:MAX_LISTED]
+            ],
+            "новых_контрольных_точек": self.sealed,
+            "секунды": {name: round(value, 3) for name, value in self.seconds.items()}
+        }
+
+
+def run_reconcile(storage, full=False, workers=None, seal=True):
+    """Сверяем все счета в пуле процессов и ставим новые контрольные точки.
+
+    Родитель читает аккаунты и раздает задания по CHUNK_ACCOUNTS счетов;
+    заданий в очереди не больше двух на процесс, поэтому память не растет с
+    размером базы. Стороны переводов сводятся в конце: перевод проверяется,
+    если он новее контрольных точек обоих участников - более старые уже
+    сверены. С workers=0 все считается в этом процессе.
+    """
+    workers = os.cpu_count() if workers is None else workers
+    report = ReconcileReport(full, workers)
+    now = datetime.now().strftime(DATE_FORMAT)
+
+    started = time.perf_counter()
+    users = storage.load()
+    report.seconds["загрузка"] = time.perf_counter() - started
+
+    # Время последней контрольной точки счета: более старые переводы не сверяем
+    sealed_at = {}
+    legs = []
+    seals = {}
+
+    def chunks():
+        chunk = []
+        for email in users.keys():
+            account = users[email]
+            if account.checkpoints and not full:
+                sealed_at[email] = parse_date(account.checkpoints[-1]["дата"])
+            chunk.append(account_item(email, account, full))
+            if len(chunk) == CHUNK_ACCOUNTS:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def collect(results):
+        for email, problems, account_legs, checkpoint, operations in results:
+            report.accounts += 1
+            report.operations += operations
+            legs.extend(account_legs)
+            if problems:
+                report.problems[email] = problems
+            if checkpoint is not None:
+                seals[email] = checkpoint
+
+    started = time.perf_counter()
+    if workers:
+        # spawn - как в bench.py: одинаково на всех системах
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            pending = deque()
+            # Задания собираются в этом потоке: соединение SQLite нельзя отдавать другому
+            for chunk in chunks():
+                pending.append(pool.apply_async(verify_chunk, (chunk, full, now)))
+                if len(pending) >= 2 * workers:
+                    collect(pending.popleft().get())
+            while pending:
+                collect(pending.popleft().get())
+    else:
+        for chunk in chunks():
+            collect(verify_chunk(chunk, full, now))
+    report.seconds["проверка"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    pairs = Counter()
+    for sender, recipient, amount, date, side in legs:
+        if date <= max(sealed_at.get(sender, -1), sealed_at.get(recipient, -1)):
+            continue
+        pairs[sender, recipient, amount, date] += side
+    report.unmatched = [(key, side) for key, side in pairs.items() if side]
+    report.seconds["переводы"] = time.perf_counter() - started
+
+    if seal:
+        started = time.perf_counter()
+        # Счет с непарным переводом не закрываем, иначе перевод уйдет за точку и не попадет в сверку
+        for (sender, recipient, _, _), _ in report.unmatched:
+            seals.pop(sender, None)
+            seals.pop(recipient, None)
+        if seals:
+            storage.commit([
+                {"op": "checkpoint", "email": email, "checkpoint": checkpoint}
+                for email, checkpoint in seals.items()
+            ])
+        report.sealed = len(seals)
+        report.seconds["контрольные точки"] = time.perf_counter() - started
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сверка балансов с историей и контрольные точки")
+    parser.add_argument("--users", default="users.json", help="файл пользователей")
+    parser.add_argument("--storage", choices=STORAGE_MODES, default="journal", help="режим хранения данных")
+    parser.add_argument("--full", action="store_true", help="проверить всю цепочку контрольных точек с начала истории")
+    parser.add_argument("--workers", type=int, help="число процессов (по умолчанию - по числу ядер, 0 - без пула)")
+    parser.add_argument("--no-seal", action="store_true", help="только проверить, новые контрольные точки не ставить")
+    parser.add_argument("--report", help="куда записать отчет в JSON (по умолчанию - в консоль)")
+    args = parser.parse_args(argv)
+
+    storage = make_storage(args.storage, args.users)
+    try:
+        with tool_lock(storage):
+            report = run_reconcile(storage, args.full, args.workers, not args.no_seal)
+    finally:
+        storage.close()
+
+    text = json.dumps(report.to_json(), ensure_ascii=False, indent=4)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0 if report.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
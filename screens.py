@@ -0,0 +1,79 @@
+import tkinter as tk
+
+from metrics import METRICS
+
+
+class ScreenManager:
+    """Окна приложения, которые создаются один раз и дальше переиспользуются.
+
+    Окно регистрируется функцией ``build(window)``: она строит виджеты и
+    возвращает ``reset(*args)``, которая готовит окно к очередному показу -
+    очищает поля и подставляет данные пользователя. Первый ``show`` создает
+    окно, следующие только вызывают reset, поэтому число виджетов не растет
+    с числом открытий. Крестик окно прячет, а не уничтожает.
+
+    Окна сеанса (``session=True``) при выходе пользователя прячутся и
+    сбрасываются вызовом ``reset()`` без аргументов, чтобы в них не осталось
+    данных прошлого пользователя.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._specs = {}
+        self._windows = {}
+
+    def register(self, name, title, geometry, build, modal=False, session=True, on_close=None):
+        """Описываем окно; создается оно при первом show"""
+        self._specs[name] = (title, geometry, build, modal, session, on_close)
+
+    def show(self, name, *args):
+        """Показываем окно с новым состоянием; reset получает args"""
+        entry = self._windows.get(name)
+        title, geometry, build, modal, _, on_close = self._specs[name]
+        if entry is None:
+            window = tk.Toplevel(self.root)
+            window.title(title)
+            window.geometry(geometry)
+            window.configure(bg=self.root["bg"])
+            window.protocol("WM_DELETE_WINDOW", on_close or (lambda: self.hide(name)))
+            entry = self._windows[name] = (window, build(window))
+            METRICS.count("screens_built")
+        else:
+            METRICS.count("screens_reused")
+        window, reset = entry
+        if reset is not None:
+            reset(*args)
+        window.deiconify()
+        window.lift()
+        if modal:
+            window.grab_set()
+        return window
+
+    def hide(self, name):
+        entry = self._windows.get(name)
+        if entry is not None:
+            entry[0].grab_release()
+            entry[0].withdraw()
+
+    def is_shown(self, name):
+        entry = self._windows.get(name)
+        return entry is not None and entry[0].state() != "withdrawn"
+
+    def end_session(self):
+        """Пользователь вышел: прячем и очищаем окна сеанса"""
+        for name, (window, reset) in self._windows.items():
+            if not self._specs[name][4]:
+                continue
+            self.hide(name)
+            if reset is not None:
+                reset()
+
+    def widget_count(self):
+        """Сколько виджетов существует в приложении (для метрик)"""
+        count = 0
+        pending = [self.root]
+        while pending:
+            widget = pending.pop()
+            count += 1
+            pending.extend(widget.winfo_children())
+        return count
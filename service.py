@@ -0,0 +1,364 @@
+import argparse
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+
+from accounts import HistoryQuery
+from cache import AccountCache
+from ledger import Ledger, LedgerError
+from passwords import HashingService, needs_upgrade
+from persistence import FSYNC_POLICIES, WriteBehind
+from recipients import PrefixIndex
+from storage import STORAGE_MODES, apply_record, make_storage, record_emails
+
+# Запросов одного соединения, которые выполняются одновременно
+MAX_IN_FLIGHT = 64
+HISTORY_PAGE = 200
+# Запросы, которые меняют сессию: следующие запросы соединения ждут их ответа
+SESSION_OPS = ("login", "logout")
+# Очередь входящих соединений: тысячи клиентов могут подключиться разом
+BACKLOG = 4096
+# Режим shared нужен нескольким процессам с общими файлами; у сервиса писатель один
+SERVICE_MODES = tuple(mode for mode in STORAGE_MODES if mode != "shared")
+
+
+def parse_address(address):
+    """"host:port" или "unix:/путь/к/сокету" -> ("tcp", host, port) / ("unix", path)"""
+    if address.startswith("unix:"):
+        return ("unix", address[len("unix:"):])
+    host, _, port = address.rpartition(":")
+    return ("tcp", host or "127.0.0.1", int(port))
+
+
+def encode(frame):
+    return (json.dumps(frame, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class Session:
+    """Состояние одного соединения: кто вошел"""
+
+    def __init__(self):
+        self.email = None
+
+
+class LedgerService:
+    """Банк как сервис: JSON Lines поверх TCP или Unix-сокета.
+
+    Запрос - строка ``{"id": 1, "op": "transfer", ...}``, ответ -
+    ``{"id": 1, "ok": true, "result": ...}`` или ``{"id": 1, "ok": false,
+    "error": "текст"}``. Клиент может отправлять запросы, не дожидаясь
+    ответов: каждый выполняется отдельной задачей, ответы приходят по мере
+    готовности с тем же id. История отдается потоком кадров
+    ``{"id": 1, "page": [...]}``, за которыми идет обычный ответ.
+
+    Изменения одного аккаунта выполняются по очереди: проверка и применение
+    операции идут под блокировками ее аккаунтов, а ответ отправляется только
+    после сохранения. Сохранения ждут уже без блокировок, поэтому операции,
+    в том числе одного аккаунта, сохраняются общими группами через
+    WriteBehind в порядке применения.
+    """
+
+    def __init__(self, storage, flush_interval=0.05, fsync="periodic", kdf_iterations=None,
+                 kdf_target_ms=250):
+        self.storage = storage
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.kdf_iterations = kdf_iterations
+        self.kdf_target_ms = kdf_target_ms
+        self.sessions = 0
+        self._locks = {}
+        self._saved = None
+
+    def start(self):
+        """Загружаем базу и запускаем фоновые потоки (внутри работающего цикла)"""
+        self.loop = asyncio.get_running_loop()
+        self.users = self.storage.load()
+        self.ledger = Ledger(self.users, self.commit_records)
+        names = None
+        if not isinstance(self.users, AccountCache):
+            names = {email: f"{account.name} {account.surname}" for email, account in self.users.items()}
+        self.recipients = PrefixIndex.build(self.users.keys(), names)
+        self.writer = WriteBehind(
+            self.storage,
+            flush_interval=self.flush_interval,
+            fsync=self.fsync,
+            notify=self.notify
+        )
+        self.hasher = HashingService(
+            self.notify,
+            iterations=self.kdf_iterations,
+            target_seconds=self.kdf_target_ms / 1000
+        )
+
+    def close(self):
+        self.hasher.close()
+        self.writer.close()
+
+    def notify(self, callback, *args):
+        """Результаты фоновых потоков возвращаем в цикл asyncio"""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def commit_records(self, records):
+        """Применяем записи и ставим в очередь записи; self._saved ждет сохранения"""
+        emails = [email for record in records for email in record_emails(record)]
+        if isinstance(self.users, AccountCache):
+            for email in emails:
+                self.users.pin(email)
+        for record in records:
+            apply_record(self.users, record)
+        future = self.loop.create_future()
+
+        def saved(error):
+            if isinstance(self.users, AccountCache):
+                for email in emails:
+                    self.users.unpin(email)
+            future.set_result(error)
+
+        self.writer.submit(records, saved)
+        self._saved = future
+
+    async def mutate(self, emails, action):
+        """Выполняем action() под блокировками аккаунтов и ждем сохранения"""
+        async with self.account_locks(emails):
+            self._saved = None
+            result = action()
+            saved, self._saved = self._saved, None
+        if saved is not None:
+            error = await saved
+            if error is not None:
+                raise LedgerError(f"Не удалось сохранить данные: {error}")
+        return result
+
+    @asynccontextmanager
+    async def account_locks(self, emails):
+        # Берем в порядке email, чтобы встречные переводы не ждали друг друга вечно
+        emails = sorted(set(emails))
+        locks = [self._locks.setdefault(email, asyncio.Lock()) for email in emails]
+        taken = []
+        try:
+            for lock in locks:
+                await lock.acquire()
+                taken.append(lock)
+            yield
+        finally:
+            for lock in taken:
+                lock.release()
+            for email, lock in zip(emails, locks):
+                if not lock.locked() and self._locks.get(email) is lock:
+                    del self._locks[email]
+
+    def background(self, start, *args):
+        """Ждем результат HashingService как future; ошибка хеширования - LedgerError"""
+        future = self.loop.create_future()
+
+        def done(result, error):
+            # Соединение могло закрыться, пока шло хеширование
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(LedgerError(f"Ошибка хеширования пароля: {error}"))
+            else:
+                future.set_result(result)
+
+        start(*args, done)
+        return future
+
+    async def handle_connection(self, reader, writer):
+        session = Session()
+        slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+        tasks = set()
+        self.sessions += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                await slots.acquire()
+                if isinstance(request, dict) and request.get("op") in SESSION_OPS:
+                    await self.dispatch(session, request, writer, slots)
+                    continue
+                task = asyncio.create_task(self.dispatch(session, request, writer, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def dispatch(self, session, request, writer, slots):
+        request_id = None
+        try:
+            if not isinstance(request, dict):
+                raise LedgerError("Некорректный запрос")
+            request_id = request.get("id")
+            handler = getattr(self, "op_" + str(request.get("op")), None)
+            if handler is None:
+                raise LedgerError("Неизвестная операция")
+            if handler not in (self.op_register, self.op_login) and session.email is None:
+                raise LedgerError("Сначала войдите в систему")
+            result = await handler(session, request, lambda page: self.send_page(writer, request_id, page))
+            frame = {"id": request_id, "ok": True, "result": result}
+        except LedgerError as e:
+            frame = {"id": request_id, "ok": False, "error": str(e)}
+        except (ValueError, KeyError, TypeError) as e:
+            frame = {"id": request_id, "ok": False, "error": f"Некорректный запрос: {e}"}
+        except Exception as e:
+            frame = {"id": request_id, "ok": False, "error": f"Внутренняя ошибка: {e}"}
+        finally:
+            slots.release()
+        if not writer.is_closing():
+            writer.write(encode(frame))
+            await writer.drain()
+
+    async def send_page(self, writer, request_id, page):
+        writer.write(encode({"id": request_id, "page": page}))
+        # Ждем, пока клиент заберет данные, и не копим историю в памяти
+        await writer.drain()
+
+    async def op_register(self, session, request, send):
+        email = request["email"]
+        if email in self.users:
+            raise LedgerError("Пользователь с таким email уже существует!")
+        hashed = await self.background(self.hasher.hash, request["password"])
+        user = {
+            "имя": request["name"],
+            "фамилия": request["surname"],
+            "телефон": request["phone"],
+            "пароль": hashed,
+            "баланс": 1000.00,  # Начальный баланс
+            "транзакции": [],
+            "активен": True
+        }
+        await self.mutate([email], lambda: self.ledger.register(email, user))
+        self.recipients.add(email, f"{user['имя']} {user['фамилия']}")
+        return None
+
+    async def op_login(self, session, request, send):
+        email, password = request["email"], request["password"]
+        if email not in self.users:
+            raise LedgerError("Пользователь не найден!")
+        account = self.users[email]
+        if not account.active:
+            raise LedgerError("Аккаунт заблокирован!")
+        stored = account.password
+        if not await self.background(self.hasher.verify, password, stored):
+            raise LedgerError("Неверный пароль!")
+        if needs_upgrade(stored, self.hasher.iterations):
+            hashed = await self.background(self.hasher.hash, password)
+            await self.mutate([email], lambda: self.ledger.execute(lambda: [
+                {"op": "update", "email": email, "fields": {"пароль": hashed}}
+            ]))
+        session.email = email
+        return {"name": account.name, "surname": account.surname}
+
+    async def op_logout(self, session, request, send):
+        session.email = None
+        return None
+
+    async def op_account(self, session, request, send):
+        account = self.users[session.email]
+        return {
+            "name": account.name,
+            "surname": account.surname,
+            "balance": account.balance,
+            "active": account.active,
+            "history": len(account.history),
+            "turnover": account.turnover.to_json()
+        }
+
+    async def op_deposit(self, session, request, send):
+        email = session.email
+        applied = await self.mutate(
+            [email], lambda: self.ledger.deposit(email, int(request["amount"]), request.get("op_id"))
+        )
+        return {"balance": self.users[email].balance, "duplicate": not applied}
+
+    async def op_withdraw(self, session, request, send):
+        email = session.email
+        applied = await self.mutate(
+            [email], lambda: self.ledger.withdraw(email, int(request["amount"]), request.get("op_id"))
+        )
+        return {"balance": self.users[email].balance, "duplicate": not applied}
+
+    async def op_transfer(self, session, request, send):
+        sender, recipient = session.email, request["recipient"]
+        applied = await self.mutate(
+            [sender, recipient],
+            lambda: self.ledger.transfer(sender, recipient, int(request["amount"]), request.get("op_id"))
+        )
+        return {"balance": self.users[sender].balance, "duplicate": not applied}
+
+    async def op_search(self, session, request, send):
+        return self.recipients.search(request["prefix"], int(request.get("limit", 8)), exclude=session.email)
+
+    async def op_history(self, session, request, send):
+        """Операции [start, stop) в хронологическом порядке, страницами.
+
+        С полем ``query`` (HistoryQuery.to_json) номера считаются среди
+        отобранных операций, а ``total`` в ответе - их общее число.
+        """
+        history = self.users[session.email].history
+        if request.get("query") is not None:
+            history = history.select(HistoryQuery.from_json(request["query"]))
+        start = max(0, int(request.get("start", 0)))
+        stop = min(len(history), int(request.get("stop", len(history))))
+        page_size = max(1, int(request.get("page_size", HISTORY_PAGE)))
+        for first in range(start, stop, page_size):
+            await send(list(history[first:min(first + page_size, stop)]))
+        return {"count": max(0, stop - start), "total": len(history)}
+
+
+async def serve(service, address):
+    service.start()
+    kind, *where = parse_address(address)
+    if kind == "unix":
+        if os.path.exists(where[0]):
+            os.remove(where[0])
+        server = await asyncio.start_unix_server(service.handle_connection, where[0], backlog=BACKLOG)
+    else:
+        server = await asyncio.start_server(service.handle_connection, where[0], where[1], backlog=BACKLOG)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Банк как сервис для тонких клиентов")
+    parser.add_argument("--listen", default="127.0.0.1:8765",
+                        help="адрес host:port или unix:/путь/к/сокету")
+    parser.add_argument("--users", default="users.json", help="путь к users.json")
+    parser.add_argument("--storage", choices=SERVICE_MODES, default="journal", help="режим хранения данных")
+    parser.add_argument("--flush-interval", type=float, default=0.05,
+                        help="сколько секунд копить операции перед записью")
+    parser.add_argument("--fsync", choices=FSYNC_POLICIES, default="periodic",
+                        help="когда сбрасывать данные на диск")
+    parser.add_argument("--cache-mb", type=int, default=64,
+                        help="память под аккаунты в режимах sqlite и lazy, МБ")
+    parser.add_argument("--kdf-iterations", type=int,
+                        help="число итераций PBKDF2 вместо автоматического подбора")
+    args = parser.parse_args(argv)
+    storage = make_storage(args.storage, args.users, cache_bytes=args.cache_mb * 1024 * 1024)
+    service = LedgerService(
+        storage,
+        flush_interval=args.flush_interval,
+        fsync=args.fsync,
+        kdf_iterations=args.kdf_iterations
+    )
+    try:
+        asyncio.run(serve(service, args.listen))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+import argparse
+import sqlite3
+from collections.abc import Sequence
+from contextlib import closing
+
+from accounts import (RECENT_OPERATIONS, RECENT_SECONDS, TRANSFER_FROM, TRANSFER_TO, TX_LABELS, TX_TYPES, Account,
+                      History, HistorySelection, Turnover, format_date, fresh_entries, parse_date, period_of,
+                      to_kopecks, to_rubles, turnover_slot)
+from cache import AccountCache
+from metrics import disk_size
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    email TEXT PRIMARY KEY,
+    first_name TEXT NOT NULL,
+    last_name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    password TEXT NOT NULL,
+    balance INTEGER NOT NULL,
+    active INTEGER NOT NULL,
+    tx_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    email TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    date INTEGER NOT NULL,
+    type INTEGER NOT NULL,
+    amount INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    PRIMARY KEY (email, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS transactions_by_date ON transactions (email, date);
+CREATE INDEX IF NOT EXISTS transactions_by_type ON transactions (email, type, seq);
+CREATE TABLE IF NOT EXISTS turnover (
+    email TEXT NOT NULL,
+    period TEXT NOT NULL,
+    deposits INTEGER NOT NULL,
+    deposit_count INTEGER NOT NULL,
+    withdrawals INTEGER NOT NULL,
+    withdrawal_count INTEGER NOT NULL,
+    incoming INTEGER NOT NULL,
+    incoming_count INTEGER NOT NULL,
+    outgoing INTEGER NOT NULL,
+    outgoing_count INTEGER NOT NULL,
+    min_balance INTEGER NOT NULL,
+    max_balance INTEGER NOT NULL,
+    PRIMARY KEY (email, period)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS checkpoints (
+    email TEXT NOT NULL,
+    operations INTEGER NOT NULL,
+    balance INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (email, operations)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS operations (
+    email TEXT NOT NULL,
+    id TEXT NOT NULL,
+    date INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS operations_by_id ON operations (email, id);
+"""
+# Суммы и балансы - в копейках, даты - в секундах от 1970 года,
+# типы операций - числа TxType. Колонки turnover после периода идут в порядке
+# TURNOVER_FIELDS. В operations - недавние номера операций счета, порядок
+# добавления задает rowid
+
+TURNOVER_COLUMNS = (
+    "deposits, deposit_count, withdrawals, withdrawal_count, incoming, incoming_count,"
+    " outgoing, outgoing_count, min_balance, max_balance"
+)
+# Одна операция добавляется в строку периода одним UPSERT
+TURNOVER_UPSERT = (
+    f"INSERT INTO turnover (email, period, {TURNOVER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    " ON CONFLICT (email, period) DO UPDATE SET"
+    " deposits = deposits + excluded.deposits, deposit_count = deposit_count + excluded.deposit_count,"
+    " withdrawals = withdrawals + excluded.withdrawals,"
+    " withdrawal_count = withdrawal_count + excluded.withdrawal_count,"
+    " incoming = incoming + excluded.incoming, incoming_count = incoming_count + excluded.incoming_count,"
+    " outgoing = outgoing + excluded.outgoing, outgoing_count = outgoing_count + excluded.outgoing_count,"
+    " min_balance = min(min_balance, excluded.min_balance), max_balance = max(max_balance, excluded.max_balance)"
+)
+
+TX_COLUMNS = "date, type, amount, description"
+
+# Поля users.json, которые можно менять записью update
+ACCOUNT_COLUMNS = {
+    "имя": "first_name",
+    "фамилия": "last_name",
+    "телефон": "phone",
+    "пароль": "password",
+    "активен": "active",
+}
+
+# Оценка памяти аккаунта в кеше: история остается в базе
+ACCOUNT_SIZE = 1024
+
+
+def tx_from_row(row):
+    """Строка таблицы transactions -> транзакция в формате users.json"""
+    return {"дата": format_date(row[0]), "тип": TX_LABELS[row[1]], "сумма": to_rubles(row[2]), "описание": row[3]}
+
+
+def tx_to_row(email, seq, tx):
+    return (
+        email, seq, parse_date(tx["дата"]), TX_TYPES[tx["тип"]],
+        to_kopecks(tx["сумма"]), tx.get("описание", "")
+    )
+
+
+def turnover_row(email, date, tx_type, amount, balance):
+    """Строка turnover с одной операцией; balance - остаток после нее"""
+    totals = [0] * 8 + [balance, balance]
+    slot = turnover_slot(tx_type, amount)
+    totals[slot] = abs(amount)
+    totals[slot + 1] = 1
+    return (email, period_of(date), *totals)
+
+
+def checkpoint_row(email, checkpoint):
+    return (email, checkpoint["операций"], to_kopecks(checkpoint["остаток"]), checkpoint["дата"], checkpoint["хеш"])
+
+
+def checkpoint_from_row(row):
+    return {"операций": row[0], "остаток": to_rubles(row[1]), "дата": row[2], "хеш": row[3]}
+
+
+def account_to_row(email, user):
+    return (
+        email, user["имя"], user["фамилия"], user["телефон"], user["пароль"],
+        to_kopecks(user["баланс"]), int(user["активен"]), len(user["транзакции"])
+    )
+
+
+class SqliteHistory(Sequence):
+    """История аккаунта, которая читается из SQLite по мере обращения.
+
+    Записи, проведенные в этом сеансе, хранятся в ``_tail``: фоновая запись
+    может еще не дойти до базы, а интерфейс должен видеть их сразу.
+    """
+
+    def __init__(self, storage, email, count):
+        self.storage = storage
+        self.email = email
+        self._base = count
+        self._tail = History()
+
+    def __len__(self):
+        return self._base + len(self._tail)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            rows = self.storage.read_history(self.email, start, min(stop, self._base))
+            tail_start = max(start - self._base, 0)
+            tail_stop = max(stop - self._base, 0)
+            return rows + self._tail[tail_start:tail_stop]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        if index >= self._base:
+            return self._tail[index - self._base]
+        return self.storage.read_history(self.email, index, index + 1)[0]
+
+    def __iter__(self):
+        yield from self.storage.iter_history(self.email, self._base)
+        yield from self._tail
+
+    def __reversed__(self):
+        yield from reversed(self._tail)
+        yield from self.storage.iter_history(self.email, self._base, reverse=True)
+
+    def append(self, tx):
+        self._tail.append(tx)
+
+    def rows(self, start=0):
+        """Операции с номера start кортежами, как History.rows"""
+        yield from self.storage.read_rows(self.email, start, self._base)
+        yield from self._tail.rows(max(start - self._base, 0))
+
+    def filter(self, query):
+        """Номера операций под HistoryQuery: сохраненные ищет база, новые - индекс хвоста"""
+        positions = self.storage.filter_history(self.email, self._base, query)
+        positions.extend(self._base + i for i in self._tail.filter(query))
+        return positions
+
+    def select(self, query):
+        return HistorySelection(self, self.filter(query))
+
+    def scan(self, query):
+        """Потоковый отбор для выгрузки, как History.scan"""
+        total = len(self)
+        return total, self._scan(query, self._base, total)
+
+    def _scan(self, query, base, total):
+        for seq, tx in self.storage.scan_history(self.email, base, query):
+            yield seq + 1, tx
+        _, tail = self._tail.scan(query)
+        for done, tx in tail:
+            if base + done > total:
+                break
+            yield base + done, tx
+
+    def nbytes(self):
+        return self._tail.nbytes()
+
+
+class SqliteStorage:
+    """Хранилище в SQLite: аккаунты по email, транзакции с индексом (аккаунт, дата).
+
+    Аккаунты читаются по одному через индекс, поэтому вход, баланс и история
+    не требуют загрузки всей базы. Каждая группа записей сохраняется одной
+    SQL-транзакцией, так что обе стороны перевода пишутся атомарно.
+    """
+
+    def __init__(self, path, cache_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.cache_bytes = cache_bytes
+        self.fsync = False
+        self._reader = None
+        # Пишет только фоновый поток записи
+        self._writer = sqlite3.connect(path, check_same_thread=False)
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.executescript(SCHEMA)
+        self._backfill_turnover()
+
+    def _backfill_turnover(self):
+        """Считаем обороты для базы, созданной до их появления (один раз)"""
+        db = self._writer
+        if db.execute("SELECT 1 FROM turnover LIMIT 1").fetchone() is not None:
+            return
+        if db.execute("SELECT 1 FROM transactions LIMIT 1").fetchone() is None:
+            return
+        with db:
+            accounts = db.execute(
+                "SELECT email, balance - (SELECT COALESCE(SUM(amount), 0) FROM transactions t"
+                " WHERE t.email = accounts.email) FROM accounts"
+            ).fetchall()
+            # Каждый аккаунт читаем потоком от остатка до первой операции
+            for email, opening in accounts:
+                turnover = Turnover(balance=opening)
+                rows = db.execute("SELECT date, type, amount FROM transactions WHERE email = ? ORDER BY seq", (email,))
+                for date, tx_type, amount in rows:
+                    turnover.add(date, tx_type, amount)
+                self._insert_turnover(db, email, turnover)
+
+    @staticmethod
+    def _insert_turnover(db, email, turnover):
+        db.executemany(
+            f"INSERT INTO turnover (email, period, {TURNOVER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((email, period, *totals) for period, totals in turnover.periods.items())
+        )
+
+    def load(self):
+        """Открываем базу на чтение; аккаунты подгружаются по запросу"""
+        self._reader = sqlite3.connect(self.path)
+        return AccountCache(self, self.cache_bytes)
+
+    def has_account(self, email):
+        row = self._reader.execute("SELECT 1 FROM accounts WHERE email = ?", (email,)).fetchone()
+        return row is not None
+
+    def load_account(self, email):
+        row = self._reader.execute(
+            "SELECT first_name, last_name, phone, password, balance, active, tx_count"
+            " FROM accounts WHERE email = ?",
+            (email,)
+        ).fetchone()
+        if row is None:
+            return None
+        periods = self._reader.execute(
+            f"SELECT period, {TURNOVER_COLUMNS} FROM turnover WHERE email = ?", (email,)
+        )
+        turnover = Turnover({period: list(totals) for period, *totals in periods}, row[6], row[4])
+        checkpoints = self._reader.execute(
+            "SELECT operations, balance, date, digest FROM checkpoints WHERE email = ? ORDER BY operations", (email,)
+        )
+        operations = self._reader.execute("SELECT id, date FROM operations WHERE email = ? ORDER BY rowid", (email,))
+        account = Account(
+            name=row[0],
+            surname=row[1],
+            phone=row[2],
+            password=row[3],
+            balance=row[4],
+            active=bool(row[5]),
+            history=SqliteHistory(self, email, row[6]),
+            turnover=turnover,
+            checkpoints=map(checkpoint_from_row, checkpoints),
+            operations=operations.fetchall()
+        )
+        return account, ACCOUNT_SIZE + turnover.nbytes()
+
+    def count_accounts(self):
+        return self._reader.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+
+    def iter_emails(self):
+        for (email,) in self._reader.execute("SELECT email FROM accounts ORDER BY email"):
+            yield email
+
+    def iter_balances(self):
+        """(email, баланс в копейках, активен) всех аккаунтов без загрузки истории"""
+        yield from self._reader.execute("SELECT email, balance, active FROM accounts ORDER BY email")
+
+    def read_history(self, email, start, stop):
+        """Транзакции аккаунта с номерами [start, stop)"""
+        if start >= stop:
+            return []
+        rows = self._reader.execute(
+            f"SELECT {TX_COLUMNS} FROM transactions"
+            " WHERE email = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (email, start, stop)
+        )
+        return [tx_from_row(row) for row in rows]
+
+    def read_rows(self, email, start, stop):
+        """Транзакции [start, stop) кортежами (время, тип, сумма, описание) - без перевода в users.json"""
+        yield from self._reader.execute(
+            f"SELECT {TX_COLUMNS} FROM transactions"
+            " WHERE email = ? AND seq >= ? AND seq < ? ORDER BY seq",
+            (email, start, stop)
+        )
+
+    def filter_history(self, email, stop, query):
+        """Номера первых ``stop`` транзакций аккаунта, подходящих под HistoryQuery"""
+        where, params = self._filter_sql(email, stop, query)
+        rows = self._reader.execute(f"SELECT seq FROM transactions WHERE {where} ORDER BY seq", params)
+        return [row[0] for row in rows]
+
+    def scan_history(self, email, stop, query):
+        """Потоково читаем подходящие транзакции: пары (seq, транзакция).
+
+        Открывает свое соединение, поэтому годится для фонового потока.
+        """
+        where, params = self._filter_sql(email, stop, query)
+        with closing(sqlite3.connect(self.path)) as db:
+            rows = db.execute(f"SELECT seq, {TX_COLUMNS} FROM transactions WHERE {where} ORDER BY seq", params)
+            for row in rows:
+                yield row[0], tx_from_row(row[1:])
+
+    @staticmethod
+    def _filter_sql(email, stop, query):
+        """Условие WHERE и параметры для HistoryQuery"""
+        where = ["email = ?", "seq < ?"]
+        params = [email, stop]
+        if query.date_from is not None:
+            where.append("date >= ?")
+            params.append(query.date_from)
+        if query.date_to is not None:
+            where.append("date <= ?")
+            params.append(query.date_to)
+        if query.types is not None:
+            where.append(f"type IN ({', '.join('?' * len(query.types))})")
+            params.extend(int(tx_type) for tx_type in query.types)
+        if query.amount_min is not None:
+            where.append("abs(amount) >= ?")
+            params.append(query.amount_min)
+        if query.amount_max is not None:
+            where.append("abs(amount) <= ?")
+            params.append(query.amount_max)
+        if query.counterparty is not None:
+            # NOCASE сравнивает без учета регистра только латиницу - как раз email
+            where.append("description COLLATE NOCASE IN (?, ?)")
+            params.extend(prefix + query.counterparty for prefix in (TRANSFER_TO, TRANSFER_FROM))
+        return " AND ".join(where), params
+
+    def iter_history(self, email, stop, reverse=False):
+        """Потоково читаем первые ``stop`` транзакций аккаунта"""
+        order = "DESC" if reverse else "ASC"
+        rows = self._reader.execute(
+            f"SELECT {TX_COLUMNS} FROM transactions"
+            f" WHERE email = ? AND seq < ? ORDER BY seq {order}",
+            (email, stop)
+        )
+        for row in rows:
+            yield tx_from_row(row)
+
+    def commit(self, records):
+        """Сохраняем группу записей одной SQL-транзакцией"""
+        self._writer.execute(f"PRAGMA synchronous={'FULL' if self.fsync else 'NORMAL'}")
+        with self._writer:
+            for record in records:
+                op = record["op"]
+                if op == "register":
+                    self._insert_account(self._writer, record["email"], record["user"])
+                elif op == "post":
+                    for entry in fresh_entries(record["entries"], self._known_operation):
+                        self._post(entry["email"], entry["tx"], entry.get("id"))
+                elif op == "update":
+                    self._update(record["email"], record["fields"])
+                elif op == "checkpoint":
+                    self._writer.execute(
+                        "INSERT INTO checkpoints VALUES (?, ?, ?, ?, ?)",
+                        checkpoint_row(record["email"], record["checkpoint"])
+                    )
+                else:
+                    raise ValueError(f"Неизвестная операция журнала: {op}")
+
+    def _insert_account(self, conn, email, user):
+        conn.execute("INSERT INTO accounts VALUES (?, ?, ?, ?, ?, ?, ?, ?)", account_to_row(email, user))
+        conn.executemany(
+            "INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?)",
+            (tx_to_row(email, seq, tx) for seq, tx in enumerate(user["транзакции"]))
+        )
+        self._insert_turnover(conn, email, Turnover.for_user(user))
+        conn.executemany(
+            "INSERT INTO checkpoints VALUES (?, ?, ?, ?, ?)",
+            (checkpoint_row(email, checkpoint) for checkpoint in user.get("контроль", ()))
+        )
+        conn.executemany(
+            "INSERT INTO operations VALUES (?, ?, ?)",
+            ((email, op_id, date) for op_id, date in user.get("проведено", {}).items())
+        )
+
+    def _post(self, email, tx, op_id=None):
+        if op_id is not None:
+            self._remember_operation(email, op_id, parse_date(tx["дата"]))
+        seq, balance = self._writer.execute(
+            "SELECT tx_count, balance FROM accounts WHERE email = ?", (email,)
+        ).fetchone()
+        row = tx_to_row(email, seq, tx)
+        amount = row[4]
+        self._writer.execute(
+            "UPDATE accounts SET balance = balance + ?, tx_count = tx_count + 1 WHERE email = ?",
+            (amount, email)
+        )
+        self._writer.execute("INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?)", row)
+        self._writer.execute(TURNOVER_UPSERT, turnover_row(email, row[2], row[3], amount, balance + amount))
+
+    def _known_operation(self, email, op_id):
+        row = self._writer.execute("SELECT 1 FROM operations WHERE email = ? AND id = ?", (email, op_id)).fetchone()
+        return row is not None
+
+    def _remember_operation(self, email, op_id, date):
+        """Запоминаем номер операции и вытесняем старые, как accounts.remember_operation"""
+        self._writer.execute("INSERT INTO operations VALUES (?, ?, ?)", (email, op_id, date))
+        self._writer.execute(
+            "DELETE FROM operations WHERE email = ? AND (date < ? OR rowid NOT IN"
+            " (SELECT rowid FROM operations WHERE email = ? ORDER BY rowid DESC LIMIT ?))",
+            (email, date - RECENT_SECONDS, email, RECENT_OPERATIONS)
+        )
+
+    def _update(self, email, fields):
+        for key, value in fields.items():
+            column = ACCOUNT_COLUMNS[key]
+            if key == "активен":
+                value = int(value)
+            self._writer.execute(f"UPDATE accounts SET {column} = ? WHERE email = ?", (value, email))
+
+    def disk_size(self):
+        """Размер базы вместе с WAL в байтах"""
+        return disk_size(self.path, self.path + "-wal")
+
+    def journal_size(self):
+        return disk_size(self.path + "-wal")
+
+    def sync(self):
+        """SQLite сам сбрасывает данные при фиксации транзакции"""
+        pass
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        self._writer.close()
+
+
+def migrate_users(users, db_path):
+    """Переносим пользователей в формате users.json в базу SQLite"""
+    storage = SqliteStorage(db_path)
+    with storage._writer:
+        for email, user in users.items():
+            storage._insert_account(storage._writer, email, user)
+    storage.close()
+    return len(users)
+
+
+if __name__ == "__main__":
+    from storage import read_legacy
+
+    parser = argparse.ArgumentParser(description="Перенос users.json в SQLite")
+    parser.add_argument("source", help="users.json (вместе с журналом, если он есть)")
+    parser.add_argument("target", help="файл базы SQLite")
+    args = parser.parse_args()
+    count = migrate_users(read_legacy(args.source), args.target)
+    print(f"Перенесено аккаунтов: {count}")
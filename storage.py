@@ -0,0 +1,827 @@
+import argparse
+import json
+import os
+import re
+import uuid
+import zlib
+from contextlib import contextmanager, nullcontext
+
+from accounts import Account, archive_json, checkpoint_json, fresh_entries, post_json
+from lazy_storage import LazyJournalStorage
+from ledger import ConflictError
+from locks import file_lock, lock_path
+from metrics import METRICS, disk_size
+from sqlite_storage import SqliteStorage, migrate_users
+
+
+def apply_record(accounts, record):
+    """Применяем запись журнала к аккаунтам в памяти"""
+    op = record["op"]
+    if op == "register":
+        accounts[record["email"]] = Account.from_json(record["user"])
+    elif op == "post":
+        def known(email, op_id):
+            # Счета другого шарда в accounts нет, но и его проводок в этой части записи нет
+            return email in accounts and accounts[email].has_operation(op_id)
+
+        for entry in fresh_entries(record["entries"], known):
+            accounts[entry["email"]].post(entry["tx"], entry.get("id"))
+    elif op == "update":
+        accounts[record["email"]].update_json(record["fields"])
+    elif op == "archive":
+        accounts[record["email"]].archive(record["archive"])
+    elif op == "checkpoint":
+        accounts[record["email"]].seal(record["checkpoint"])
+    else:
+        raise ValueError(f"Неизвестная операция журнала: {op}")
+
+
+def apply_json(users, record):
+    """Применяем запись журнала к пользователям в формате users.json"""
+    op = record["op"]
+    if op == "register":
+        users[record["email"]] = record["user"]
+    elif op == "post":
+        # Проводка: каждая запись меняет баланс на сумму транзакции;
+        # операция с уже проведенным номером пропускается целиком
+        def known(email, op_id):
+            return op_id in users.get(email, {}).get("проведено", ())
+
+        for entry in fresh_entries(record["entries"], known):
+            post_json(users[entry["email"]], entry["tx"], entry.get("id"))
+    elif op == "update":
+        users[record["email"]].update(record["fields"])
+    elif op == "archive":
+        archive_json(users[record["email"]], record["archive"])
+    elif op == "checkpoint":
+        checkpoint_json(users[record["email"]], record["checkpoint"])
+    else:
+        raise ValueError(f"Неизвестная операция журнала: {op}")
+
+
+def record_emails(record):
+    """Аккаунты, которые меняет запись журнала"""
+    if record["op"] != "post":
+        return [record["email"]]
+    return [entry["email"] for entry in record["entries"]]
+
+
+def to_accounts(users):
+    """Пользователи из users.json -> аккаунты в компактном виде"""
+    accounts = {}
+    # Освобождаем словари по мере перевода, чтобы не держать две копии базы
+    for email in list(users):
+        accounts[email] = Account.from_json(users.pop(email))
+    return accounts
+
+
+def read_json(path):
+    """Читаем JSON-файл, если он существует"""
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def dump_generation(gen):
+    return json.dumps({"op": "generation", "gen": gen}) + "\n"
+
+
+class JsonStorage:
+    """Старый режим: весь users.json перезаписывается при каждой операции"""
+
+    def __init__(self, path):
+        self.path = path
+        self.fsync = False
+        self._users = {}
+
+    def load(self):
+        """Загружаем пользователей из файла"""
+        # Файл читаем один раз: словари остаются у хранилища для записи, а
+        # Account.from_json копирует все, что аккаунт потом меняет на месте
+        self._users = read_json(self.path)
+        return {email: Account.from_json(user) for email, user in self._users.items()}
+
+    def commit(self, records):
+        """Применяем записи и перезаписываем файл целиком"""
+        for record in records:
+            apply_json(self._users, record)
+        with open(self.path, 'w') as f:
+            json.dump(self._users, f, indent=4)
+            METRICS.count("storage_bytes_written", f.tell())
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def disk_size(self):
+        """Размер файлов хранилища в байтах"""
+        return disk_size(self.path)
+
+    def sync(self):
+        """Сбрасываем данные на диск"""
+        # Файл закрывается после каждой записи, fsync управляется флагом self.fsync
+        pass
+
+    def close(self):
+        pass
+
+
+class JournalStorage:
+    """Журнал операций: снимок users.json плюс файл дозаписи с компактными записями.
+
+    Каждая операция дописывает одну строку в журнал, поэтому стоимость записи
+    не зависит от размера базы. Раз в ``snapshot_every`` записей журнал
+    сворачивается в новый снимок. Журнал после свертки начинается строкой
+    ``{"op": "generation", "gen": N}`` с номером свертки.
+    """
+
+    def __init__(self, path, snapshot_every=1000):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.snapshot_every = snapshot_every
+        self.fsync = False
+        self.generation = 0
+        self._journal = None
+        self._pending = 0
+
+    def load(self):
+        """Восстанавливаем состояние: последний снимок плюс хвост журнала"""
+        self._recover()
+        accounts = to_accounts(read_json(self.path))
+        self._pending = 0
+        for record in self._read_journal():
+            apply_record(accounts, record)
+            self._pending += 1
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        return accounts
+
+    def _recover(self):
+        """Доводим до конца свертку журнала, прерванную сбоем"""
+        tmp_path = self.path + ".tmp"
+        done_path = self.journal_path + ".done"
+        if os.path.exists(done_path):
+            # Журнал уже отложен, значит новый снимок был записан полностью
+            if os.path.exists(tmp_path):
+                os.replace(tmp_path, self.path)
+            self._retire_journal(done_path)
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    def _read_journal(self):
+        """Читаем записи журнала, отрезая недописанную последнюю строку"""
+        self.generation = 0
+        if not os.path.exists(self.journal_path):
+            return
+        good_size = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Запись оборвалась при сбое - она не была подтверждена
+                    break
+                good_size += len(line)
+                record = json.loads(line)
+                if record["op"] == "generation":
+                    self.generation = record["gen"]
+                    continue
+                yield record
+        if good_size < os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(good_size)
+
+    def commit(self, records):
+        """Дописываем записи в журнал"""
+        self.append(records)
+        self.maybe_compact()
+
+    def append(self, records):
+        """Дописываем записи в журнал без свертки"""
+        written = 0
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+            self._journal.write(line)
+            if METRICS.enabled:
+                written += len(line.encode("utf-8"))
+        self._journal.flush()
+        METRICS.count("storage_bytes_written", written)
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+        self._pending += len(records)
+
+    def maybe_compact(self):
+        """Сворачиваем журнал, если в нем накопилось snapshot_every записей"""
+        if self._pending >= self.snapshot_every:
+            self.compact()
+
+    def read_state(self):
+        """Состояние в формате users.json: снимок плюс журнал"""
+        users = read_json(self.path)
+        for record in self._read_journal():
+            apply_json(users, record)
+        return users
+
+    def compact(self):
+        """Сворачиваем журнал в новый снимок и очищаем журнал"""
+        # Снимок строим из файлов, а не из памяти приложения
+        users = self.read_state()
+        tmp_path = self.path + ".tmp"
+        done_path = self.journal_path + ".done"
+        with open(tmp_path, 'w') as f:
+            # Снимок читает программа, а не человек: без отступов он заметно меньше
+            json.dump(users, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        # Порядок важен для восстановления: снимок готов -> журнал отложен -> снимок заменен
+        if self._journal is not None:
+            self._journal.close()
+        os.replace(self.journal_path, done_path)
+        self.generation += 1
+        self._journal = open(self.journal_path, 'w', encoding='utf-8')
+        self._journal.write(dump_generation(self.generation))
+        self._journal.flush()
+        os.replace(tmp_path, self.path)
+        self._retire_journal(done_path)
+        self._pending = 0
+
+    def _retire_journal(self, done_path):
+        """Убираем отложенный журнал после замены снимка"""
+        os.remove(done_path)
+
+    def disk_size(self):
+        """Размер снимка и журнала в байтах"""
+        return disk_size(self.path, self.journal_path)
+
+    def journal_size(self):
+        return disk_size(self.journal_path)
+
+    def sync(self):
+        """Сбрасываем журнал на диск"""
+        if self._journal is not None:
+            os.fsync(self._journal.fileno())
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+class SharedJournalStorage(JournalStorage):
+    """Журнал, с которым одновременно работают несколько экземпляров приложения.
+
+    Файлы те же, что в режиме journal. Запись идет под рекомендательной
+    блокировкой ``<users.json>.lock``, которая держится только на время
+    записи. Под блокировкой сначала дочитывается хвост журнала, дописанный
+    другими экземплярами, и применяется к аккаунтам в памяти; если он
+    изменил аккаунты операции (выросла их ``version``), запись не делается и
+    бросается ConflictError - Ledger проверяет операцию заново по свежим
+    данным. Так ни одна операция не теряется и не проводится по устаревшему
+    балансу.
+
+    Свертка оставляет предыдущий журнал в ``.prev``, чтобы отставший на одну
+    свертку экземпляр дочитал его хвост, а не перечитывал всю базу.
+
+    ``listener(records)`` вызывается с записями других экземпляров после их
+    применения (records is None - база перечитана целиком).
+
+    Инструменты (batch.py, eod.py и другие) работают целиком внутри
+    ``locked()``: пока они загружают, проверяют и записывают данные, другие
+    экземпляры ждут, поэтому проверка версий им не нужна.
+    """
+
+    def __init__(self, path, snapshot_every=1000):
+        super().__init__(path, snapshot_every)
+        self.lock_path = lock_path(path)
+        self.prev_path = self.journal_path + ".prev"
+        self.listener = None
+        self._offset = 0
+        self._exclusive = False
+
+    def _lock(self):
+        # Внутри locked блокировка уже взята; flock второй раз из того же процесса не берется
+        return nullcontext() if self._exclusive else file_lock(self.lock_path)
+
+    def load(self):
+        with self._lock():
+            return self._load()
+
+    def _load(self):
+        accounts = super().load()
+        # Журнал открывается на время записи: держать его открытым нельзя,
+        # другой экземпляр может его свернуть
+        self._journal.close()
+        self._journal = None
+        self._offset = os.path.getsize(self.journal_path)
+        return accounts
+
+    def commit(self, records):
+        """Запись без проверки версий: безопасна внутри ``locked()``, где данные,
+        загруженные в том же блоке, не могут устареть"""
+        with self._lock():
+            self.append(records)
+            self.maybe_compact()
+
+    @contextmanager
+    def locked(self):
+        """Держим блокировку на время блока: другие экземпляры не пишут"""
+        with file_lock(self.lock_path):
+            self._exclusive = True
+            try:
+                yield
+            finally:
+                self._exclusive = False
+
+    @contextmanager
+    def exclusive(self, accounts):
+        """Держим блокировку на время блока: accounts свежие, и никто другой не пишет.
+
+        Внутри блока операцию можно построить и записать через commit_checked
+        без конфликта - так Ledger делает последнюю попытку.
+        """
+        with self.locked():
+            self._refresh(accounts)
+            yield
+
+    def commit_checked(self, records, accounts):
+        """Дописываем записи и применяем их к accounts, если их аккаунты не менялись"""
+        emails = {email for record in records for email in record_emails(record)}
+        versions = {email: accounts[email].version for email in emails if email in accounts}
+        with self._lock():
+            self._refresh(accounts)
+            for email in emails:
+                account = accounts.get(email)
+                if (account.version if account is not None else None) != versions.get(email):
+                    METRICS.count("storage_conflicts")
+                    raise ConflictError(email)
+            self.append(records)
+            self._offset = os.path.getsize(self.journal_path)
+            for record in records:
+                apply_record(accounts, record)
+            self.maybe_compact()
+
+    def refresh(self, accounts):
+        """Применяем к accounts записи, дописанные другими экземплярами"""
+        with self._lock():
+            self._refresh(accounts)
+
+    def _refresh(self, accounts):
+        generation = journal_generation(self.journal_path)
+        if generation == self.generation:
+            records = self._read_tail(self.journal_path, self._offset)
+        elif generation == self.generation + 1 and journal_generation(self.prev_path) == self.generation:
+            # Другой экземпляр свернул журнал: дочитываем старый и новый целиком
+            records = self._read_tail(self.prev_path, self._offset)
+            self._offset = 0
+            records += self._read_tail(self.journal_path, 0)
+            self.generation = generation
+        else:
+            # Пропущено несколько сверток - перечитываем снимок
+            METRICS.count("storage_full_reloads")
+            fresh = self._load()
+            accounts.clear()
+            accounts.update(fresh)
+            records = None
+        if records is not None:
+            if not records:
+                return
+            for record in records:
+                apply_record(accounts, record)
+            METRICS.count("storage_foreign_records", len(records))
+        if self.listener is not None:
+            self.listener(records)
+
+    def _read_tail(self, path, offset):
+        """Записи файла с позиции offset; недописанная строка после сбоя отрезается"""
+        records = []
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                record = json.loads(line)
+                if record["op"] != "generation":
+                    records.append(record)
+        if path == self.journal_path:
+            if offset < os.path.getsize(path):
+                # Блокировка у нас, значит строку бросил упавший экземпляр
+                with open(path, 'r+b') as f:
+                    f.truncate(offset)
+            self._offset = offset
+        return records
+
+    def append(self, records):
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        try:
+            super().append(records)
+        finally:
+            self._journal.close()
+            self._journal = None
+
+    def compact(self):
+        super().compact()
+        self._journal.close()
+        self._journal = None
+        self._offset = os.path.getsize(self.journal_path)
+
+    def _retire_journal(self, done_path):
+        os.replace(done_path, self.prev_path)
+
+    def sync(self):
+        """Журнал сбрасывается на диск при записи, если включен fsync"""
+        pass
+
+
+def journal_generation(path):
+    """Номер свертки журнала из его первой строки (None, если файла нет)"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        line = f.readline()
+    if line.endswith(b"\n"):
+        record = json.loads(line)
+        if record["op"] == "generation":
+            return record["gen"]
+    return 0
+
+
+DEFAULT_SHARDS = 8
+
+
+def shard_of(email, count):
+    """Номер шарда аккаунта: стабильный хеш email, одинаковый в любом процессе"""
+    return zlib.crc32(email.encode("utf-8")) % count
+
+
+def split_record(record, count):
+    """Раскладываем запись журнала по шардам: номер шарда -> часть записи"""
+    if record["op"] != "post":
+        return {shard_of(record["email"], count): record}
+    parts = {}
+    for entry in record["entries"]:
+        part = parts.setdefault(shard_of(entry["email"], count), {"op": "post", "entries": []})
+        part["entries"].append(entry)
+    return parts
+
+
+class DecisionLog:
+    """Журнал решений двухфазной фиксации: номера зафиксированных переводов.
+
+    Запись txid в этот файл - точка фиксации межшардовой операции: если она
+    дописана, при восстановлении подготовленные части применяются во всех
+    шардах, иначе отбрасываются.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fsync = False
+        self.decided = 0
+        self._file = None
+
+    def load(self):
+        """Номера зафиксированных операций; недописанная строка не считается"""
+        committed = set()
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if line.endswith(b"\n"):
+                        committed.add(line.decode("ascii").strip())
+        self._file = open(self.path, 'a', encoding='ascii')
+        self.decided = len(committed)
+        return committed
+
+    def commit(self, txid):
+        self._file.write(txid + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.decided += 1
+
+    def clear(self):
+        """Очищаем журнал, когда исход всех операций записан в шарды"""
+        self._file.truncate(0)
+        self._file.seek(0)
+        self.decided = 0
+
+    def sync(self):
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ShardJournal(JournalStorage):
+    """Журнал одного шарда, который понимает записи двухфазной фиксации.
+
+    Межшардовая операция пишется как ``prepare`` с частью записи для этого
+    шарда, а потом ``commit`` или ``abort``. При чтении подготовленная часть
+    применяется на своем месте в журнале, если операция зафиксирована; если
+    маркера нет (сбой между фазами), исход берется из журнала решений.
+    """
+
+    def __init__(self, path, committed, snapshot_every=1000):
+        super().__init__(path, snapshot_every)
+        self.committed = committed
+        self.unresolved = {}
+
+    def _read_journal(self):
+        # Журнал шарда ограничен snapshot_every записями, поэтому читаем его целиком:
+        # исход подготовленной части известен только после ее маркера
+        records = list(super()._read_journal())
+        outcomes = {r["txid"]: r["op"] == "commit" for r in records if r["op"] in ("commit", "abort")}
+        self.unresolved = {}
+        for record in records:
+            op = record["op"]
+            if op == "prepare":
+                committed = outcomes.get(record["txid"])
+                if committed is None:
+                    committed = record["txid"] in self.committed
+                    self.unresolved[record["txid"]] = committed
+                if committed:
+                    yield record["record"]
+            elif op not in ("commit", "abort"):
+                yield record
+
+    def reopen(self):
+        """Открываем журнал на дозапись, не загружая аккаунты (после перешардирования)"""
+        self._recover()
+        self._pending = 0
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as f:
+                self._pending = sum(1 for _ in f)
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+
+class ShardedStorage:
+    """Аккаунты разложены по N шардам по стабильному хешу email.
+
+    Каждый шард - свой снимок и журнал (``<base>.shard<i>of<N>.json``), поэтому
+    операция с одним аккаунтом трогает один файл, а свертка переписывает только
+    шард, то есть объем записи растет с размером шарда, а не всей базы.
+    Число шардов записано в манифесте ``<base>.shards``.
+
+    Перевод между шардами проводится двухфазной фиксацией: части записи
+    готовятся в обоих шардах, решение дописывается в ``<base>.shards.2pc``,
+    затем в шарды пишутся маркеры фиксации. Списание и зачисление поэтому
+    не могут разойтись ни при каком сбое.
+    """
+
+    def __init__(self, base, snapshot_every=1000):
+        self.base = base
+        self.manifest_path = base + ".shards"
+        self.snapshot_every = snapshot_every
+        self.count = 0
+        self.shards = []
+        self.log = DecisionLog(base + ".shards.2pc")
+        self._fsync = False
+        self._committed = set()
+
+    @property
+    def fsync(self):
+        return self._fsync
+
+    @fsync.setter
+    def fsync(self, value):
+        self._fsync = value
+        self.log.fsync = value
+        for shard in self.shards:
+            shard.fsync = value
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def _shard_path(self, number, count):
+        return f"{self.base}.shard{number}of{count}.json"
+
+    def _make_shards(self, count):
+        shards = [ShardJournal(self._shard_path(i, count), self._committed, self.snapshot_every)
+                  for i in range(count)]
+        for shard in shards:
+            shard.fsync = self._fsync
+        return shards
+
+    def _open_manifest(self):
+        with open(self.manifest_path, 'r') as f:
+            self.count = json.load(f)["shards"]
+        self._remove_stale_shards()
+        self._committed.clear()
+        self._committed.update(self.log.load())
+        self.shards = self._make_shards(self.count)
+
+    def open(self):
+        """Открываем шарды на запись, не загружая аккаунты (для перешардирования)"""
+        self._open_manifest()
+        for shard in self.shards:
+            shard.reopen()
+
+    def load(self):
+        """Загружаем все шарды и доводим до конца прерванные переводы"""
+        self._open_manifest()
+        accounts = {}
+        for shard in self.shards:
+            accounts.update(shard.load())
+        resolved = False
+        for shard in self.shards:
+            for txid, committed in shard.unresolved.items():
+                shard.append([{"op": "commit" if committed else "abort", "txid": txid}])
+                resolved = True
+        if resolved:
+            for shard in self.shards:
+                shard.sync()
+        # Исход каждой операции теперь записан в шардах
+        self.log.clear()
+        return accounts
+
+    def commit(self, records):
+        """Записи одного шарда пишутся пачкой, межшардовые - двухфазной фиксацией"""
+        batches = {}
+        touched = set()
+        for record in records:
+            parts = split_record(record, self.count)
+            touched.update(parts)
+            if len(parts) == 1:
+                ((number, part),) = parts.items()
+                batches.setdefault(number, []).append(part)
+            else:
+                # Сохраняем порядок записей внутри каждого шарда
+                self._append_batches(batches)
+                batches = {}
+                self._two_phase_commit(parts)
+        self._append_batches(batches)
+        if self.log.decided >= self.snapshot_every:
+            self.log.clear()
+        for number in touched:
+            self.shards[number].maybe_compact()
+
+    def _append_batches(self, batches):
+        for number, part in batches.items():
+            self.shards[number].append(part)
+
+    def _two_phase_commit(self, parts):
+        txid = uuid.uuid4().hex
+        try:
+            for number, part in parts.items():
+                self.shards[number].append([{"op": "prepare", "txid": txid, "record": part}])
+        except Exception:
+            # Решение еще не принято: отменяем там, где успели подготовить
+            for number in parts:
+                try:
+                    self.shards[number].append([{"op": "abort", "txid": txid}])
+                except Exception:
+                    pass
+            raise
+        self.log.commit(txid)
+        self._committed.add(txid)
+        for number in parts:
+            self.shards[number].append([{"op": "commit", "txid": txid}])
+
+    def reshard(self, count):
+        """Перекладываем аккаунты в count шардов.
+
+        Новые шарды пишутся рядом (аккаунты - записями register в журнал),
+        старые читаются по одному, так что в памяти одновременно только один
+        шард. Переключение - атомарная замена манифеста; после сбоя до нее
+        остаются старые шарды, а недописанные новые удаляются при загрузке.
+        Вызывать из того же потока, что и commit.
+        """
+        if count == self.count:
+            return
+        self._write_shards(count, (
+            item for shard in self.shards for item in shard.read_state().items()
+        ))
+        old_shards = self.shards
+        self._switch_manifest(count)
+        for shard in old_shards:
+            shard.close()
+            for path in (shard.path, shard.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.shards = self._make_shards(count)
+        for shard in self.shards:
+            shard.reopen()
+        # Старых шардов больше нет, их решения не нужны
+        self.log.clear()
+
+    def import_users(self, users, count=DEFAULT_SHARDS):
+        """Создаем шарды из словаря в формате users.json"""
+        self._write_shards(count, users.items())
+        self._switch_manifest(count)
+
+    def _write_shards(self, count, users):
+        """Пишем аккаунты (email, user) в журналы новых шардов"""
+        files = [open(self._shard_path(i, count) + ".journal", 'w', encoding='utf-8') for i in range(count)]
+        try:
+            for email, user in users:
+                record = {"op": "register", "email": email, "user": user}
+                files[shard_of(email, count)].write(
+                    json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+                )
+            for f in files:
+                f.flush()
+                os.fsync(f.fileno())
+        finally:
+            for f in files:
+                f.close()
+
+    def _switch_manifest(self, count):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"shards": count}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        self.count = count
+
+    def _remove_stale_shards(self):
+        """Удаляем файлы шардов другого числа (прерванное перешардирование)"""
+        directory = os.path.dirname(os.path.abspath(self.base))
+        pattern = re.compile(re.escape(os.path.basename(self.base)) + r"\.shard\d+of(\d+)\.json")
+        for name in os.listdir(directory):
+            match = pattern.match(name)
+            if match and int(match.group(1)) != self.count:
+                os.remove(os.path.join(directory, name))
+
+    def disk_size(self):
+        """Размер всех шардов в байтах"""
+        return sum(shard.disk_size() for shard in self.shards)
+
+    def journal_size(self):
+        return sum(shard.journal_size() for shard in self.shards) + disk_size(self.log.path)
+
+    def sync(self):
+        for shard in self.shards:
+            shard.sync()
+        self.log.sync()
+
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self.log.close()
+
+
+STORAGE_MODES = ("json", "journal", "shared", "sqlite", "lazy", "sharded")
+
+
+def tool_lock(storage):
+    """Блокировка на всю работу инструмента (batch.py, eod.py, ...).
+
+    В режиме shared другие экземпляры приложения ждут, пока инструмент
+    загрузит, проверит и запишет данные; в остальных режимах с файлами
+    работает один процесс, и блокировка не нужна.
+    """
+    if isinstance(storage, SharedJournalStorage):
+        return storage.locked()
+    return nullcontext()
+
+
+def read_legacy(path):
+    """Читаем users.json вместе с хвостом журнала для переноса в другой режим"""
+    journal = JournalStorage(path)
+    journal._recover()
+    return journal.read_state()
+
+
+def make_storage(mode, path, cache_bytes=64 * 1024 * 1024, shards=DEFAULT_SHARDS):
+    """Создаем хранилище по названию режима.
+
+    ``cache_bytes`` ограничивает память под аккаунты в режимах sqlite и lazy,
+    которые загружают аккаунты по запросу. ``shards`` - число шардов для
+    новой базы в режиме sharded (у существующей оно берется из манифеста).
+    """
+    legacy_exists = os.path.exists(path) or os.path.exists(path + ".journal")
+    if mode == "json":
+        return JsonStorage(path)
+    if mode == "journal":
+        return JournalStorage(path)
+    if mode == "shared":
+        return SharedJournalStorage(path)
+    if mode == "sqlite":
+        db_path = os.path.splitext(path)[0] + ".db"
+        if not os.path.exists(db_path) and legacy_exists:
+            # Первый запуск в режиме SQLite: переносим существующий users.json
+            migrate_users(read_legacy(path), db_path)
+        return SqliteStorage(db_path, cache_bytes=cache_bytes)
+    if mode == "lazy":
+        storage = LazyJournalStorage(os.path.splitext(path)[0], cache_bytes=cache_bytes)
+        if not storage.exists() and legacy_exists:
+            storage.import_users(read_legacy(path))
+        return storage
+    if mode == "sharded":
+        storage = ShardedStorage(os.path.splitext(path)[0])
+        if not storage.exists():
+            storage.import_users(read_legacy(path) if legacy_exists else {}, shards)
+        return storage
+    raise ValueError(f"Неизвестный режим хранения: {mode}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перешардирование базы в режиме sharded")
+    parser.add_argument("users", nargs="?", default="users.json", help="путь к users.json")
+    parser.add_argument("--shards", type=int, required=True, help="новое число шардов")
+    args = parser.parse_args()
+    storage = make_storage("sharded", args.users, shards=args.shards)
+    storage.open()
+    storage.reshard(args.shards)
+    storage.close()
+    print(f"шардов: {storage.count}")
@@ -0,0 +1,49 @@
+import pytest
+
+from accounts import Account, History, TxType, add_rubles, format_amount, make_transaction, parse_amount, to_kopecks
+
+
+def test_amounts_are_exact_kopecks():
+    """Ввод разбирается через Decimal, суммы в JSON складываются в копейках"""
+    assert parse_amount("0,1") == 10
+    assert parse_amount("1.005") == 101
+    assert parse_amount("19.99") == 1999
+    for text in ("abc", "inf", "nan"):
+        with pytest.raises(ValueError):
+            parse_amount(text)
+    balance = 0
+    for _ in range(1000):
+        balance = add_rubles(balance, 0.1)
+    assert balance == 100.0
+    assert format_amount(-5) == "-0.05"
+    assert format_amount(123456, sign=True) == "+1234.56"
+
+
+def test_history_round_trips_through_json():
+    """Колоночная история отдает операции в прежнем формате users.json"""
+    transactions = [
+        make_transaction(TxType.DEPOSIT, 1050, "Пополнение", "2024-01-05 10:00:00"),
+        make_transaction(TxType.TRANSFER, -333, "Перевод пользователю b@example.com", "2024-01-06 11:30:00"),
+        make_transaction(TxType.FEE, -1, "", "2024-01-07 00:00:00")
+    ]
+    history = History.from_json(transactions)
+    assert list(history) == transactions
+    assert history[1:] == transactions[1:]
+    assert list(reversed(history)) == transactions[::-1]
+    assert history.nbytes() == 3 * 25
+
+
+def test_account_keeps_balance_in_kopecks():
+    """Баланс - целые копейки; to_json возвращает прежние поля"""
+    data = {
+        "имя": "Иван", "фамилия": "Петров", "телефон": "+70000000000", "пароль": "x",
+        "баланс": 10.1, "транзакции": [], "активен": True
+    }
+    account = Account.from_json(data)
+    for _ in range(10):
+        account.post(make_transaction(TxType.DEPOSIT, to_kopecks(0.1), "Пополнение"))
+    assert account.balance == 1110
+    saved = account.to_json()
+    assert saved["баланс"] == 11.1
+    assert len(saved["транзакции"]) == 10
+    assert Account.from_json(saved).balance == 1110
@@ -0,0 +1,58 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from accounts import ARCHIVE_CODECS, HistoryQuery, parse_date, to_kopecks
+from archive import run_archive
+from bench import email_for, generate_population
+from storage import make_storage
+
+
+def months_before(year, month):
+    """Сколько месяцев хранить, чтобы в архив ушло все раньше year-month"""
+    now = datetime.now()
+    return now.year * 12 + now.month - (year * 12 + month)
+
+
+@pytest.mark.parametrize("codec", sorted(ARCHIVE_CODECS))
+def test_archived_history_reads_as_before(tmp_path, codec):
+    """В основном файле остается свежая история, а чтение и фильтры видят всю"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 5, 12)
+    with open(path, 'r') as f:
+        original = json.load(f)
+
+    storage = make_storage("journal", path)
+    report = run_archive(storage, str(tmp_path / "archive"), months_before(2025, 7), codec)
+    storage.close()
+    assert report["аккаунтов"] == 5
+    assert report["операций"] == 5 * 6
+
+    with open(path, 'r') as f:
+        snapshot = json.load(f)
+    assert all(len(user["транзакции"]) == 6 for user in snapshot.values())
+
+    storage = make_storage("journal", path)
+    users = storage.load()
+    storage.close()
+    for i in range(5):
+        account, user = users[email_for(i)], original[email_for(i)]
+        assert list(account.history) == user["транзакции"]
+        assert account.history[4:8] == user["транзакции"][4:8]
+        query = HistoryQuery(date_from=parse_date("2025-02-01"), date_to=parse_date("2025-09-01"))
+        expected = [tx for tx in user["транзакции"] if "2025-02-01" <= tx["дата"] < "2025-09-01"]
+        assert list(account.history.select(query)) == expected
+        assert account.balance == to_kopecks(user["баланс"])
+
+
+def test_rerun_archives_only_new_months(tmp_path):
+    """Повторный запуск с тем же сроком ничего не переносит"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 3, 12)
+    months = months_before(2025, 7)
+    for expected in (3 * 6, 0):
+        storage = make_storage("journal", path)
+        report = run_archive(storage, str(tmp_path / "archive"), months)
+        storage.close()
+        assert report["операций"] == expected
@@ -0,0 +1,78 @@
+import time
+
+from bank import BankApp
+from ledger import MAX_RETRIES, ConflictError, Ledger, RetriesExhausted
+from metrics import METRICS
+
+
+class FakeRoot:
+    """Вместо окна Tk: запоминаем отложенные вызовы after"""
+
+    def __init__(self):
+        self.pending = []
+
+    def after(self, delay_ms, callback):
+        self.pending.append(callback)
+
+    def run_pending(self):
+        pending, self.pending = self.pending, []
+        for callback in pending:
+            callback()
+
+
+def make_app(conflicts):
+    """BankApp без окна: commit бросает ConflictError ``conflicts`` раз подряд"""
+    app = BankApp.__new__(BankApp)
+    app.root = FakeRoot()
+    app.saved = []
+    left = [conflicts]
+
+    def commit(records):
+        if left[0]:
+            left[0] -= 1
+            raise ConflictError()
+        app.saved.extend(records)
+
+    app.ledger = Ledger({}, commit)
+    return app
+
+
+def test_conflict_retry_is_scheduled_with_after():
+    app = make_app(conflicts=2)
+    results = []
+    record = {"op": "update", "email": "a@b.c", "fields": {}}
+    started = time.perf_counter()
+    app.run_operation(lambda: [record], lambda applied, error: results.append((applied, error)))
+    # Попытка не удалась, следующая ждет в очереди окна, а поток окна не спит
+    assert time.perf_counter() - started < 0.01
+    assert results == [] and len(app.root.pending) == 1
+    app.root.run_pending()
+    app.root.run_pending()
+    assert results == [(True, None)]
+    assert app.saved == [record]
+
+
+def test_conflicts_on_every_attempt_report_retries_exhausted():
+    app = make_app(conflicts=MAX_RETRIES)
+    results = []
+    app.run_operation(lambda: [], lambda applied, error: results.append((applied, error)))
+    while app.root.pending:
+        app.root.run_pending()
+    assert len(results) == 1
+    assert isinstance(results[0][1], RetriesExhausted)
+
+
+def test_widget_count_is_sampled_on_tk_thread(monkeypatch):
+    """Число виджетов публикуется обычным значением, обход идет в вызове из after"""
+    monkeypatch.setattr(METRICS, "enabled", True)
+    app = BankApp.__new__(BankApp)
+    app.root = FakeRoot()
+    app.widgets_ms = 1000
+    counts = iter([12, 15])
+    app.screens = type("Screens", (), {"widget_count": lambda self: next(counts)})()
+    app.sample_widgets()
+    assert METRICS.snapshot()["gauges"]["ui_widgets"] == 12
+    assert "ui_widgets" not in METRICS._gauge_functions
+    app.root.run_pending()
+    assert METRICS.snapshot()["gauges"]["ui_widgets"] == 15
+    assert len(app.root.pending) == 1
@@ -0,0 +1,71 @@
+from accounts import RECENT_OPERATIONS
+from batch import BatchLog, file_digest, read_transfers, run_batch
+from bench import email_for, generate_population
+from storage import make_storage
+
+
+def balances(path):
+    storage = make_storage("journal", path)
+    accounts = storage.load()
+    result = [accounts[email_for(i)].balance for i in range(2)]
+    storage.close()
+    return result
+
+
+def test_rerun_of_file_with_many_rows_from_one_sender(tmp_path):
+    """Больше RECENT_OPERATIONS строк одного отправителя: повторный запуск не проводит ничего"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 2, 0)
+    rows = RECENT_OPERATIONS + 36
+    payroll = tmp_path / "payroll.csv"
+    payroll.write_text(
+        "sender,recipient,amount\n" + f"{email_for(0)},{email_for(1)},1\n" * rows, encoding="utf-8"
+    )
+    digest = file_digest(str(payroll))
+    log = BatchLog(path + ".batches")
+
+    storage = make_storage("journal", path)
+    first = run_batch(storage, read_transfers(str(payroll), digest), "per-row", digest, log)
+    storage.close()
+    assert first.applied == rows
+    after_first = balances(path)
+
+    storage = make_storage("journal", path)
+    second = run_batch(storage, read_transfers(str(payroll), digest), "per-row", digest, log)
+    storage.close()
+    assert second.applied == 0
+    assert second.duplicates == rows
+    assert second.already_processed
+    assert balances(path) == after_first
+
+
+def test_rerun_of_per_row_batch_with_errors_skips_applied_rows(tmp_path):
+    """Пакет с ошибкой не помечается проведенным, но проведенные строки не повторяются"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 2, 0)
+    rows = RECENT_OPERATIONS + 36
+    payroll = tmp_path / "payroll.csv"
+    payroll.write_text(
+        "sender,recipient,amount\n"
+        + f"{email_for(0)},{email_for(1)},1\n" * rows
+        + f"{email_for(0)},nobody@bench.local,1\n",
+        encoding="utf-8"
+    )
+    digest = file_digest(str(payroll))
+    log = BatchLog(path + ".batches")
+
+    storage = make_storage("journal", path)
+    first = run_batch(storage, read_transfers(str(payroll), digest), "per-row", digest, log)
+    storage.close()
+    assert first.applied == rows and len(first.errors) == 1
+    assert digest not in log
+    after_first = balances(path)
+
+    storage = make_storage("journal", path)
+    second = run_batch(storage, read_transfers(str(payroll), digest), "per-row", digest, log)
+    storage.close()
+    assert not second.already_processed
+    assert second.applied == 0
+    assert second.duplicates == rows
+    assert len(second.errors) == 1
+    assert balances(path) == after_first
@@ -0,0 +1,44 @@
+import json
+
+from accounts import to_kopecks
+from bench import compare, email_for, generate_population, percentiles, run_scenario
+
+
+def test_population_is_reproducible_and_consistent(tmp_path):
+    """Одинаковый seed дает одинаковую базу, баланс сходится с историей"""
+    first, second = tmp_path / "a.json", tmp_path / "b.json"
+    generate_population(str(first), 10, 15, seed=7)
+    generate_population(str(second), 10, 15, seed=7)
+    a = json.loads(first.read_text())
+    b = json.loads(second.read_text())
+    for user in b.values():
+        user["пароль"] = None
+    for email, user in a.items():
+        assert to_kopecks(user["баланс"]) == 100000 + sum(to_kopecks(tx["сумма"]) for tx in user["транзакции"])
+        user["пароль"] = None
+        assert user == b[email]
+    assert list(a) == [email_for(i) for i in range(10)]
+
+
+def test_scenario_reports_every_operation(tmp_path):
+    """Прогон в процессе теста: по каждой операции есть перцентили"""
+    generate_population(str(tmp_path / "users.json"), 20, 3)
+    run = run_scenario("journal", 20, 3, 10, 1, str(tmp_path))
+    assert run["mode"] == "journal" and run["disk_bytes"] > 0
+    for name in ("register", "deposit", "withdraw", "history"):
+        assert run["ops"][name]["count"] == 10
+        stats = run["ops"][name]
+        assert stats["p50_ms"] <= stats["p90_ms"] <= stats["p99_ms"] <= stats["max_ms"]
+
+
+def test_compare_flags_regressions_over_tolerance():
+    """Сравнение с прошлым прогоном: отмечаются только ухудшения сверх допуска"""
+    def result(startup, p50):
+        ops = {"deposit": {"p50_ms": p50}, "history": {}}
+        return {"runs": [{"mode": "journal", "accounts": 100, "history_depth": 5, "startup_sec": startup, "ops": ops}]}
+
+    assert percentiles([]) == {}
+    assert compare(result(1.1, 2.2), result(1.0, 2.0), 0.2) == []
+    regressions = compare(result(1.5, 2.0), result(1.0, 2.0), 0.2)
+    assert [r["metric"] for r in regressions] == ["startup_sec"]
+    assert compare(result(9.0, 9.0), {"runs": []}, 0.2) == []
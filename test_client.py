@@ -0,0 +1,100 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from client import STREAM_PAGES, LedgerClient, RemoteLedger
+from ledger import LedgerError
+from service import encode
+
+
+class FakeService:
+    """Сервис-заглушка на Unix-сокете: respond(request, send) отвечает на запрос"""
+
+    def __init__(self, path, respond):
+        self.respond = respond
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(1)
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        conn, _ = self.server.accept()
+        with conn:
+            try:
+                for line in conn.makefile('rb'):
+                    self.respond(json.loads(line), lambda frame: conn.sendall(encode(frame)))
+            except OSError:
+                pass
+
+    def close(self):
+        self.server.close()
+
+
+@pytest.fixture
+def address(tmp_path):
+    return "unix:" + str(tmp_path / "bank.sock")
+
+
+def test_request_fails_when_service_is_silent(address):
+    service = FakeService(address[len("unix:"):], lambda request, send: None)
+    client = LedgerClient(address, timeout=0.2)
+    started = time.monotonic()
+    with pytest.raises(LedgerError, match="Сервер не отвечает"):
+        client.request("account")
+    assert time.monotonic() - started < 2
+    assert not client._handlers
+    client.close()
+    service.close()
+
+
+def test_abandoned_stream_is_unregistered(address):
+    def respond(request, send):
+        if request["op"] == "history":
+            for i in range(STREAM_PAGES * 4):
+                send({"id": request["id"], "page": [i]})
+            send({"id": request["id"], "ok": True, "result": None})
+        else:
+            send({"id": request["id"], "ok": True, "result": "pong"})
+
+    service = FakeService(address[len("unix:"):], respond)
+    client = LedgerClient(address, timeout=2)
+    pages = client.stream("history")
+    assert next(pages) == [0]
+    pages.close()
+    assert not client._handlers
+    # Остаток потока отброшен, поток чтения не застрял на полной очереди
+    assert client.request("ping") == "pong"
+    client.close()
+    service.close()
+
+
+def test_remote_ledger_reports_through_callback(address):
+    def respond(request, send):
+        if request["amount"] > 100:
+            send({"id": request["id"], "ok": False, "error": "Недостаточно средств!"})
+        else:
+            send({"id": request["id"], "ok": True, "result": {"duplicate": request["op_id"] == "seen"}})
+
+    service = FakeService(address[len("unix:"):], respond)
+    client = LedgerClient(address, timeout=2)
+    ledger = RemoteLedger(client)
+    results = []
+    done = threading.Semaphore(0)
+
+    def callback(applied, error):
+        results.append((applied, error))
+        done.release()
+
+    ledger.deposit("a@b.c", 10, "new", callback)
+    ledger.deposit("a@b.c", 10, "seen", callback)
+    ledger.withdraw("a@b.c", 500, "big", callback)
+    for _ in range(3):
+        assert done.acquire(timeout=2)
+    assert results[:2] == [(True, None), (False, None)]
+    assert results[2][0] is None and isinstance(results[2][1], LedgerError)
+    client.close()
+    service.close()
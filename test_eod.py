@@ -0,0 +1,120 @@
+from datetime import datetime
+
+import pytest
+
+from accounts import DATE_FORMAT, TxType, make_transaction
+from bench import email_for, generate_population
+from eod import INTEREST_DESCRIPTION, Columns, EodLog, EodRules, compute, eod_operation_id, parse_rate, run_eod
+from ledger import entry
+from storage import make_storage
+
+RULES = EodRules(annual_rate_bp=50000, fee=100, fee_below=10 ** 12)
+
+
+def balances(path, count):
+    storage = make_storage("journal", path)
+    accounts = storage.load()
+    storage.close()
+    return {email_for(i): accounts[email_for(i)].balance for i in range(count)}
+
+
+def close_day(path, log):
+    storage = make_storage("journal", path)
+    report = run_eod(storage, RULES, log=log)
+    storage.close()
+    return report
+
+
+def test_rerun_same_day_posts_nothing(tmp_path):
+    """Повторное закрытие дня не начисляет проценты и комиссию второй раз"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 20, 2)
+    log = EodLog(path + ".eod")
+
+    first = close_day(path, log)
+    assert first.committed and first.interest_accounts and first.fee_accounts
+    after_first = balances(path, 20)
+
+    second = close_day(path, log)
+    assert second.already_closed
+    assert not second.committed
+    assert balances(path, 20) == after_first
+
+
+def test_rerun_after_lost_log_entry_is_skipped_per_account(tmp_path):
+    """Сбой до записи дня в журнал: повтор отсекают номера операций каждого счета"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 20, 2)
+
+    first = close_day(path, None)
+    assert first.committed
+    after_first = balances(path, 20)
+
+    second = close_day(path, EodLog(path + ".eod"))
+    assert not second.already_closed
+    assert balances(path, 20) == after_first
+
+
+def test_known_accrual_of_one_account_does_not_drop_others(tmp_path):
+    """Начисление, уже проведенное на одном счете, не мешает остальным"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 5, 2)
+    before = balances(path, 5)
+    date = datetime.now().strftime(DATE_FORMAT)
+    first = email_for(0)
+
+    storage = make_storage("journal", path)
+    storage.load()
+    storage.commit([{"op": "post", "entries": [entry(
+        first,
+        make_transaction(TxType.INTEREST, 1, INTEREST_DESCRIPTION, date),
+        eod_operation_id(date, "interest", first)
+    )]}])
+    storage.close()
+
+    report = close_day(path, None)
+    assert report.committed
+    after = balances(path, 5)
+    assert after[first] == before[first] + 1 - RULES.fee
+    assert all(after[email] > before[email] for email in after if email != first)
+
+
+def expected_accruals(balance, active, rules):
+    """Правила закрытия дня для одного счета, как они описаны в EodRules"""
+    if not active:
+        return 0, 0
+    interest = 0
+    if balance >= rules.interest_min:
+        interest = max(balance * rules.annual_rate_bp // (365 * 100 * 100), 0)
+        if rules.interest_cap is not None:
+            interest = min(interest, rules.interest_cap)
+    after = balance + interest
+    fee = min(rules.fee, max(after, 0)) if after < rules.fee_below else 0
+    return interest, fee
+
+
+def sample_columns():
+    columns = Columns()
+    for i, balance in enumerate((-500, 0, 50, 99999, 100000, 730000, 10 ** 9, 10 ** 12)):
+        columns.append(f"c{i}", balance, True)
+        columns.append(f"b{i}", balance, False)
+    return columns
+
+
+SAMPLE_RULES = EodRules(annual_rate_bp=parse_rate("7,3"), interest_min=100, interest_cap=50000, fee=9900,
+                        fee_below=100000)
+
+
+def test_column_engine_follows_rules():
+    """Расчет по колонкам совпадает с правилами для каждого счета"""
+    columns = sample_columns()
+    _, interest, fees = compute(columns, SAMPLE_RULES, "array")
+    expected = [expected_accruals(b, a, SAMPLE_RULES) for b, a in zip(columns.balances, columns.active)]
+    assert list(zip(interest, fees)) == expected
+
+
+def test_numpy_engine_matches_columns():
+    """NumPy считает то же, что и проход по колонкам"""
+    pytest.importorskip("numpy")
+    columns = sample_columns()
+    assert compute(columns, SAMPLE_RULES, "numpy")[1:] == compute(columns, SAMPLE_RULES, "array")[1:]
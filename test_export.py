@@ -0,0 +1,66 @@
+import csv
+import gzip
+import json
+import threading
+
+from accounts import History, HistoryQuery, TxType
+from export import ExportJob, account_rows, export
+
+
+def sample_history(count):
+    history = History()
+    for i in range(count):
+        history.append_raw(1_700_000_000 + i * 60, TxType.DEPOSIT if i % 2 else TxType.WITHDRAW, (i + 1) * 100)
+    return history
+
+
+def run_job(source, path, cancel=False):
+    done = threading.Event()
+    result = {}
+
+    def on_done(rows, error):
+        result["rows"], result["error"] = rows, error
+        done.set()
+
+    job = ExportJob(source, path, lambda callback, *args: callback(*args), lambda *args: None, on_done)
+    if cancel:
+        job.cancel()
+    job.start()
+    assert done.wait(5)
+    return result
+
+
+def test_export_csv_and_compressed_jsonl(tmp_path):
+    history = sample_history(10)
+    query = HistoryQuery(types=[TxType.DEPOSIT])
+    source = lambda: account_rows("a@b.c", history, query)
+
+    path = str(tmp_path / "out.csv")
+    assert export(source, path, "csv") == 5
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ["email", "дата", "тип", "сумма", "описание"]
+    assert len(rows) == 6 and all(row[0] == "a@b.c" for row in rows[1:])
+
+    path = str(tmp_path / "out.jsonl.gz")
+    assert export(source, path, "jsonl", compress=True) == 5
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert [json.loads(line)["сумма"] for line in f] == [2.0, 4.0, 6.0, 8.0, 10.0]
+
+
+def test_job_reports_unexpected_errors(tmp_path):
+    def broken_source():
+        raise KeyError("нет колонки")
+
+    path = tmp_path / "out.csv"
+    result = run_job(broken_source, str(path))
+    assert result["rows"] is None and "нет колонки" in result["error"]
+    assert not path.exists() and not (tmp_path / "out.csv.tmp").exists()
+
+
+def test_cancelled_job_leaves_no_file(tmp_path):
+    history = sample_history(1000)
+    path = tmp_path / "out.csv"
+    result = run_job(lambda: account_rows("a@b.c", history, HistoryQuery()), str(path), cancel=True)
+    assert result == {"rows": None, "error": None}
+    assert not path.exists()
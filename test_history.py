@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from accounts import TRANSFER_FROM, TRANSFER_TO, History, HistoryQuery, TxType
+
+
+def random_history(rng, count, shuffled):
+    """История со сдвигами дат назад (операции, пришедшие задним числом)"""
+    history = History()
+    date = 1_700_000_000
+    for i in range(count):
+        date += rng.randint(0, 3600)
+        when = date - rng.randint(0, 86400) if shuffled and rng.random() < 0.2 else date
+        tx_type = rng.choice([TxType.DEPOSIT, TxType.WITHDRAW, TxType.TRANSFER])
+        description = ""
+        if tx_type == TxType.TRANSFER:
+            description = rng.choice([TRANSFER_TO, TRANSFER_FROM]) + rng.choice(["a@b.c", "D@e.f"])
+        history.append_raw(when, tx_type, rng.randint(-5000, 5000), description)
+    return history
+
+
+def brute_force(history, query):
+    return [i for i in range(len(history)) if query.matches(history, i)]
+
+
+def queries(history):
+    middle = sorted(history.dates)[len(history) // 2]
+    return [
+        HistoryQuery(),
+        HistoryQuery(date_from=middle),
+        HistoryQuery(date_to=middle),
+        HistoryQuery(date_from=middle - 7200, date_to=middle + 7200),
+        HistoryQuery(types=[TxType.TRANSFER], amount_min=1000),
+        HistoryQuery(counterparty="d@e.f", date_to=middle),
+        HistoryQuery(date_from=middle, types=[TxType.DEPOSIT, TxType.WITHDRAW], amount_max=2000),
+    ]
+
+
+@pytest.mark.parametrize("shuffled", [False, True])
+def test_filter_matches_full_scan(shuffled):
+    rng = random.Random(7)
+    history = random_history(rng, 500, shuffled)
+    for query in queries(history):
+        assert history.filter(query) == brute_force(history, query)
+
+
+def test_index_follows_appends_with_earlier_dates():
+    rng = random.Random(11)
+    history = random_history(rng, 200, False)
+    history.filter(HistoryQuery())
+    assert history.index.order is None
+    # Операция задним числом включает отдельный порядок по дате, дальше он пополняется
+    extra = random_history(rng, 300, True)
+    for date, tx_type, amount, description in extra.rows():
+        history.append_raw(date - 86400 * 30, tx_type, amount, description)
+    assert history.index.order is not None
+    assert list(history.index.order_dates) == sorted(history.dates)
+    for query in queries(history):
+        assert history.filter(query) == brute_force(history, query)
+
+
+def test_selection_and_scan_agree_with_filter():
+    history = random_history(random.Random(3), 300, True)
+    query = HistoryQuery(types=[TxType.TRANSFER], counterparty="a@b.c")
+    positions = history.filter(query)
+    selection = history.select(query)
+    assert len(selection) == len(positions)
+    assert selection[:] == [history[i] for i in positions]
+    total, rows = history.scan(query)
+    assert total == len(history)
+    assert [tx for _, tx in rows] == [history[i] for i in positions]
@@ -0,0 +1,52 @@
+from history_view import HistoryPager
+
+
+class SlicedHistory:
+    """История, которая считает прочитанные строки"""
+
+    def __init__(self, count):
+        self.items = [{"номер": i} for i in range(count)]
+        self.read = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        rows = self.items[index]
+        self.read += len(rows)
+        return rows
+
+
+def numbers(rows):
+    return [row["номер"] for row in rows]
+
+
+def test_rows_are_newest_first_across_pages():
+    """Окно строк через границу страниц, нулевая строка - самая новая"""
+    pager = HistoryPager(SlicedHistory(1000), page_size=100)
+    assert numbers(pager.rows(0, 3)) == [999, 998, 997]
+    assert numbers(pager.rows(98, 4)) == [901, 900, 899, 898]
+    assert numbers(pager.rows(997, 10)) == [2, 1, 0]
+
+
+def test_only_visible_pages_are_read():
+    """Читаются только нужные страницы, повторная прокрутка идет из кеша"""
+    history = SlicedHistory(100000)
+    pager = HistoryPager(history, page_size=200, cached_pages=2)
+    pager.rows(50000, 14)
+    assert history.read == 200
+    pager.rows(50005, 14)
+    assert history.read == 200
+    pager.rows(0, 14)
+    pager.rows(400, 14)
+    pager.rows(50000, 14)
+    assert history.read == 800
+
+
+def test_new_operation_shows_on_top():
+    """После новой операции страницы читаются заново"""
+    history = SlicedHistory(10)
+    pager = HistoryPager(history, page_size=4)
+    assert numbers(pager.rows(0, 2)) == [9, 8]
+    history.items.append({"номер": 10})
+    assert numbers(pager.rows(0, 2)) == [10, 9]
@@ -0,0 +1,105 @@
+import json
+import os
+
+from bench import email_for, generate_population
+from ledger import Ledger
+from storage import JournalStorage, apply_record
+
+
+def open_journal(path, snapshot_every=1000):
+    storage = JournalStorage(path, snapshot_every)
+    accounts = storage.load()
+
+    def commit(records):
+        storage.commit(records)
+        for record in records:
+            apply_record(accounts, record)
+
+    return storage, accounts, Ledger(accounts, commit)
+
+
+def balances(accounts, count):
+    return [accounts[email_for(i)].balance for i in range(count)]
+
+
+def test_journal_replays_over_snapshot(tmp_path):
+    """Операции дописываются в журнал, снимок не переписывается, загрузка их повторяет"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 3, 2)
+    snapshot = os.path.getmtime(path), os.path.getsize(path)
+
+    storage, accounts, ledger = open_journal(path)
+    ledger.deposit(email_for(0), 500)
+    ledger.transfer(email_for(0), email_for(1), 200)
+    expected = balances(accounts, 3)
+    storage.close()
+
+    assert (os.path.getmtime(path), os.path.getsize(path)) == snapshot
+    storage, accounts, _ = open_journal(path)
+    assert balances(accounts, 3) == expected
+    assert len(accounts[email_for(1)].history) == 3
+    storage.close()
+
+
+def test_torn_last_line_is_dropped(tmp_path):
+    """Недописанная при сбое строка журнала отбрасывается и обрезается"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 2, 0)
+    storage, accounts, ledger = open_journal(path)
+    ledger.deposit(email_for(0), 500)
+    expected = balances(accounts, 2)
+    storage.close()
+
+    with open(path + ".journal", 'a', encoding='utf-8') as f:
+        f.write('{"op":"post","entries":[{"email"')
+    storage, accounts, ledger = open_journal(path)
+    assert balances(accounts, 2) == expected
+    ledger.deposit(email_for(1), 300)
+    storage.close()
+
+    storage, accounts, _ = open_journal(path)
+    assert balances(accounts, 2) == [expected[0], expected[1] + 300]
+    storage.close()
+
+
+def test_compaction_folds_journal_into_snapshot(tmp_path):
+    """Каждые snapshot_every записей журнал сворачивается в снимок"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 2, 0)
+    storage, accounts, ledger = open_journal(path, snapshot_every=3)
+    for _ in range(7):
+        ledger.deposit(email_for(0), 100)
+    expected = balances(accounts, 2)
+    assert storage.generation == 2
+    storage.close()
+
+    with open(path + ".journal", 'r', encoding='utf-8') as f:
+        assert len(f.readlines()) == 2
+    storage, accounts, _ = open_journal(path)
+    assert balances(accounts, 2) == expected
+    assert storage.generation == 2
+    storage.close()
+
+
+def test_interrupted_compaction_is_finished_on_load(tmp_path):
+    """Сбой после записи нового снимка: загрузка доводит свертку до конца"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 2, 0)
+    storage, accounts, ledger = open_journal(path)
+    ledger.deposit(email_for(0), 100)
+    expected = balances(accounts, 2)
+    storage.close()
+
+    # Состояние между "журнал отложен" и "снимок заменен"
+    storage = JournalStorage(path)
+    users = storage.read_state()
+    storage.close()
+    with open(path + ".tmp", 'w') as f:
+        json.dump(users, f)
+    os.replace(path + ".journal", path + ".journal.done")
+
+    storage, accounts, _ = open_journal(path)
+    assert balances(accounts, 2) == expected
+    assert not os.path.exists(path + ".tmp")
+    assert not os.path.exists(path + ".journal.done")
+    storage.close()
@@ -0,0 +1,92 @@
+from bench import email_for, generate_population
+from cache import AccountCache
+from lazy_storage import LazyJournalStorage
+from ledger import Ledger
+from storage import read_legacy
+
+
+class FakeSource:
+    """Источник аккаунтов по 100 байт, который считает загрузки"""
+
+    def __init__(self, count):
+        self.accounts = {email_for(i): {"номер": i} for i in range(count)}
+        self.loads = []
+
+    def has_account(self, email):
+        return email in self.accounts
+
+    def load_account(self, email):
+        self.loads.append(email)
+        user = self.accounts.get(email)
+        return None if user is None else (user, 100)
+
+    def count_accounts(self):
+        return len(self.accounts)
+
+    def iter_emails(self):
+        return iter(self.accounts)
+
+
+def test_cache_evicts_least_recently_used():
+    """Сверх лимита вытесняется давно не использованный аккаунт"""
+    source = FakeSource(4)
+    cache = AccountCache(source, max_bytes=300)
+    for i in range(3):
+        cache[email_for(i)]
+    cache[email_for(0)]
+    cache[email_for(3)]
+    assert cache.size == 300
+    source.loads.clear()
+    cache[email_for(0)]
+    cache[email_for(1)]
+    assert source.loads == [email_for(1)]
+    assert (cache.hits, cache.misses) == (2, 5)
+
+
+def test_pinned_account_is_not_evicted():
+    """Закрепленный аккаунт остается в памяти, пока его не открепят"""
+    source = FakeSource(4)
+    cache = AccountCache(source, max_bytes=200)
+    cache[email_for(0)]
+    cache.pin(email_for(0))
+    for i in range(1, 4):
+        cache[email_for(i)]
+    source.loads.clear()
+    cache[email_for(0)]
+    assert source.loads == []
+    cache.unpin(email_for(0))
+    cache[email_for(1)]
+    cache[email_for(2)]
+    cache[email_for(0)]
+    assert source.loads == [email_for(1), email_for(2), email_for(0)]
+
+
+def test_evicted_account_is_reloaded_with_journal_changes(tmp_path):
+    """Вытесненный аккаунт читается из снимка вместе с хвостом журнала"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 20, 5)
+    storage = LazyJournalStorage(str(tmp_path / "users"), cache_bytes=1)
+    storage.import_users(read_legacy(path))
+    users = storage.load()
+    assert len(users) == 20
+    ledger = Ledger(users, storage.commit)
+    before = users[email_for(3)].balance
+    ledger.deposit(email_for(3), 900)
+    for i in range(10, 20):
+        users[email_for(i)]
+    assert users[email_for(3)].balance == before + 900
+    assert len(users[email_for(3)].history) == 6
+    storage.close()
+
+    storage = LazyJournalStorage(str(tmp_path / "users"))
+    users = storage.load()
+    assert users[email_for(3)].balance == before + 900
+    storage.compact()
+    storage.close()
+
+    storage = LazyJournalStorage(str(tmp_path / "users"))
+    users = storage.load()
+    assert storage.gen == 2
+    assert users[email_for(3)].balance == before + 900
+    assert len(users[email_for(3)].history) == 6
+    storage.close()
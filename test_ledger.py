@@ -0,0 +1,76 @@
+import pytest
+
+from accounts import RECENT_OPERATIONS
+from bench import email_for, generate_population
+from ledger import Ledger
+from storage import STORAGE_MODES, apply_record, make_storage
+
+# Режимы, где запись журнала применяется целиком ко всем счетам сразу;
+# lazy и sharded раскладывают ее по счетам, повтор там отсекает Ledger
+WHOLE_RECORD_MODES = ("journal", "json", "shared", "sqlite")
+
+
+def open_ledger(storage):
+    accounts = storage.load()
+
+    def commit(records):
+        storage.commit(records)
+        for record in records:
+            apply_record(accounts, record)
+
+    return accounts, Ledger(accounts, commit)
+
+
+def total_balance(storage):
+    accounts = storage.load()
+    return sum(accounts[email_for(i)].balance for i in range(3))
+
+
+def fill_sender_window(ledger, sender, recipient):
+    """Столько операций отправителя, чтобы старые номера вытеснились"""
+    for i in range(RECENT_OPERATIONS + 5):
+        assert ledger.transfer(sender, recipient, 100, f"fill-{i}")
+
+
+@pytest.mark.parametrize("mode", STORAGE_MODES)
+def test_transfer_repeat_after_sender_evicted(tmp_path, mode):
+    """Номер вытеснен у отправителя, но есть у получателя: перевод не повторяется"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 3, 0)
+    a, b, c = email_for(0), email_for(1), email_for(2)
+    storage = make_storage(mode, path)
+    accounts, ledger = open_ledger(storage)
+    before = sum(accounts[email].balance for email in (a, b, c))
+
+    assert ledger.transfer(a, b, 1000, "payroll-1")
+    fill_sender_window(ledger, a, c)
+    assert not accounts[a].has_operation("payroll-1")
+    assert not ledger.transfer(a, b, 1000, "payroll-1")
+    assert sum(accounts[email].balance for email in (a, b, c)) == before
+    storage.close()
+
+    storage = make_storage(mode, path)
+    assert total_balance(storage) == before
+    storage.close()
+
+
+@pytest.mark.parametrize("mode", WHOLE_RECORD_MODES)
+def test_replayed_transfer_record_is_skipped_whole(tmp_path, mode):
+    """Повтор записи журнала пропускает перевод целиком, а не одну его сторону"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 3, 0)
+    a, b, c = email_for(0), email_for(1), email_for(2)
+    storage = make_storage(mode, path)
+    accounts, ledger = open_ledger(storage)
+    before = sum(accounts[email].balance for email in (a, b, c))
+
+    record = ledger.transfer_record(a, b, 1000, op_id="payroll-1")
+    ledger.commit([record])
+    fill_sender_window(ledger, a, c)
+    ledger.commit([record])
+    assert sum(accounts[email].balance for email in (a, b, c)) == before
+    storage.close()
+
+    storage = make_storage(mode, path)
+    assert total_balance(storage) == before
+    storage.close()
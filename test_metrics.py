@@ -0,0 +1,55 @@
+import json
+
+from metrics import METRICS, Metrics, MetricsExporter, timed
+
+
+def test_disabled_metrics_record_nothing():
+    """Выключенные метрики не копят значений"""
+    metrics = Metrics()
+    with metrics.timer("commit"):
+        pass
+    metrics.count("rows", 5)
+    metrics.gauge("widgets", 3)
+    snapshot = metrics.snapshot()
+    assert (snapshot["timers"], snapshot["counters"], snapshot["gauges"]) == ({}, {}, {})
+
+
+def test_snapshot_and_prometheus_text():
+    """Таймеры, счетчики и показатели попадают в снимок и в формат Prometheus"""
+    metrics = Metrics()
+    metrics.enabled = True
+    metrics.observe("commit", 0.002)
+    metrics.observe("commit", 0.004)
+    metrics.count("rows", 5)
+    metrics.count("rows")
+    metrics.gauge("widgets", 3)
+    metrics.gauge_function("cache_hits", lambda: 0.5)
+    metrics.gauge_function("broken", lambda: 1 / 0)
+    snapshot = metrics.snapshot()
+    assert snapshot["timers"]["commit"] == {"count": 2, "sum_sec": 0.006, "avg_ms": 3.0, "max_ms": 4.0}
+    assert snapshot["counters"] == {"rows": 6}
+    assert snapshot["gauges"] == {"widgets": 3, "cache_hits": 0.5, "broken": None}
+    text = metrics.to_prometheus(snapshot)
+    assert "bank_commit_seconds_count 2\n" in text
+    assert "bank_rows_total 6\n" in text
+    assert "bank_cache_hits 0.5\n" in text
+    assert "broken" not in text
+
+
+def test_timed_decorator_and_exporter(tmp_path, monkeypatch):
+    """Декоратор пишет в общий METRICS, выгрузка при закрытии пишет файл целиком"""
+    monkeypatch.setattr(METRICS, "enabled", True)
+    METRICS.reset()
+
+    @timed("work")
+    def work(value):
+        return value * 2
+
+    try:
+        assert work(21) == 42
+        path = str(tmp_path / "metrics.json")
+        MetricsExporter(path, fmt="json", interval=60).close()
+        with open(path, 'r', encoding='utf-8') as f:
+            assert json.load(f)["timers"]["work"]["count"] == 1
+    finally:
+        METRICS.reset()
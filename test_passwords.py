@@ -0,0 +1,45 @@
+import hashlib
+import queue
+import threading
+
+from passwords import MIN_ITERATIONS, HashingService, hash_password, needs_upgrade, verify_password
+
+
+def test_salted_hash_and_legacy_format():
+    """Новый хеш соленый, старый SHA-256 без соли проверяется и требует обновления"""
+    first = hash_password("секрет", iterations=1000)
+    second = hash_password("секрет", iterations=1000)
+    assert first != second
+    assert verify_password("секрет", first)
+    assert not verify_password("другой", first)
+    legacy = hashlib.sha256("секрет".encode()).hexdigest()
+    assert verify_password("секрет", legacy)
+    assert needs_upgrade(legacy, 1000)
+    assert needs_upgrade(first, 2000)
+    assert not needs_upgrade(first, 1000)
+
+
+def test_service_hashes_off_the_calling_thread():
+    """Хеш считается в пуле, результат и ошибки приходят через notify"""
+    results = queue.Queue()
+
+    def notify(callback, result, error):
+        results.put((threading.current_thread(), callback, result, error))
+
+    service = HashingService(notify, iterations=MIN_ITERATIONS)
+    try:
+        service.hash("секрет", "hashed")
+        thread, callback, stored, error = results.get(timeout=10)
+        assert thread is not threading.current_thread()
+        assert (callback, error) == ("hashed", None)
+        assert stored.split("$")[1] == str(MIN_ITERATIONS)
+
+        service.verify("секрет", stored, "verified")
+        assert results.get(timeout=10)[1:] == ("verified", True, None)
+
+        service.verify("секрет", "pbkdf2_sha256$испорчен", "broken")
+        _, callback, result, error = results.get(timeout=10)
+        assert (callback, result) == ("broken", None)
+        assert error
+    finally:
+        service.close()
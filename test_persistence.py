@@ -0,0 +1,58 @@
+import threading
+import time
+
+from persistence import WriteBehind
+
+
+class RecordingStorage:
+    """Хранилище-заглушка: запоминаем записи и вызовы fsync"""
+
+    def __init__(self):
+        self.fsync = False
+        self.records = []
+        self.syncs = 0
+        self.closed = False
+        self.synced = threading.Event()
+
+    def commit(self, records):
+        self.records.extend(records)
+
+    def sync(self):
+        self.syncs += 1
+        self.synced.set()
+
+    def close(self):
+        self.closed = True
+
+
+def test_submitted_records_are_grouped_and_saved():
+    storage = RecordingStorage()
+    writer = WriteBehind(storage, flush_interval=0.05, fsync="never")
+    errors = []
+    for i in range(5):
+        writer.submit([{"n": i}], errors.append)
+    writer.flush()
+    assert storage.records == [{"n": i} for i in range(5)]
+    assert errors == [None] * 5
+    writer.close()
+    assert storage.closed and storage.syncs == 0
+
+
+def test_periodic_policy_syncs_after_idle_interval():
+    storage = RecordingStorage()
+    writer = WriteBehind(storage, flush_interval=0.01, fsync="periodic", fsync_interval=0.2)
+    writer.submit([{"n": 1}])
+    writer.flush()
+    assert storage.syncs == 0
+    # Новых записей нет, но поток сам сбрасывает последнюю группу на диск
+    assert storage.synced.wait(2)
+    writer.close()
+
+
+def test_periodic_policy_does_not_sync_without_writes():
+    storage = RecordingStorage()
+    writer = WriteBehind(storage, flush_interval=0.01, fsync="periodic", fsync_interval=0.05)
+    time.sleep(0.2)
+    assert storage.syncs == 0
+    writer.close()
+    assert storage.syncs == 1
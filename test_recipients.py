@@ -0,0 +1,38 @@
+from recipients import PrefixIndex
+
+
+def brute_force(entries, prefix, limit, exclude=None):
+    prefix = prefix.strip().lower()
+    result = []
+    for key, email in sorted(entries):
+        if key.startswith(prefix) and email != exclude and email not in result:
+            result.append(email)
+    return result[:limit]
+
+
+def test_search_matches_email_and_name_prefixes():
+    """Поиск по началу email или имени без учета регистра, без повторов и себя"""
+    names = {"anna@example.com": "Анна Смирнова", "boris@example.com": "Борис Анисимов"}
+    index = PrefixIndex.build(["anna@example.com", "boris@example.com", "annette@example.com"], names)
+    assert index.search("ANN") == ["anna@example.com", "annette@example.com"]
+    assert index.search("ан") == ["anna@example.com"]
+    assert index.search("бор") == ["boris@example.com"]
+    assert index.search(" ann ", exclude="anna@example.com") == ["annette@example.com"]
+    assert index.search("   ") == []
+
+
+def test_incremental_adds_agree_with_build():
+    """Добавление после регистрации дает тот же порядок, что и построение разом"""
+    emails = [f"user{i:03d}@example.com" for i in range(300)]
+    names = {email: f"Клиент {i}" for i, email in enumerate(emails)}
+    built = PrefixIndex.build(emails, names)
+    grown = PrefixIndex()
+    for email in reversed(emails):
+        grown.add(email, names[email])
+        grown.add(email, names[email])
+    assert len(grown) == len(built) == 600
+    entries = [(email, email) for email in emails] + [(name.lower(), email) for email, name in names.items()]
+    for prefix in ("user1", "user00", "клиент 3", "user299", "x"):
+        expected = brute_force(entries, prefix, 4)
+        assert built.search(prefix, 4) == expected
+        assert grown.search(prefix, 4) == expected
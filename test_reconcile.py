@@ -0,0 +1,85 @@
+import json
+
+from bench import email_for, generate_population
+from ledger import Ledger
+from reconcile import run_reconcile
+from storage import JournalStorage, make_storage
+
+
+def reconcile(path, **kwargs):
+    storage = make_storage("journal", path)
+    report = run_reconcile(storage, **kwargs)
+    storage.close()
+    return report
+
+
+def commit(path, build):
+    storage = make_storage("journal", path)
+    accounts = storage.load()
+    storage.commit([build(Ledger(accounts, None))])
+    storage.close()
+
+
+def edit_snapshot(path, change):
+    """Правим users.json в обход приложения (после свертки журнала)"""
+    storage = JournalStorage(path)
+    storage.load()
+    storage.compact()
+    storage.close()
+    with open(path, 'r') as f:
+        users = json.load(f)
+    change(users)
+    with open(path, 'w') as f:
+        json.dump(users, f)
+
+
+def test_incremental_run_checks_only_new_operations(tmp_path):
+    """Первый запуск закрывает все счета, следующий - только счета с новыми операциями"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 6, 10)
+    first = reconcile(path, workers=1)
+    assert first.ok and first.sealed == 6 and first.operations == 60
+
+    commit(path, lambda ledger: ledger.transfer_record(email_for(0), email_for(1), 500))
+    second = reconcile(path, workers=0)
+    assert second.ok
+    assert second.sealed == 2
+    assert second.operations == 2
+
+
+def test_balance_edit_and_lost_transfer_leg_are_reported(tmp_path):
+    """Правка баланса и перевод без второй стороны попадают в отчет"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 4, 5)
+    assert reconcile(path, workers=0).ok
+
+    def transfer_without_recipient(ledger):
+        record = ledger.transfer_record(email_for(2), email_for(3), 700)
+        record["entries"] = [e for e in record["entries"] if e["email"] == email_for(2)]
+        # Позже контрольных точек: перевод в ту же секунду, что и точка, уже считается сверенным
+        record["entries"][0]["tx"]["дата"] = "2099-01-01 00:00:00"
+        return record
+
+    commit(path, transfer_without_recipient)
+    edit_snapshot(path, lambda users: users[email_for(0)].update(баланс=users[email_for(0)]["баланс"] + 1))
+    report = reconcile(path, workers=0)
+    assert not report.ok
+    assert list(report.problems) == [email_for(0)]
+    assert [(key[:3], side) for key, side in report.unmatched] == [((email_for(2), email_for(3), 700), 1)]
+    assert report.sealed == 0
+
+
+def test_full_run_finds_edits_behind_checkpoint(tmp_path):
+    """Правку операции до контрольной точки видит только полная проверка"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 3, 5)
+    assert reconcile(path, workers=0).ok
+
+    def edit_old_description(users):
+        users[email_for(1)]["транзакции"][0]["описание"] = "исправлено"
+
+    edit_snapshot(path, edit_old_description)
+    assert reconcile(path, workers=0, seal=False).ok
+    report = reconcile(path, workers=0, full=True, seal=False)
+    assert list(report.problems) == [email_for(1)]
+    assert "хеш" in report.problems[email_for(1)][0]
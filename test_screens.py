@@ -0,0 +1,79 @@
+import screens
+from screens import ScreenManager
+
+
+class FakeWindow:
+    """Вместо Toplevel: только состояние показа и обработчик крестика"""
+
+    def __init__(self, root):
+        self.shown = True
+        self.close = None
+
+    def title(self, text):
+        pass
+
+    def geometry(self, text):
+        pass
+
+    def configure(self, **options):
+        pass
+
+    def protocol(self, name, callback):
+        self.close = callback
+
+    def deiconify(self):
+        self.shown = True
+
+    def withdraw(self):
+        self.shown = False
+
+    def lift(self):
+        pass
+
+    def grab_set(self):
+        pass
+
+    def grab_release(self):
+        pass
+
+    def state(self):
+        return "normal" if self.shown else "withdrawn"
+
+
+def make_manager(monkeypatch):
+    monkeypatch.setattr(screens.tk, "Toplevel", FakeWindow)
+    manager = ScreenManager({"bg": "white"})
+    calls = []
+
+    def register(name, session):
+        def build(window):
+            calls.append(("build", name))
+            return lambda *args: calls.append(("reset", name, args))
+        manager.register(name, name, "100x100", build, session=session)
+
+    register("transfer", True)
+    register("login", False)
+    return manager, calls
+
+
+def test_window_is_built_once_and_reset_on_each_show(monkeypatch):
+    """Повторный показ не строит окно заново, крестик его только прячет"""
+    manager, calls = make_manager(monkeypatch)
+    first = manager.show("transfer", "a@b.c")
+    first.close()
+    assert not manager.is_shown("transfer")
+    second = manager.show("transfer", "d@e.f")
+    assert second is first and manager.is_shown("transfer")
+    assert calls == [("build", "transfer"), ("reset", "transfer", ("a@b.c",)), ("reset", "transfer", ("d@e.f",))]
+
+
+def test_end_session_clears_only_session_windows(monkeypatch):
+    """При выходе окна сеанса прячутся и очищаются, остальные не трогаются"""
+    manager, calls = make_manager(monkeypatch)
+    manager.show("transfer", "a@b.c")
+    manager.show("login")
+    calls.clear()
+    manager.end_session()
+    assert calls == [("reset", "transfer", ())]
+    assert not manager.is_shown("transfer")
+    assert manager.is_shown("login")
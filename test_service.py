@@ -0,0 +1,96 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from bench import email_for, generate_population
+from client import LedgerClient
+from ledger import LedgerError
+from service import LedgerService, serve
+from storage import make_storage
+
+
+@pytest.fixture
+def running(tmp_path):
+    """Настоящий сервис на Unix-сокете в отдельном потоке: (адрес, путь к users.json)"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 4, 3)
+    socket_path = str(tmp_path / "bank.sock")
+    service = LedgerService(make_storage("journal", path), flush_interval=0.01, kdf_iterations=1000)
+    loop = asyncio.new_event_loop()
+    task = loop.create_task(serve(service, "unix:" + socket_path))
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not os.path.exists(socket_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield "unix:" + socket_path, path
+    loop.call_soon_threadsafe(task.cancel)
+    thread.join(5)
+    loop.close()
+
+
+def login(address, number):
+    client = LedgerClient(address, timeout=5)
+    client.request("login", email=email_for(number), password="bench")
+    return client
+
+
+def test_operations_need_login_and_are_saved(running):
+    """Без входа операции отклоняются; повтор номера операции не проводится"""
+    address, path = running
+    client = LedgerClient(address, timeout=5)
+    with pytest.raises(LedgerError, match="войдите"):
+        client.request("deposit", amount=100)
+    with pytest.raises(LedgerError, match="Неверный пароль"):
+        client.request("login", email=email_for(0), password="wrong")
+    client.request("login", email=email_for(0), password="bench")
+    balance = client.request("account")["balance"]
+
+    first = client.request("deposit", amount=500, op_id="dep-1")
+    again = client.request("deposit", amount=500, op_id="dep-1")
+    assert (first["balance"], first["duplicate"]) == (balance + 500, False)
+    assert (again["balance"], again["duplicate"]) == (balance + 500, True)
+
+    pages = list(client.stream("history", start=0, stop=4, page_size=3))
+    assert [len(page) for page in pages] == [3, 1]
+    assert pages[-1][-1]["сумма"] == 5.0
+    client.close()
+
+    storage = make_storage("journal", path)
+    assert storage.load()[email_for(0)].balance == balance + 500
+    storage.close()
+
+
+def test_pipelined_transfers_keep_total(running):
+    """Встречные переводы двух клиентов без ожидания ответов не теряют денег"""
+    address, _ = running
+    clients = [login(address, 0), login(address, 1)]
+    before = [client.request("account")["balance"] for client in clients]
+    done = threading.Semaphore(0)
+    errors = []
+
+    def reply(result, error):
+        if error is not None:
+            errors.append(error)
+        done.release()
+
+    for i in range(50):
+        clients[0].submit("transfer", reply, recipient=email_for(1), amount=3, op_id=f"a-{i}")
+        clients[1].submit("transfer", reply, recipient=email_for(0), amount=2, op_id=f"b-{i}")
+    for _ in range(100):
+        assert done.acquire(timeout=5)
+    assert errors == []
+    balances = [client.request("account")["balance"] for client in clients]
+    assert balances == [before[0] - 50, before[1] + 50]
+    for client in clients:
+        client.close()
@@ -0,0 +1,100 @@
+import pytest
+
+from bench import email_for, generate_population
+from ledger import Ledger
+from storage import DecisionLog, ShardJournal, make_storage, shard_of
+
+COUNT = 4
+
+
+class Crash(Exception):
+    pass
+
+
+def cross_shard_pair():
+    first = email_for(0)
+    second = next(email_for(i) for i in range(1, 100) if shard_of(email_for(i), COUNT) != shard_of(first, COUNT))
+    return first, second
+
+
+def open_sharded(path):
+    storage = make_storage("sharded", path, shards=COUNT)
+    accounts = storage.load()
+    return storage, accounts
+
+
+def balances(path, emails):
+    storage, accounts = open_sharded(path)
+    storage.close()
+    return [accounts[email].balance for email in emails]
+
+
+def test_cross_shard_transfer_and_reshard(tmp_path):
+    """Перевод между шардами сохраняется в обоих, перешардирование сохраняет аккаунты"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 20, 2)
+    a, b = cross_shard_pair()
+    storage, accounts = open_sharded(path)
+    before = accounts[a].balance, accounts[b].balance
+    record = Ledger(accounts, None).transfer_record(a, b, 700)
+    storage.commit([record])
+    storage.close()
+    assert balances(path, (a, b)) == [before[0] - 700, before[1] + 700]
+
+    storage = make_storage("sharded", path)
+    storage.open()
+    storage.reshard(3)
+    storage.close()
+    storage, accounts = open_sharded(path)
+    assert storage.count == 3
+    assert len(accounts) == 20
+    assert [accounts[a].balance, accounts[b].balance] == [before[0] - 700, before[1] + 700]
+    storage.close()
+
+
+def test_crash_before_decision_aborts_both_sides(tmp_path, monkeypatch):
+    """Сбой после подготовки, до решения: перевод отменяется в обоих шардах"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 20, 2)
+    a, b = cross_shard_pair()
+    storage, accounts = open_sharded(path)
+    before = [accounts[a].balance, accounts[b].balance]
+    record = Ledger(accounts, None).transfer_record(a, b, 700)
+
+    def crash(self, txid):
+        raise Crash()
+
+    monkeypatch.setattr(DecisionLog, "commit", crash)
+    with pytest.raises(Crash):
+        storage.commit([record])
+    storage.close()
+    monkeypatch.undo()
+    assert balances(path, (a, b)) == before
+
+
+def test_crash_after_decision_applies_both_sides(tmp_path, monkeypatch):
+    """Сбой после решения, до маркеров: перевод доводится в обоих шардах"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 20, 2)
+    a, b = cross_shard_pair()
+    storage, accounts = open_sharded(path)
+    before = [accounts[a].balance, accounts[b].balance]
+    record = Ledger(accounts, None).transfer_record(a, b, 700)
+    append = ShardJournal.append
+
+    def crash_on_marker(self, records):
+        if records[0]["op"] == "commit":
+            raise Crash()
+        append(self, records)
+
+    monkeypatch.setattr(ShardJournal, "append", crash_on_marker)
+    with pytest.raises(Crash):
+        storage.commit([record])
+    storage.close()
+    monkeypatch.undo()
+    expected = [before[0] - 700, before[1] + 700]
+    assert balances(path, (a, b)) == expected
+    # Исход записан в шарды, журнал решений больше не нужен
+    with open(path[:-len(".json")] + ".shards.2pc", 'rb') as f:
+        assert f.read() == b""
+    assert balances(path, (a, b)) == expected
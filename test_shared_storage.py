@@ -0,0 +1,62 @@
+import threading
+
+import batch
+from bench import email_for, generate_population
+from ledger import ConflictError, Ledger
+from storage import make_storage
+
+
+def test_batch_holds_shared_lock_until_commit(tmp_path, monkeypatch):
+    """Пока batch.py проверяет пакет, другие рабочие места не могут записать"""
+    path = str(tmp_path / "users.json")
+    generate_population(path, 2, 0)
+    payroll = tmp_path / "payroll.csv"
+    payroll.write_text(f"sender,recipient,amount\n{email_for(0)},{email_for(1)},1\n", encoding="utf-8")
+
+    ui = make_storage("shared", path)
+    accounts = ui.load()
+    foreign = Ledger(accounts, None).withdraw_record(email_for(0), 1)
+    outcome = {}
+
+    def foreign_write():
+        try:
+            ui.commit_checked([foreign], accounts)
+            outcome["result"] = "saved"
+        except ConflictError:
+            outcome["result"] = "conflict"
+
+    plan_batch = batch.plan_batch
+
+    def plan_with_foreign_write(*args):
+        records = plan_batch(*args)
+        writer = threading.Thread(target=foreign_write)
+        writer.start()
+        writer.join(0.2)
+        outcome["blocked"] = writer.is_alive()
+        outcome["writer"] = writer
+        return records
+
+    monkeypatch.setattr(batch, "plan_batch", plan_with_foreign_write)
+    report_path = tmp_path / "report.json"
+    assert batch.main([str(payroll), "--users", path, "--storage", "shared", "--report", str(report_path)]) == 0
+    outcome["writer"].join()
+
+    assert outcome["blocked"]
+    # Рабочее место видит запись пакета и проверяет свою операцию заново
+    assert outcome["result"] == "conflict"
+    ui.close()
+
+
+def test_load_and_commit_inside_locked(tmp_path):
+    path = str(tmp_path / "users.json")
+    generate_population(path, 2, 0)
+    storage = make_storage("shared", path)
+    with storage.locked():
+        accounts = storage.load()
+        balance = accounts[email_for(0)].balance
+        storage.commit([Ledger(accounts, None).deposit_record(email_for(0), 5)])
+    storage.close()
+
+    storage = make_storage("shared", path)
+    assert storage.load()[email_for(0)].balance == balance + 5
+    storage.close()
@@ -0,0 +1,98 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from bench import email_for, generate_population
+from ledger import Ledger
+from sqlite_storage import SqliteStorage, migrate_users
+from storage import JournalStorage, read_legacy
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_migrate_cli(tmp_path):
+    """python sqlite_storage.py users.json users.db переносит снимок вместе с журналом"""
+    source = str(tmp_path / "users.json")
+    target = str(tmp_path / "users.db")
+    generate_population(source, 5, 3)
+    journal = JournalStorage(source)
+    journal.load()
+    journal.commit([{"op": "update", "email": email_for(1), "fields": {"имя": "Журнал"}}])
+    journal.close()
+
+    result = subprocess.run(
+        [sys.executable, os.path.join(HERE, "sqlite_storage.py"), source, target],
+        capture_output=True, text=True, cwd=str(tmp_path)
+    )
+    assert result.returncode == 0, result.stderr
+    assert "Перенесено аккаунтов: 5" in result.stdout
+
+    with open(source, 'r') as f:
+        snapshot = json.load(f)
+    storage = SqliteStorage(target)
+    accounts = storage.load()
+    try:
+        for i in range(5):
+            account = accounts[email_for(i)]
+            user = snapshot[email_for(i)]
+            assert len(account.history) == len(user["транзакции"])
+            assert account.to_json()["баланс"] == user["баланс"]
+        assert accounts[email_for(1)].name == "Журнал"
+    finally:
+        storage.close()
+
+
+def open_sqlite(tmp_path, count, depth):
+    source = str(tmp_path / "users.json")
+    generate_population(source, count, depth)
+    target = str(tmp_path / "users.db")
+    migrate_users(read_legacy(source), target)
+    storage = SqliteStorage(target)
+    return storage, storage.load(), read_legacy(source)
+
+
+def test_history_reads_database_and_session_tail(tmp_path):
+    """Срезы истории склеивают строки из базы и операции этого сеанса"""
+    storage, accounts, users = open_sqlite(tmp_path, 2, 30)
+    email = email_for(0)
+    ledger = Ledger(accounts, storage.commit)
+    try:
+        ledger.deposit(email, 700)
+        history = accounts[email].history
+        assert len(history) == 31
+        assert history[0:30] == users[email]["транзакции"]
+        assert history[29:31] == [users[email]["транзакции"][29], history[-1]]
+        assert history[-1]["сумма"] == 7.0
+        assert list(reversed(history))[1:] == users[email]["транзакции"][::-1]
+    finally:
+        storage.close()
+
+    storage = SqliteStorage(str(tmp_path / "users.db"))
+    try:
+        account = storage.load()[email]
+        assert len(account.history) == 31
+        assert account.history[-1]["сумма"] == 7.0
+    finally:
+        storage.close()
+
+
+def test_failed_group_is_rolled_back(tmp_path):
+    """Группа записей сохраняется одной транзакцией: ошибка откатывает всю группу"""
+    storage, accounts, _ = open_sqlite(tmp_path, 2, 0)
+    a, b = email_for(0), email_for(1)
+    before = accounts[a].balance, accounts[b].balance
+    record = Ledger(accounts, None).transfer_record(a, b, 500)
+    with pytest.raises(ValueError):
+        storage.commit([record, {"op": "unknown"}])
+    storage.close()
+
+    storage = SqliteStorage(str(tmp_path / "users.db"))
+    try:
+        accounts = storage.load()
+        assert (accounts[a].balance, accounts[b].balance) == before
+        assert len(accounts[a].history) == 0
+    finally:
+        storage.close()
@@ -0,0 +1,56 @@
+from accounts import History, Turnover, TxType, make_transaction, post_json, to_kopecks
+
+
+class NoScanList(list):
+    """Список операций, который нельзя просматривать: проводка должна обходиться без этого"""
+
+    def __iter__(self):
+        raise AssertionError("история просматривается")
+
+    def __getitem__(self, index):
+        raise AssertionError("история просматривается")
+
+
+def transactions(count):
+    result = []
+    for i in range(count):
+        date = f"2024-{1 + i % 3:02d}-{1 + i % 28:02d} 10:00:00"
+        if i % 3:
+            result.append(make_transaction(TxType.DEPOSIT, 1000 + i, date=date))
+        else:
+            result.append(make_transaction(TxType.WITHDRAW, -(100 + i), date=date))
+    return result
+
+
+def expected(user):
+    history = History.from_json(user["транзакции"])
+    return Turnover.build(history, to_kopecks(user["баланс"])).to_json()
+
+
+def test_post_json_keeps_turnover_in_step_with_history():
+    user = {"баланс": 1000.0, "транзакции": []}
+    for tx in transactions(50):
+        post_json(user, tx)
+    assert user["обороты"] == expected(user)
+
+
+def test_post_json_does_not_rescan_history():
+    user = {"баланс": 1000.0, "транзакции": []}
+    for tx in transactions(20):
+        post_json(user, tx)
+    user["транзакции"] = NoScanList(user["транзакции"])
+    post_json(user, make_transaction(TxType.DEPOSIT, 500, date="2024-03-05 12:00:00"))
+    assert user["обороты"]["операций"] == 21
+
+
+def test_post_json_catches_up_stale_turnover():
+    user = {"баланс": 1000.0, "транзакции": []}
+    txs = transactions(30)
+    for tx in txs[:10]:
+        post_json(user, tx)
+    # Операции, записанные без оборотов (старая версия приложения)
+    for tx in txs[10:29]:
+        user["транзакции"].append(tx)
+        user["баланс"] += tx["сумма"]
+    post_json(user, txs[29])
+    assert user["обороты"] == expected(user)